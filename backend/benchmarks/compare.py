@@ -0,0 +1,56 @@
+"""
+Diff two benchmarks.funnel result files:
+
+    python -m benchmarks.compare before.json after.json
+
+Prints throughput, p95/p99 latency and median query count per step, with
+the relative change; exits 1 if any step got slower than --threshold (p95)
+or issues more queries.
+"""
+import argparse
+import json
+import sys
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return f'{(after - before) / before * 100:+.0f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=20.0, help="Allowed p95 slowdown in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as fh:
+        before = json.load(fh)
+    with open(args.after) as fh:
+        after = json.load(fh)
+
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"{'step':<10} {'req/s':>18} {'p95 ms':>22} {'p99 ms':>22} {'queries':>12}")
+    regressions = []
+    for step, new in after['steps'].items():
+        old = before['steps'].get(step)
+        if old is None:
+            continue
+        print(f"{step:<10} "
+              f"{old['rps']:>7} {new['rps']:>7} {change(old['rps'], new['rps']):>4} "
+              f"{old['p95_ms']:>8} {new['p95_ms']:>8} {change(old['p95_ms'], new['p95_ms']):>5} "
+              f"{old['p99_ms']:>8} {new['p99_ms']:>8} {change(old['p99_ms'], new['p99_ms']):>5} "
+              f"{old['queries']['p50']:>5} {new['queries']['p50']:>5}")
+        if old['p95_ms'] and (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > args.threshold:
+            regressions.append(f"{step}: p95 {old['p95_ms']} -> {new['p95_ms']} ms")
+        if new['queries']['p50'] > old['queries']['p50']:
+            regressions.append(f"{step}: queries {old['queries']['p50']} -> {new['queries']['p50']}")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
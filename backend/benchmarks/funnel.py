@@ -0,0 +1,286 @@
+"""
+Benchmark the booking funnel end to end.
+
+Each virtual user (a thread with its own test Client, so requests run
+in-process through the full middleware and view stack) repeats:
+
+    login -> show listing -> seat map -> hold -> book -> pay -> dashboard
+
+and every step's latency and query count is recorded. "pay" is the fake
+gateway's callback (see payments.gateways); the payments worker runs in
+process and settles the bookings alongside. Example:
+
+    python -m benchmarks.funnel --database /tmp/bench.sqlite3 --seed --scale medium \\
+        --concurrency 16 --iterations 25 --output funnel.json
+
+--database points Django at a separate SQLite file (SQLITE_PATH); for
+MySQL set USE_MYSQL=1 and the MYSQL_* variables instead and leave it out.
+--seed migrates and fills the database with the generate_dataset preset
+named by --scale the first time (see bookings.dataset). Compare two result
+files with ``python -m benchmarks.compare``.
+
+Request throttling (bookmyshowcase.throttling) is off unless
+THROTTLE_ENABLED=1 is set.
+
+A funnel that cannot finish (an unexpected status, an exception from the
+request such as a database lock error, no shows in the listing, a sold out
+show) counts as an error of the step it stopped at, and the report lists
+why funnels were aborted.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+
+from .stats import percentile, summarize
+
+STEPS = ('login', 'listing', 'seat_map', 'hold', 'book', 'pay', 'dashboard')
+
+
+class StepFailed(Exception):
+    def __init__(self, step, reason):
+        super().__init__(f"{step}: {reason}")
+        self.step = step
+        self.reason = reason
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {step: [] for step in STEPS}
+        self.queries = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.completed = 0
+        # "step: reason" -> funnels aborted there
+        self.aborted = Counter()
+
+    def merge(self, other):
+        for step in STEPS:
+            self.latencies[step].extend(other.latencies[step])
+            self.queries[step].extend(other.queries[step])
+            self.errors[step] += other.errors[step]
+        self.completed += other.completed
+        self.aborted.update(other.aborted)
+
+
+class VirtualUser:
+    def __init__(self, username, password, cities, day, seats_per_booking, rng):
+        from django.test import Client
+        self.client = Client()
+        self.username = username
+        self.password = password
+        self.cities = cities
+        self.day = day
+        self.seats_per_booking = seats_per_booking
+        self.rng = rng
+        self.headers = {}
+        self.recorder = Recorder()
+
+    def call(self, step, method, path, data=None, ok=(200,), body=None, headers=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        if data is not None:
+            body = json.dumps(data)
+        kwargs = {'content_type': 'application/json', 'data': body} if body is not None else {}
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(self.client, method)(path, **kwargs, **(headers or self.headers))
+                elapsed = time.perf_counter() - started
+        except Exception as exc:
+            # The test Client re-raises what the view raised, e.g. "database is locked"
+            raise StepFailed(step, type(exc).__name__) from exc
+        if response.status_code not in ok:
+            raise StepFailed(step, f"HTTP {response.status_code}")
+        self.recorder.latencies[step].append(elapsed)
+        self.recorder.queries[step].append(len(queries))
+        return response.json()
+
+    def funnel(self):
+        from payments.gateways import get_gateway
+        self.headers = {}
+        tokens = self.call('login', 'post', '/api/users/login/', {'username': self.username, 'password': self.password})
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {tokens['access']}"}
+
+        listing = self.call('listing', 'get', f'/api/shows/showtimes/?city={self.rng.choice(self.cities)}&date={self.day}')
+        shows = [
+            showtime['show']
+            for movie in listing['movies'] for theatre in movie['theatres'] for showtime in theatre['showtimes']
+        ]
+        if not shows:
+            raise StepFailed('listing', "no shows")
+        show = self.rng.choice(shows)
+
+        seat_map = self.call('seat_map', 'get', f'/api/shows/{show}/availability/?include=ids')
+        free = [seat_id for seat_id, code in zip(seat_map['show_seat_ids'], seat_map['status']) if code == '0']
+        if len(free) < self.seats_per_booking:
+            raise StepFailed('seat_map', "sold out")
+        # Adjacent seats, as people book them
+        first = self.rng.randrange(len(free) - self.seats_per_booking + 1)
+        seat_ids = free[first:first + self.seats_per_booking]
+
+        hold = self.call('hold', 'post', f'/api/shows/{show}/hold/', {'seat_ids': seat_ids}, ok=(201,))
+        booking = self.call('book', 'post', '/api/bookings/checkout/',
+                            {'show': show, 'seat_ids': seat_ids, 'hold_token': hold['hold_token']}, ok=(201,))
+        try:
+            body, headers = get_gateway().pay(booking['payment']['reference'])
+        except Exception as exc:
+            raise StepFailed('pay', type(exc).__name__) from exc
+        self.call('pay', 'post', '/api/payments/callback/', body=body, headers={'HTTP_X_SIGNATURE': headers['X-Signature']},
+                  ok=(202,))
+        self.call('dashboard', 'get', '/api/dashboard/stats/')
+        self.recorder.completed += 1
+
+    def run(self, iterations, start):
+        from django.db import connection
+        start.wait()
+        try:
+            for _ in range(iterations):
+                try:
+                    self.funnel()
+                except StepFailed as exc:
+                    self.recorder.errors[exc.step] += 1
+                    self.recorder.aborted[str(exc)] += 1
+                except Exception as exc:
+                    # A bug in the funnel itself; still an aborted funnel, not a dead thread
+                    self.recorder.aborted[f"funnel: {type(exc).__name__}"] += 1
+        finally:
+            connection.close()
+
+
+def query_stats(counts):
+    ordered = sorted(counts)
+    return {
+        'mean': round(sum(ordered) / len(ordered), 2) if ordered else 0,
+        'p50': percentile(ordered, 0.5),
+        'max': ordered[-1] if ordered else 0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_counts():
+    from bookings.models import Booking
+    from seats.models import ShowSeat
+    from shows.models import Show
+    from users.models import CustomUser
+    return {
+        'users': CustomUser.objects.count(),
+        'shows': Show.objects.count(),
+        'show_seats': ShowSeat.objects.count(),
+        'bookings': Booking.objects.count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help="SQLite file to benchmark against (created if missing)")
+    parser.add_argument('--seed', action='store_true', help="Migrate and seed the benchmark dataset if it is missing")
+    parser.add_argument('--scale', default='small', help="bookings.dataset preset: small, medium, large or xlarge")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10, help="Funnels per virtual user")
+    parser.add_argument('--seats-per-booking', type=int, default=2)
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.database:
+        os.environ['SQLITE_PATH'] = os.path.abspath(args.database)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyshowcase.settings')
+    # Virtual users share one IP and log in far faster than the auth throttles allow
+    os.environ.setdefault('THROTTLE_ENABLED', '0')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from bookings import dataset
+    from payments import jobs
+
+    if args.scale not in dataset.PRESETS:
+        parser.error(f"Unknown --scale {args.scale!r}")
+    preset = dataset.PRESETS[args.scale]
+    if args.seed:
+        call_command('migrate', verbosity=0)
+        try:
+            dataset.generate(**preset, log=print)
+        except dataset.DatasetExists as exc:
+            print(f"{exc}, not seeding")
+    usernames = [dataset.user_name(n) for n in range(preset['users'])]
+    cities = dataset.CITIES[:preset['cities']]
+    counts = dataset_counts()
+    connection.close()
+
+    rng = random.Random(args.random_seed)
+    start = threading.Barrier(args.concurrency)
+    users = [
+        VirtualUser(usernames[n % len(usernames)], dataset.PASSWORD, cities, date.today(), args.seats_per_booking,
+                    random.Random(rng.random()))
+        for n in range(args.concurrency)
+    ]
+    # Settles the payments alongside, as the web process would
+    jobs.start_in_process()
+    threads = [threading.Thread(target=user.run, args=(args.iterations, start)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    recorder = Recorder()
+    for user in users:
+        recorder.merge(user.recorder)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'scale': args.scale,
+            'dataset': counts,
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'seats_per_booking': args.seats_per_booking,
+        },
+        'funnel': {
+            'attempted': args.concurrency * args.iterations,
+            'completed': recorder.completed,
+            'aborted': dict(recorder.aborted.most_common()),
+            'elapsed_s': round(elapsed, 3),
+            'per_second': round(recorder.completed / elapsed, 2) if elapsed else 0.0,
+        },
+        'steps': {
+            step: {
+                **summarize(recorder.latencies[step], elapsed, recorder.errors[step]),
+                'queries': query_stats(recorder.queries[step]),
+            }
+            for step in STEPS
+        },
+    }
+
+    print(f"{'step':<10} {'ok':>6} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for step, row in results['steps'].items():
+        print(f"{step:<10} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8} {row['p50_ms']:>8} "
+              f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['queries']['p50']:>8}")
+    funnel = results['funnel']
+    print(f"{funnel['completed']}/{funnel['attempted']} funnels in {funnel['elapsed_s']}s ({funnel['per_second']}/s)")
+    for reason, count in funnel['aborted'].items():
+        print(f"  aborted {count:>5}  {reason}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Compare requests/sec and latency of running servers.
+
+Start the same code twice, e.g.
+
+    gunicorn -c gunicorn_config.py --bind 127.0.0.1:8000
+    GUNICORN_ASGI=1 gunicorn -c gunicorn_config.py --bind 127.0.0.1:8001
+
+then
+
+    python -m benchmarks.http_bench \\
+        sync=http://127.0.0.1:8000/api/movies/ \\
+        async=http://127.0.0.1:8001/api/async/movies/ \\
+        --concurrency 64 --duration 30 --output asgi_vs_wsgi.json
+
+Each target is hammered by --concurrency threads with keep-alive
+connections for --duration seconds (after a short warm-up).
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .stats import summarize
+
+
+def run_target(url, concurrency, duration, warmup):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    def worker():
+        connection = connection_class(parts.netloc, timeout=30)
+        local, failed = [], 0
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                break
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = connection_class(parts.netloc, timeout=30)
+                ok = False
+            if started >= measure_from:
+                if ok:
+                    local.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, duration, errors[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('targets', nargs='+', help="name=url pairs")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for target in args.targets:
+        name, _, url = target.partition('=')
+        if not url:
+            parser.error(f"Expected name=url, got {target!r}")
+        results[name] = {'url': url, **run_target(url, args.concurrency, args.duration, args.warmup)}
+        row = results[name]
+        print(f"{name:>10}  {row['rps']:>9} req/s  p50 {row['p50_ms']:>8} ms  "
+              f"p99 {row['p99_ms']:>8} ms  errors {row['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'concurrency': args.concurrency, 'duration_s': args.duration, 'results': results}, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Benchmark repricing a city's evening shows (seats.pricing.reprice).
+
+Three passes over the same shows:
+
+    reprice    every show repriced (force=True): one UPDATE per seat type
+               and price group
+    unchanged  reprice() again; nothing changed, so every show is skipped
+    baseline   (--baseline) the per-row way: load every AVAILABLE ShowSeat,
+               compute its price in Python and bulk_update() it
+
+Example:
+
+    python -m benchmarks.pricing --database /tmp/bench.sqlite3 --seed --scale medium \\
+        --city Mumbai --after 17:00 --baseline --output pricing.json
+
+--database, --seed and --scale work as in benchmarks.funnel.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from .funnel import dataset_counts, git_commit
+
+
+def timed(run):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+    return result, elapsed, len(queries)
+
+
+def per_row(shows):
+    """Reprice seat by seat, for comparison."""
+    from django.db import transaction
+    from seats.models import ShowSeat
+    from seats.pricing import Rules, booked_shares
+    rules = Rules.from_settings()
+    rows = list(shows.values_list('id', 'price', 'date', 'time'))
+    shares = booked_shares([row[0] for row in rows])
+    keys = {show_id: rules.key(price, day, start, shares.get(show_id, 0.0)) for show_id, price, day, start in rows}
+    seats = list(ShowSeat.objects.filter(show_id__in=keys, status='AVAILABLE').select_related('seat').only('price', 'show_id', 'seat__seat_type'))
+    for show_seat in seats:
+        show_seat.price = rules.price(keys[show_seat.show_id], show_seat.seat.seat_type)
+    with transaction.atomic():
+        ShowSeat.objects.bulk_update(seats, ['price'], batch_size=1000)
+    return {'shows': len(rows), 'repriced': len(rows), 'seats': len(seats)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help="SQLite file to benchmark against (created if missing)")
+    parser.add_argument('--seed', action='store_true', help="Migrate and seed the benchmark dataset if it is missing")
+    parser.add_argument('--scale', default='small', help="bookings.dataset preset: small, medium, large or xlarge")
+    parser.add_argument('--city', help="City to reprice (default: the first one in the dataset)")
+    parser.add_argument('--after', default='17:00', help="Evening shows start at or after this time")
+    parser.add_argument('--baseline', action='store_true', help="Also time the per-row bulk_update way")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.database:
+        os.environ['SQLITE_PATH'] = os.path.abspath(args.database)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyshowcase.settings')
+    import django
+    django.setup()
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.db import connection
+    from bookings import dataset
+    from seats.pricing import reprice
+    from shows.models import Show
+
+    if args.scale not in dataset.PRESETS:
+        parser.error(f"Unknown --scale {args.scale!r}")
+    if args.seed:
+        call_command('migrate', verbosity=0)
+        try:
+            dataset.generate(**dataset.PRESETS[args.scale], log=print)
+        except dataset.DatasetExists as exc:
+            print(f"{exc}, not seeding")
+    city = args.city or dataset.CITIES[0]
+    shows = Show.objects.filter(screen__theatre__city=city, time__gte=args.after)
+    cache.clear()
+
+    passes = {
+        'reprice': lambda: reprice(shows, force=True),
+        'unchanged': lambda: reprice(shows),
+    }
+    if args.baseline:
+        passes['baseline'] = lambda: per_row(shows)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'scale': args.scale,
+            'dataset': dataset_counts(),
+            'city': city,
+            'after': args.after,
+        },
+        'passes': {},
+    }
+    print(f"{'pass':<10} {'shows':>7} {'repriced':>9} {'seats':>9} {'queries':>8} {'seconds':>8} {'seats/s':>10}")
+    for name, run in passes.items():
+        result, elapsed, queries = timed(run)
+        row = {**result, 'queries': queries, 'elapsed_s': round(elapsed, 3),
+               'seats_per_second': round(result['seats'] / elapsed) if elapsed else 0}
+        results['passes'][name] = row
+        print(f"{name:<10} {row['shows']:>7} {row['repriced']:>9} {row['seats']:>9} {queries:>8} "
+              f"{row['elapsed_s']:>8} {row['seats_per_second']:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
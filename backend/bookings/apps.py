@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class BookingsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'bookings'
+
+    def ready(self):
+        from bookmyshowcase import metrics
+        from . import signals, sweeper  # noqa: F401
+
+        metrics.collectors.append(sweeper.collect)
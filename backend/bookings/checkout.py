@@ -0,0 +1,88 @@
+"""
+One-round-trip checkout: seats -> BOOKED and a Booking, atomically.
+
+The seats are claimed with the same conditional UPDATE as seat holds (see
+seats.holds), extended to accept seats held under the buyer's own hold
+token. The query count is fixed whatever the number of seats: one UPDATE,
+one SELECT of the seats' prices and types with the show's movie, theatre
+and city, the Booking INSERT (plus its rollup signal), the Payment INSERT
+and one bulk INSERT of the seat through-rows. Offers are evaluated from
+the in-process index (see offers.evaluator); only a limited offer costs one
+more UPDATE to count its redemption.
+
+The booking stays PENDING, its seats BOOKED, until the payment is settled
+(see payments.jobs); the gateway is not called from here. A booking with
+nothing to pay is CONFIRMED at once.
+"""
+import secrets
+
+from django.db import transaction
+from django.utils import timezone
+
+from offers import evaluator
+from payments.gateways import get_gateway
+from payments.models import Payment
+from seats import availability
+from seats.holds import SeatUnavailable, active_hold, claimable
+from seats.models import ShowSeat
+from .models import Booking
+
+
+def cart(seats):
+    """(show, seats) of a ShowSeat queryset, as offers.evaluator.evaluate() takes them."""
+    rows = list(seats.values_list(
+        'price', 'seat__seat_type',
+        'show__movie_id', 'show__screen__theatre_id', 'show__screen__theatre__city', 'show__date',
+    ))
+    show = rows[0][2:] if rows else None
+    return show, [row[:2] for row in rows]
+
+
+def checkout(user, show_id, seat_ids, hold_token=None, promo_code=None):
+    """
+    Book ``seat_ids`` of ``show_id`` for ``user`` and return the Booking,
+    with the best offer applied. Its Payment, None if there is nothing to
+    pay, is in ``booking.payment``.
+
+    Raises SeatUnavailable (and changes nothing) unless every seat is free,
+    or held by ``user`` under ``hold_token``, and OfferError if ``promo_code`` does not
+    apply.
+    """
+    ids = {int(seat_id) for seat_id in seat_ids}
+    if not ids:
+        raise ValueError("At least one seat is required")
+    now = timezone.now()
+    bookable = claimable(now)
+    if hold_token:
+        bookable |= active_hold(hold_token, user, now)
+
+    try:
+        with transaction.atomic():
+            seats = ShowSeat.objects.filter(show_id=show_id, id__in=ids)
+            booked = seats.filter(bookable).update(status='BOOKED', hold_token=None, held_by=None, locked_until=None)
+            if booked != len(ids):
+                raise SeatUnavailable(())
+
+            show, priced = cart(seats)
+            quote, exhausted = evaluator.evaluate(user, show, priced, promo_code), set()
+            # A limited offer may have run out since the index was built
+            while quote.offer is not None and not evaluator.redeem(quote.offer):
+                evaluator.invalidate()
+                exhausted.add(quote.offer.id)
+                quote = evaluator.evaluate(user, show, priced, promo_code, exclude=exhausted)
+            booking = Booking.objects.create(
+                user=user, show_id=show_id, total_amount=quote.total, status='PENDING' if quote.total else 'CONFIRMED',
+                offer_id=quote.offer and quote.offer.id, discount_amount=quote.discount,
+            )
+            booking.payment = None
+            if quote.total:
+                booking.payment = Payment.objects.create(
+                    booking=booking, gateway=get_gateway().name, reference=secrets.token_hex(16), amount=quote.total,
+                )
+            Through = Booking.seats.through
+            Through.objects.bulk_create([Through(booking_id=booking.id, showseat_id=seat_id) for seat_id in ids])
+            availability.seat_status_changed(show_id, ids, 'BOOKED')
+    except SeatUnavailable:
+        free = ShowSeat.objects.filter(bookable, show_id=show_id, id__in=ids).values_list('id', flat=True)
+        raise SeatUnavailable(ids - set(free))
+    return booking
@@ -0,0 +1,243 @@
+"""
+Deterministic synthetic data at capacity-planning volumes.
+
+generate() builds cities -> theatres -> screens (with seat layouts) -> shows
+-> ShowSeats -> bookings with batched inserts. The same
+arguments and ``seed`` always produce the same rows, so benchmark runs
+compare between commits and tests can build realistic fixtures.
+
+Every show gets a ShowSeat per seat of its screen. About ``fill_rate`` of
+them are booked in groups of 1-6 adjacent seats, one Booking per group.
+Some of those bookings are CANCELLED, and their seats stay AVAILABLE.
+These three tables hold nearly all the rows, so they are written with
+executemany() on plain tuples, and their ids are assigned here rather than
+by the database. The generator therefore expects nobody else to be writing
+to those tables while it runs. The revenue rollup is rebuilt at the end.
+
+Use it through ``manage.py generate_dataset``; see PRESETS for sizes.
+"""
+import random
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from movies.models import Movie
+from seats import layouts as seat_layouts
+from seats.pricing import Rules
+from seats.models import Seat, ShowSeat
+from shows.models import Show
+from theatres.models import Screen, Theatre
+from users.models import CustomUser
+from . import rollup
+from .models import Booking
+
+OWNER = 'dataset_owner'
+PASSWORD = 'dataset-password'
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Ahmedabad', 'Jaipur', 'Lucknow',
+          'Surat', 'Indore', 'Nagpur', 'Bhopal', 'Patna', 'Kochi', 'Chandigarh', 'Goa', 'Mysuru', 'Vizag']
+LANGUAGES = ['Hindi', 'English', 'Tamil', 'Telugu', 'Malayalam']
+GENRES = ['Action', 'Drama', 'Comedy', 'Thriller', 'Romance', 'Horror']
+SHOW_TIMES = [time(9, 30), time(12, 45), time(16, 0), time(19, 15), time(22, 30), time(23, 45)]
+PRICES = [180, 220, 250, 300, 350]
+CANCELLED_SHARE = 0.05
+
+PRESETS = {
+    # ~100 shows, ~19k ShowSeats
+    'small': dict(cities=2, theatres_per_city=2, screens_per_theatre=2, days=3, shows_per_day=4, movies=8, users=50),
+    # ~1.7k shows, ~340k ShowSeats
+    'medium': dict(cities=5, theatres_per_city=4, screens_per_theatre=3, days=7, shows_per_day=4, movies=20, users=200),
+    # ~8.4k shows, ~1.7M ShowSeats
+    'large': dict(cities=10, theatres_per_city=5, screens_per_theatre=4, days=7, shows_per_day=6, movies=40,
+                  users=1000),
+    # ~50k shows, ~10M ShowSeats
+    'xlarge': dict(cities=20, theatres_per_city=6, screens_per_theatre=5, days=14, shows_per_day=6, movies=80,
+                   users=10000, layouts=((10, 20), (12, 20), (14, 20))),
+}
+
+
+class DatasetExists(Exception):
+    pass
+
+
+def user_name(n):
+    return f'dataset_user_{n}'
+
+
+def parse_layouts(value):
+    """'10x20,12x24' -> ((10, 20), (12, 24)): rows x seats per row."""
+    layouts = []
+    for part in value.split(','):
+        rows, _, seats = part.strip().lower().partition('x')
+        layouts.append((int(rows), int(seats)))
+    return tuple(layouts)
+
+
+def _seat_types(rows):
+    # Front 60% of the rows SILVER, then 20% GOLD, the back rows PLATINUM
+    silver, gold = rows * 3 // 5, rows // 5
+    return ['SILVER'] * silver + ['GOLD'] * gold + ['PLATINUM'] * (rows - silver - gold)
+
+
+def _template(rows, seats_per_row):
+    """A seats.layouts template: rows A, B, ... with a centre aisle."""
+    half = seats_per_row // 2
+    return {'rows': [
+        {'row': chr(ord('A') + row), 'type': seat_type, 'seats': [[1, half], [half + 3, seats_per_row + 2]]}
+        for row, seat_type in enumerate(_seat_types(rows))
+    ]}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert(model, field_names, rows, batch_size):
+    """
+    Plain executemany() INSERT of ``rows`` (values already adapted for the
+    database). Building millions of model instances and compiling them
+    through bulk_create() costs several times more than writing them.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in field_names)
+    sql = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({', '.join(['%s'] * len(field_names))})"
+    with connection.cursor() as cursor:
+        for batch in _chunks(rows, batch_size):
+            cursor.executemany(sql, batch)
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+def generate(cities, theatres_per_city, screens_per_theatre, days, shows_per_day, movies, users,
+             layouts=((10, 20),), fill_rate=0.3, seed=42, start=None, chunk_size=100, batch_size=5000, log=None):
+    """Create the dataset and return the number of rows written per model."""
+    log = log or (lambda message: None)
+    if CustomUser.objects.filter(username=OWNER).exists():
+        raise DatasetExists(f"A generated dataset is already present (user {OWNER!r})")
+    rng = random.Random(seed)
+    start = start or date.today()
+    password = make_password(PASSWORD)
+    counts = {}
+
+    # Re-read what bulk_create wrote: MySQL does not return new ids
+    with transaction.atomic():
+        owner = CustomUser.objects.create(username=OWNER, email=f'{OWNER}@example.com', password=password,
+                                          is_theatre_owner=True)
+        CustomUser.objects.bulk_create([
+            CustomUser(username=user_name(n), email=f'{user_name(n)}@example.com', password=password)
+            for n in range(users)
+        ], batch_size=batch_size)
+        user_ids = list(
+            CustomUser.objects.filter(username__startswith='dataset_user_').order_by('id').values_list('id', flat=True)
+        )
+
+        Movie.objects.bulk_create([
+            Movie(
+                title=f'Generated Movie {n}', description='', duration_minutes=rng.randint(90, 180),
+                language=rng.choice(LANGUAGES), genre=rng.choice(GENRES), release_date=start - timedelta(days=n),
+                rating=round(rng.uniform(5, 9.5), 1),
+            )
+            for n in range(movies)
+        ])
+        movie_ids = list(
+            Movie.objects.filter(title__startswith='Generated Movie ').order_by('id').values_list('id', flat=True)
+        )
+
+        Theatre.objects.bulk_create([
+            Theatre(name=f'{city} Multiplex {n}', address=f'{n} Main Road', city=city, owner=owner)
+            for city in CITIES[:cities] for n in range(theatres_per_city)
+        ])
+        theatre_ids = list(Theatre.objects.filter(owner=owner).order_by('id').values_list('id', flat=True))
+
+        screen_layouts = [layouts[n % len(layouts)] for n in range(len(theatre_ids) * screens_per_theatre)]
+        templates = {shape: _template(*shape) for shape in set(screen_layouts)}
+        Screen.objects.bulk_create([
+            Screen(name=f'Screen {n % screens_per_theatre + 1}', theatre_id=theatre_ids[n // screens_per_theatre],
+                   capacity=rows * seats_per_row, layout=templates[rows, seats_per_row])
+            for n, (rows, seats_per_row) in enumerate(screen_layouts)
+        ])
+        screen_ids = list(Screen.objects.filter(theatre__owner=owner).order_by('id').values_list('id', flat=True))
+
+        Seat.objects.bulk_create([
+            Seat(screen_id=screen_id, row_number=row, seat_number=str(number), seat_type=seat_type, ordinal=ordinal)
+            for screen_id, shape in zip(screen_ids, screen_layouts)
+            for ordinal, (row, number, seat_type) in enumerate(seat_layouts.expand(templates[shape]))
+        ], batch_size=batch_size)
+        seats_by_screen = defaultdict(list)
+        for seat_id, screen_id, seat_type in (
+            Seat.objects.filter(screen_id__in=screen_ids).order_by('ordinal').values_list('id', 'screen_id', 'seat_type')
+        ):
+            seats_by_screen[screen_id].append((seat_id, seat_type))
+
+        # bulk_create skips the signal that materialises ShowSeats, they are made below
+        Show.objects.bulk_create([
+            Show(movie_id=rng.choice(movie_ids), screen_id=screen_id, date=start + timedelta(days=day),
+                 time=show_time, price=rng.choice(PRICES))
+            for screen_id in screen_ids for day in range(days) for show_time in SHOW_TIMES[:shows_per_day]
+        ], batch_size=batch_size)
+        shows = list(
+            Show.objects.filter(screen_id__in=screen_ids).order_by('id').values_list('id', 'screen_id', 'price', 'date', 'time')
+        )
+    counts.update(users=len(user_ids) + 1, movies=len(movie_ids), theatres=len(theatre_ids),
+                  screens=len(screen_ids), shows=len(shows))
+    log(f"Created {len(shows)} shows on {len(screen_ids)} screens in {len(theatre_ids)} theatres")
+
+    rules = Rules.from_settings()
+    today = timezone.localdate()
+    ops = connection.ops
+    no_discount = ops.adapt_decimalfield_value(Decimal('0'), 8, 2)
+    show_seat_id, booking_id = _next_id(ShowSeat), _next_id(Booking)
+    counts.update(show_seats=0, bookings=0)
+    for chunk in _chunks(shows, chunk_size):
+        show_seats, bookings, through = [], [], []
+        for show_id, screen_id, price, show_date, show_time in chunk:
+            key = rules.key(price, show_date, show_time)
+            seats = seats_by_screen[screen_id]
+            # Shows differ: some sell out, some stay nearly empty
+            fill = min(1.0, max(0.0, rng.gauss(fill_rate, fill_rate / 2)))
+            first = len(show_seats)
+            for ordinal, (seat_id, seat_type) in enumerate(seats):
+                show_seats.append([show_seat_id, show_id, seat_id, 'AVAILABLE', rules.price(key, seat_type), ordinal])
+                show_seat_id += 1
+
+            position = 0
+            while position < len(seats):
+                group = show_seats[first + position:first + position + rng.randint(1, 6)]
+                position += len(group)
+                if rng.random() >= fill:
+                    continue
+                cancelled = rng.random() < CANCELLED_SHARE
+                total = Decimal('0')
+                for row in group:
+                    total += row[4]
+                    if not cancelled:
+                        row[3] = 'BOOKED'
+                    through.append((booking_id, row[0]))
+                booked_on = min(today, show_date - timedelta(days=rng.randint(0, 6)))
+                bookings.append((
+                    booking_id, rng.choice(user_ids), show_id, ops.adapt_decimalfield_value(total, 8, 2),
+                    ops.adapt_datetimefield_value(timezone.make_aware(datetime.combine(booked_on, time(12)))),
+                    'CANCELLED' if cancelled else 'CONFIRMED', no_discount,
+                ))
+                booking_id += 1
+        for row in show_seats:
+            row[4] = ops.adapt_decimalfield_value(row[4], 6, 2)
+
+        with transaction.atomic():
+            _insert(ShowSeat, ['id', 'show', 'seat', 'status', 'price', 'ordinal'], show_seats, batch_size)
+            _insert(Booking, ['id', 'user', 'show', 'total_amount', 'booking_date', 'status', 'discount_amount'], bookings, batch_size)
+            _insert(Booking.seats.through, ['booking', 'showseat'], through, batch_size)
+        counts['show_seats'] += len(show_seats)
+        counts['bookings'] += len(bookings)
+        log(f"  {counts['show_seats']} show seats, {counts['bookings']} bookings")
+
+    # The inserts skipped the rollup signals
+    rollup.rebuild(start - timedelta(days=6), max(today, start + timedelta(days=days)))
+    return counts
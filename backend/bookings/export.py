@@ -0,0 +1,104 @@
+"""
+Streaming booking exports, as CSV or JSON lines.
+
+Bookings are read in id order, chunk_size at a time, with keyset queries
+(id > last id seen): one query for the booking columns and one for the
+seat labels of that chunk. Memory stays flat however many rows are
+exported, and no cursor or transaction stays open while the client reads.
+QuerySet.iterator() would only stream from a server-side cursor on
+PostgreSQL; the MySQL and SQLite drivers fetch the whole result first.
+
+One response covers at most EXPORT_MAX_ROWS bookings, so that it finishes
+well within a sync worker's timeout. page() finds where a response stops,
+and the view links to the rest (Link: rel="next", ?after=<id>).
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Booking
+
+COLUMNS = (
+    'booking_id', 'booking_date', 'status', 'total_amount', 'customer', 'show_id', 'show_date', 'show_time',
+    'movie', 'theatre', 'city', 'screen', 'seats',
+)
+_FIELDS = (
+    'id', 'booking_date', 'status', 'total_amount', 'user__username', 'show_id', 'show__date', 'show__time',
+    'show__movie__title', 'show__screen__theatre__name', 'show__screen__theatre__city', 'show__screen__name',
+)
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/jsonl'}
+
+
+def _max_rows():
+    return getattr(settings, 'EXPORT_MAX_ROWS', 200_000)
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def page(queryset, after=0, max_rows=None):
+    """
+    Limit ``queryset`` to the next ``max_rows`` bookings after id ``after``.
+    Returns the limited queryset and the id to continue after, or None
+    when it reaches the end.
+    """
+    max_rows = max_rows or _max_rows()
+    queryset = queryset.filter(id__gt=after)
+    # The last id of this page and whether any booking follows it
+    ids = list(queryset.order_by('id').values_list('id', flat=True)[max_rows - 1:max_rows + 1])
+    if len(ids) < 2:
+        return queryset, None
+    return queryset.filter(id__lte=ids[0]), ids[0]
+
+
+def fetch(queryset, after, chunk_size):
+    """The next chunk of rows (tuples in COLUMNS order) after booking id ``after``."""
+    bookings = list(queryset.filter(id__gt=after).order_by('id').values_list(*_FIELDS)[:chunk_size])
+    if not bookings:
+        return []
+    seats = {}
+    for booking_id, row, number in (
+        Booking.seats.through.objects.filter(booking_id__in=[booking[0] for booking in bookings])
+        .order_by('booking_id', 'showseat__seat_id')
+        .values_list('booking_id', 'showseat__seat__row_number', 'showseat__seat__seat_number')
+    ):
+        seats.setdefault(booking_id, []).append(f'{row}{number}')
+    return [
+        (booking_id, booked_at.isoformat(), status, str(total), customer, show_id, show_date.isoformat(),
+         show_time.isoformat(), movie, theatre, city, screen, ' '.join(seats.get(booking_id, ())))
+        for booking_id, booked_at, status, total, customer, show_id, show_date, show_time, movie, theatre, city, screen
+        in bookings
+    ]
+
+
+def encode(rows, fmt, header=False):
+    if fmt == 'jsonl':
+        return ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def stream(queryset, fmt, after=0, chunk_size=None):
+    """Encoded export of ``queryset``, one string per chunk."""
+    chunk_size = chunk_size or _chunk_size()
+    yield encode([], fmt, header=True)
+    while rows := fetch(queryset, after, chunk_size):
+        yield encode(rows, fmt)
+        after = rows[-1][0]
+
+
+async def astream(queryset, fmt, after=0, chunk_size=None):
+    """stream() for ASGI: the queries run in the sync thread, one per chunk."""
+    chunk_size = chunk_size or _chunk_size()
+    yield encode([], fmt, header=True)
+    while rows := await sync_to_async(fetch)(queryset, after, chunk_size):
+        yield encode(rows, fmt)
+        after = rows[-1][0]
@@ -0,0 +1,84 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from bookings.models import Booking, DailyRevenueRollup
+from seats.models import ShowSeat
+from shows.models import Show
+from theatres.models import Theatre
+
+
+def hot_query_shapes():
+    """The lookups the API issues on every request, with placeholder values."""
+    today = timezone.now().date()
+    return [
+        ('dashboard revenue rollup', DailyRevenueRollup.objects.filter(date__gte=today - timedelta(days=30))),
+        ('bookings by status and date', Booking.objects.filter(status='CONFIRMED', booking_date__gte=timezone.now())),
+        ('recent bookings', Booking.objects.order_by('-booking_date')[:10]),
+        ('bookings of a user', Booking.objects.filter(user_id=1).order_by('-id')[:20]),
+        ('shows of a movie on a date', Show.objects.filter(date=today, movie_id=1)),
+        ('shows of a screen on a date', Show.objects.filter(screen_id=1, date=today).order_by('time')),
+        ('shows in a city on a date', Show.objects.filter(screen__theatre__city__lower='mumbai', date=today)),
+        ('theatres in a city', Theatre.objects.filter(city__lower='mumbai')),
+        ('seat availability', ShowSeat.objects.filter(show_id=1, status='AVAILABLE')),
+        ('seat map vector', ShowSeat.objects.filter(show_id=1).order_by('ordinal')),
+        ('expired seat holds', ShowSeat.objects.filter(status='LOCKED', locked_until__lt=timezone.now())),
+        ('stale pending bookings', Booking.objects.filter(status='PENDING', booking_date__lt=timezone.now())),
+    ]
+
+
+def full_scans(plan):
+    """Tables a query plan reads without any index."""
+    if connection.vendor == 'mysql':
+        scans = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get('access_type') == 'ALL':
+                    scans.append(node.get('table_name', '?'))
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        walk(json.loads(plan))
+        return scans
+
+    # SQLite: "SCAN <table>" without "USING ... INDEX" reads every row
+    scans = []
+    for line in plan.splitlines():
+        detail = line.split('SCAN ', 1)
+        if len(detail) == 2 and 'INDEX' not in detail[1]:
+            scans.append(detail[1].split()[0])
+    return scans
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot query shapes and fail if any of them falls back to a full table scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan, not only failing ones")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f"Unsupported database backend: {connection.vendor}")
+        explain_options = {'format': 'json'} if connection.vendor == 'mysql' else {}
+
+        failures = []
+        for label, queryset in hot_query_shapes():
+            plan = queryset.explain(**explain_options)
+            scans = full_scans(plan)
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {label}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok         {label}"))
+            if scans or options['verbose_plans']:
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+
+        if failures:
+            raise CommandError(f"{len(failures)} query shape(s) scan a whole table")
@@ -0,0 +1,48 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import dataset
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic dataset (theatres, shows, ShowSeats, bookings) with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(dataset.PRESETS), default='small',
+                            help="Base sizes, individual options below override them")
+        parser.add_argument('--cities', type=int)
+        parser.add_argument('--theatres-per-city', type=int)
+        parser.add_argument('--screens-per-theatre', type=int)
+        parser.add_argument('--layouts', type=dataset.parse_layouts,
+                            help="Seat layouts (rows x seats per row) cycled over screens, e.g. 10x20,12x24")
+        parser.add_argument('--days', type=int, help="Days of shows, from --start")
+        parser.add_argument('--shows-per-day', type=int, help=f"Shows per screen per day, at most {len(dataset.SHOW_TIMES)}")
+        parser.add_argument('--movies', type=int)
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--fill-rate', type=float, default=0.3, help="Average share of seats booked per show")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--start', type=date.fromisoformat, help="First show date (default: today)")
+
+    def handle(self, *args, **options):
+        params = dict(dataset.PRESETS[options['preset']])
+        for name in ('cities', 'theatres_per_city', 'screens_per_theatre', 'layouts', 'days', 'shows_per_day',
+                     'movies', 'users'):
+            if options[name] is not None:
+                params[name] = options[name]
+        if params['cities'] > len(dataset.CITIES):
+            raise CommandError(f"At most {len(dataset.CITIES)} cities are supported")
+        if not 0 <= options['fill_rate'] <= 1:
+            raise CommandError("--fill-rate must be between 0 and 1")
+
+        started = time.monotonic()
+        try:
+            counts = dataset.generate(
+                **params, fill_rate=options['fill_rate'], seed=options['seed'], start=options['start'],
+                log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None,
+            )
+        except dataset.DatasetExists as exc:
+            raise CommandError(str(exc))
+        summary = ', '.join(f"{n} {name.replace('_', ' ')}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary} in {time.monotonic() - started:.1f}s"))
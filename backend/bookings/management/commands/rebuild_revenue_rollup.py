@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bookings.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute DailyRevenueRollup from bookings, for all dates or a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-date', help="First booking date (YYYY-MM-DD)")
+        parser.add_argument('--to-date', help="Last booking date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        created = rebuild(options['from_date'], options['to_date'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {created} rollup rows"))
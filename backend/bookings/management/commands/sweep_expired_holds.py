@@ -0,0 +1,33 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from bookings import sweeper
+
+
+class Command(BaseCommand):
+    help = "Release expired seat holds and cancel stale PENDING bookings, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping until interrupted")
+        parser.add_argument('--interval', type=float, help="Seconds between sweeps with --loop")
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            result = sweeper.sweep()
+            self.stdout.write(self.style.SUCCESS(
+                f"Released {result['seats_released']} expired seat holds, cancelled "
+                f"{result['bookings_cancelled']} stale bookings ({result['booking_seats_released']} seats)"
+            ))
+            return
+
+        stop = threading.Event()
+        try:
+            sweeper.run_forever(options['interval'], stop)
+        except KeyboardInterrupt:
+            stop.set()
+        metrics = sweeper.metrics
+        self.stdout.write(
+            f"Stopped after {metrics['runs']} sweeps: {metrics['seats_released']} seat holds released, "
+            f"{metrics['bookings_cancelled']} bookings cancelled"
+        )
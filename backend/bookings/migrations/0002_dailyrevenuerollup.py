@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    DailyRevenueRollup = apps.get_model('bookings', 'DailyRevenueRollup')
+    grouped = (
+        Booking.objects.annotate(day=TruncDate('booking_date'))
+        .order_by()
+        .values('day', 'status', theatre=F('show__screen__theatre'), movie=F('show__movie'))
+        .annotate(booking_count=Count('id'), amount=Sum('total_amount'))
+    )
+    DailyRevenueRollup.objects.bulk_create([
+        DailyRevenueRollup(
+            date=row['day'], theatre_id=row['theatre'], movie_id=row['movie'], status=row['status'],
+            booking_count=row['booking_count'], amount=row['amount'],
+        )
+        for row in grouped
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+        ('theatres', '0001_initial'),
+        ('bookings', '0001_initial'),
+        ('shows', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled')], max_length=10)),
+                ('booking_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='movies.movie')),
+                ('theatre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='theatres.theatre')),
+            ],
+            options={
+                'unique_together': {('date', 'theatre', 'movie', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 from users.models import CustomUser
 from shows.models import Show
 from seats.models import ShowSeat
+from theatres.models import Theatre
+from movies.models import Movie
+from offers.models import Offer
 
 class Booking(models.Model):
     STATUS_CHOICES = (
@@ -16,6 +19,47 @@ class Booking(models.Model):
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     transaction_id = models.CharField(max_length=100, null=True, blank=True)
+    # total_amount is after the discount, see offers.evaluator
+    offer = models.ForeignKey(Offer, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings')
+    discount_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'booking_date'], name='booking_status_date_idx'),
+            models.Index(fields=['booking_date'], name='booking_date_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.id} by {self.user.username}"
+
+
+class DailyRevenueRollup(models.Model):
+    """Booking count and amount per day, theatre, movie and status, see bookings.rollup"""
+    date = models.DateField()
+    theatre = models.ForeignKey(Theatre, on_delete=models.CASCADE, related_name='revenue_rollups')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='revenue_rollups')
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    booking_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'theatre', 'movie', 'status')
+
+    def __str__(self):
+        return f"{self.date} {self.theatre_id}/{self.movie_id} {self.status}: {self.booking_count}"
+
+
+class IdempotencyKey(models.Model):
+    """A request run under an Idempotency-Key and its response, see bookmyshowcase.idempotency"""
+    # sha256 of the client and the key the client sent
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    # None while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content = models.BinaryField(null=True, blank=True)
+    headers = models.JSONField(default=list, blank=True)
+    # Of the in-flight lock first, then of the stored response
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key[:12]}: {self.status_code or 'in flight'}"
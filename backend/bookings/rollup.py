@@ -0,0 +1,103 @@
+"""
+Incremental maintenance of DailyRevenueRollup.
+
+Booking saves and deletes are folded in by the signals in bookings.signals.
+Code that changes bookings with queryset.update() or bulk_create() bypasses
+those signals and must call apply_delta() or move_bookings() itself.
+rebuild() recomputes the table (or a date range of it) from Booking and is
+the fix for any drift.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from shows.models import Show
+from .models import Booking, DailyRevenueRollup
+
+
+def show_dimensions(show_id):
+    """``(theatre_id, movie_id)`` for a show, or None if it is gone."""
+    return Show.objects.filter(pk=show_id).values_list('screen__theatre_id', 'movie_id').first()
+
+
+def apply_delta(day, theatre_id, movie_id, status, count, amount):
+    key = dict(date=day, theatre_id=theatre_id, movie_id=movie_id, status=status)
+    changes = dict(booking_count=F('booking_count') + count, amount=F('amount') + amount)
+    if DailyRevenueRollup.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyRevenueRollup.objects.create(booking_count=count, amount=amount, **key)
+    except IntegrityError:
+        # Another writer created the row first
+        DailyRevenueRollup.objects.filter(**key).update(**changes)
+
+
+def move_bookings(rows, from_status, to_status):
+    """
+    Move bookings changed with queryset.update() from ``from_status`` to
+    ``to_status``. ``rows`` are ``(id, show_id, booking_date, amount)``.
+    """
+    groups = defaultdict(lambda: [0, Decimal('0')])
+    for _, show_id, booking_date, amount in rows:
+        group = groups[timezone.localdate(booking_date), show_id]
+        group[0] += 1
+        group[1] += amount
+    dimensions = {
+        show_id: (theatre_id, movie_id)
+        for show_id, theatre_id, movie_id in Show.objects.filter(id__in={show_id for _, show_id in groups})
+        .values_list('id', 'screen__theatre_id', 'movie_id')
+    }
+    for (day, show_id), (count, amount) in groups.items():
+        theatre_id, movie_id = dimensions[show_id]
+        apply_delta(day, theatre_id, movie_id, from_status, -count, -amount)
+        apply_delta(day, theatre_id, movie_id, to_status, count, amount)
+
+
+def booking_changed(previous, current):
+    """
+    Move one booking between rollup rows.
+
+    ``previous`` and ``current`` are ``(booking_date, show_id, status, amount)``
+    tuples, either may be None for a create or delete.
+    """
+    if previous == current:
+        return
+    for state, sign in ((previous, -1), (current, 1)):
+        if state is None:
+            continue
+        booking_date, show_id, status, amount = state
+        dimensions = show_dimensions(show_id)
+        if dimensions is not None:
+            apply_delta(timezone.localdate(booking_date), *dimensions, status, sign, sign * amount)
+
+
+def rebuild(from_date=None, to_date=None):
+    bookings = Booking.objects.annotate(day=TruncDate('booking_date'))
+    rollups = DailyRevenueRollup.objects.all()
+    if from_date:
+        bookings = bookings.filter(day__gte=from_date)
+        rollups = rollups.filter(date__gte=from_date)
+    if to_date:
+        bookings = bookings.filter(day__lte=to_date)
+        rollups = rollups.filter(date__lte=to_date)
+
+    grouped = (
+        bookings.order_by()
+        .values('day', 'status', theatre=F('show__screen__theatre'), movie=F('show__movie'))
+        .annotate(booking_count=Count('id'), amount=Sum('total_amount'))
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = DailyRevenueRollup.objects.bulk_create([
+            DailyRevenueRollup(
+                date=row['day'], theatre_id=row['theatre'], movie_id=row['movie'], status=row['status'],
+                booking_count=row['booking_count'], amount=row['amount'],
+            )
+            for row in grouped.iterator()
+        ], batch_size=1000)
+    return len(created)
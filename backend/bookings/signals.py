@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import rollup
+from .models import Booking
+
+
+def _state(booking):
+    return (booking.booking_date, booking.show_id, booking.status, booking.total_amount)
+
+
+@receiver(pre_save, sender=Booking)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        instance._rollup_previous = (
+            Booking.objects.filter(pk=instance.pk)
+            .values_list('booking_date', 'show_id', 'status', 'total_amount')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollup.booking_changed(getattr(instance, '_rollup_previous', None), _state(instance))
+
+
+@receiver(post_delete, sender=Booking)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollup.booking_changed(_state(instance), None)
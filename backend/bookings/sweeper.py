@@ -0,0 +1,206 @@
+"""
+Background expiry of stale seat holds and abandoned PENDING bookings.
+
+sweep() does one pass:
+
+* seats LOCKED past their ``locked_until`` go back to AVAILABLE
+  (seats.holds.release_expired);
+* bookings still PENDING BOOKING_PENDING_TTL_SECONDS after they were made,
+  and not paid for, become CANCELLED, and their seats go back to AVAILABLE
+  unless another confirmed booking holds them;
+* expired Idempotency-Keys (bookmyshowcase.idempotency) and refilled
+  throttle buckets (bookmyshowcase.throttling) are deleted.
+
+Both work in batches of SWEEPER_BATCH_SIZE rows, one short transaction per
+batch, found through the (status, locked_until) and (status, booking_date)
+indexes. Run it with ``manage.py sweep_expired_holds --loop``, or set
+SWEEPER_IN_PROCESS to run it on a daemon thread of the web server (see
+bookmyshowcase.background).
+
+Running totals are kept in ``metrics`` and exported on /api/_metrics.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from bookmyshowcase import idempotency, throttling
+from seats import availability
+from seats.holds import release_expired
+from seats.models import ShowSeat
+from . import rollup
+from .models import Booking
+
+logger = logging.getLogger(__name__)
+
+metrics = {
+    'runs': 0,
+    'failures': 0,
+    'seats_released': 0,
+    'bookings_cancelled': 0,
+    'booking_seats_released': 0,
+    'idempotency_keys_deleted': 0,
+    'throttle_buckets_deleted': 0,
+    'last_run_at': None,
+    'last_duration_seconds': 0.0,
+}
+_metrics_lock = threading.Lock()
+
+
+class SweepConflict(Exception):
+    """A booking in the batch changed under the sweep; the batch was rolled back."""
+
+
+def batch_size():
+    return getattr(settings, 'SWEEPER_BATCH_SIZE', 500)
+
+
+def pending_ttl():
+    return timedelta(seconds=getattr(settings, 'BOOKING_PENDING_TTL_SECONDS', 900))
+
+
+def cancel_stale_bookings(now=None, size=None):
+    """Cancel PENDING bookings older than the TTL; returns (bookings, seats) released."""
+    cutoff = (now or timezone.now()) - pending_ttl()
+    size = size or batch_size()
+    # A payment the gateway already reported is left for payments.jobs to settle
+    stale = (
+        Booking.objects.filter(status='PENDING', booking_date__lt=cutoff)
+        .exclude(payments__status__in=('RECEIVED', 'SUCCEEDED'))
+    )
+
+    cancelled = freed = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                stale.select_for_update()
+                .order_by('booking_date')
+                .values_list('id', 'show_id', 'booking_date', 'total_amount')[:size]
+            )
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            count = Booking.objects.filter(id__in=ids, status='PENDING').update(status='CANCELLED')
+            if count != len(rows):
+                # Rows are not locked on SQLite; the next pass picks the batch up again
+                raise SweepConflict(f"{len(rows) - count} of {len(rows)} bookings changed during the sweep")
+
+            released = release_seats(ids)
+            rollup.move_bookings(rows, 'PENDING', 'CANCELLED')
+        cancelled += len(rows)
+        freed += released
+        if len(rows) < size:
+            break
+    return cancelled, freed
+
+
+def release_seats(booking_ids):
+    """
+    Return the seats of the (cancelled) bookings ``booking_ids`` to AVAILABLE,
+    except those a confirmed booking holds. Returns how many were released.
+    """
+    seats = list(
+        ShowSeat.objects.filter(id__in=Booking.seats.through.objects.filter(booking_id__in=booking_ids).values('showseat_id'))
+        .exclude(status='AVAILABLE')
+        .exclude(booking__status='CONFIRMED')
+        .values_list('id', 'show_id')
+    )
+    by_show = defaultdict(list)
+    for seat_id, show_id in seats:
+        by_show[show_id].append(seat_id)
+    ShowSeat.objects.filter(id__in=[seat_id for seat_id, _ in seats]).update(
+        status='AVAILABLE', hold_token=None, held_by=None, locked_until=None,
+    )
+    for show_id, seat_ids in by_show.items():
+        availability.seat_status_changed(show_id, seat_ids, 'AVAILABLE')
+    return len(seats)
+
+
+def sweep(now=None):
+    """One pass over expired holds and stale bookings; returns what it released."""
+    started = time.monotonic()
+    now = now or timezone.now()
+    try:
+        seats_released = release_expired(now=now, batch_size=batch_size())
+        bookings_cancelled, booking_seats = cancel_stale_bookings(now)
+        keys_deleted = idempotency.delete_expired(now)
+        buckets_deleted = throttling.delete_expired_buckets(now)
+    except Exception:
+        with _metrics_lock:
+            metrics['failures'] += 1
+        raise
+    duration = time.monotonic() - started
+
+    with _metrics_lock:
+        metrics['runs'] += 1
+        metrics['seats_released'] += seats_released
+        metrics['bookings_cancelled'] += bookings_cancelled
+        metrics['booking_seats_released'] += booking_seats
+        metrics['idempotency_keys_deleted'] += keys_deleted
+        metrics['throttle_buckets_deleted'] += buckets_deleted
+        metrics['last_run_at'] = now.isoformat()
+        metrics['last_duration_seconds'] = round(duration, 3)
+
+    result = {
+        'seats_released': seats_released,
+        'bookings_cancelled': bookings_cancelled,
+        'booking_seats_released': booking_seats,
+        'idempotency_keys_deleted': keys_deleted,
+        'throttle_buckets_deleted': buckets_deleted,
+        'duration_seconds': round(duration, 3),
+    }
+    if seats_released or bookings_cancelled:
+        logger.info("Sweep released %(seats_released)d expired seat holds and cancelled "
+                    "%(bookings_cancelled)d stale bookings (%(booking_seats_released)d seats)", result, extra=result)
+    return result
+
+
+def collect():
+    """Sweeper totals for bookmyshowcase.metrics."""
+    with _metrics_lock:
+        snapshot = dict(metrics)
+    return [
+        ('sweeper_runs_total', 'counter', 'Completed expiry sweeps.', snapshot['runs']),
+        ('sweeper_failures_total', 'counter', 'Expiry sweeps that raised.', snapshot['failures']),
+        ('sweeper_seats_released_total', 'counter', 'Expired seat holds returned to AVAILABLE.',
+         snapshot['seats_released']),
+        ('sweeper_bookings_cancelled_total', 'counter', 'Stale PENDING bookings cancelled.',
+         snapshot['bookings_cancelled']),
+        ('sweeper_booking_seats_released_total', 'counter', 'Seats of cancelled bookings returned to AVAILABLE.',
+         snapshot['booking_seats_released']),
+        ('sweeper_idempotency_keys_deleted_total', 'counter', 'Expired Idempotency-Keys deleted.',
+         snapshot['idempotency_keys_deleted']),
+        ('sweeper_throttle_buckets_deleted_total', 'counter', 'Refilled throttle buckets deleted.',
+         snapshot['throttle_buckets_deleted']),
+        ('sweeper_last_duration_seconds', 'gauge', 'Duration of the last sweep.', snapshot['last_duration_seconds']),
+    ]
+
+
+def run_forever(interval=None, stop=None):
+    """Call sweep() every ``interval`` seconds until ``stop`` (an Event) is set."""
+    interval = interval or getattr(settings, 'SWEEPER_INTERVAL_SECONDS', 30)
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            sweep()
+        except Exception:
+            logger.exception("Expiry sweep failed")
+        stop.wait(interval)
+
+
+_thread = None
+
+
+def start_in_process():
+    """Start run_forever() on a daemon thread, once per process."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=run_forever, name='expiry-sweeper', daemon=True)
+        _thread.start()
+    return _thread
@@ -0,0 +1,722 @@
+import json
+import threading
+from time import sleep
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, models
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookmyshowcase import idempotency, throttling
+from movies.models import Movie
+from offers import evaluator
+from offers.models import Offer
+from payments import gateways, jobs
+from payments.models import Payment
+from seats import holds, layouts
+from seats.models import ShowSeat
+from shows.models import Show
+from theatres.models import Theatre, Screen
+from users.models import CustomUser
+from .checkout import cart, checkout
+from .models import Booking, DailyRevenueRollup, IdempotencyKey
+from . import dataset, rollup, sweeper
+
+# Show.price times the seat type multiplier only, whatever day the tests run
+FLAT_PRICING = {'time_of_day': [], 'weekdays': {}, 'occupancy': []}
+
+
+def make_show(owner, seats=0):
+    movie = Movie.objects.create(
+        title='Jawan', description='', duration_minutes=169, language='Hindi',
+        release_date=date(2023, 9, 7), genre='Action',
+    )
+    theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=owner)
+    screen = Screen.objects.create(name='Screen 1', theatre=theatre)
+    if seats:
+        layouts.apply(screen, {'rows': [{'row': 'A', 'type': 'SILVER', 'seats': [[1, seats]]}]})
+    # Creating the show materialises its ShowSeats
+    return Show.objects.create(movie=movie, screen=screen, date=date.today(), time=time(18), price=250)
+
+
+def pay(booking, succeed=True):
+    """Pay for a checkout() booking through the fake gateway and settle the payment."""
+    gateway = gateways.get_gateway()
+    jobs.receive(gateway.parse_callback(*gateway.pay(booking.payment.reference, succeed)))
+    jobs.process()
+    return booking
+
+
+class BrokenGateway(gateways.FakeGateway):
+    def checkout_params(self, payment):
+        raise gateways.GatewayError("Gateway is down")
+
+    def refund(self, payment):
+        raise gateways.GatewayError("Gateway is down")
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner)
+
+    def snapshot(self):
+        return sorted(
+            DailyRevenueRollup.objects.filter(booking_count__gt=0)
+            .values_list('date', 'theatre_id', 'movie_id', 'status', 'booking_count', 'amount')
+        )
+
+    def test_signals_match_rebuild(self):
+        first = Booking.objects.create(user=self.customer, show=self.show, total_amount=Decimal('500'))
+        second = Booking.objects.create(user=self.customer, show=self.show, total_amount=Decimal('250'))
+        Booking.objects.create(user=self.customer, show=self.show, total_amount=Decimal('100'), status='CONFIRMED')
+        first.status = 'CONFIRMED'
+        first.save()
+        second.booking_date = timezone.now() - timedelta(days=3)
+        second.status = 'CANCELLED'
+        second.save()
+        Booking.objects.create(user=self.customer, show=self.show, total_amount=Decimal('50')).delete()
+
+        incremental = self.snapshot()
+        rollup.rebuild()
+
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(
+            DailyRevenueRollup.objects.get(status='CONFIRMED').amount,
+            Decimal('600'),
+        )
+
+
+@override_settings(SEAT_PRICING_RULES=FLAT_PRICING)
+class CheckoutTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner, seats=20)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post_checkout(self, seat_ids, **extra):
+        return self.client.post('/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': seat_ids, **extra}, format='json')
+
+    def test_books_seats_and_totals_prices(self):
+        response = self.post_checkout(self.seat_ids[:3])
+
+        self.assertEqual(response.status_code, 201)
+        booking = Booking.objects.get(pk=response.data['id'])
+        self.assertEqual(booking.total_amount, Decimal('750.00'))
+        self.assertEqual(booking.status, 'PENDING')
+        self.assertEqual(response.data['payment']['amount'], '750.00')
+        self.assertEqual(sorted(booking.seats.values_list('id', flat=True)), self.seat_ids[:3])
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 3)
+
+    def test_rejects_taken_seats_without_side_effects(self):
+        self.post_checkout(self.seat_ids[:2])
+        response = self.post_checkout(self.seat_ids[1:4])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['seat_ids'], [self.seat_ids[1]])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 2)
+
+    def test_honours_own_hold_only(self):
+        token, _ = holds.hold_seats(self.show.id, self.seat_ids[:2], self.customer)
+        other = APIClient()
+        other.force_authenticate(CustomUser.objects.create_user('other', 'other@example.com', 'pw'))
+
+        self.assertEqual(self.post_checkout(self.seat_ids[:2]).status_code, 409)
+        # The token alone is not enough: the hold is the customer's
+        response = other.post(
+            '/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': self.seat_ids[:2], 'hold_token': token}, format='json',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.post_checkout(self.seat_ids[:2], hold_token=token).status_code, 201)
+
+    def test_query_count_independent_of_seat_count(self):
+        # The first booking of the day also creates its rollup row
+        checkout(self.customer, self.show.id, self.seat_ids[:1])
+        with CaptureQueriesContext(connection) as few:
+            checkout(self.customer, self.show.id, self.seat_ids[1:2])
+        with CaptureQueriesContext(connection) as many:
+            checkout(self.customer, self.show.id, self.seat_ids[2:20])
+
+        self.assertEqual(len(few), len(many))
+
+
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner, seats=6)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post(self, action, data):
+        return self.client.post(f'/api/shows/{self.show.id}/{action}/', data, format='json')
+
+    def statuses(self):
+        return list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('status', flat=True))
+
+    def test_hold_extend_release_and_check_out(self):
+        response = self.post('hold', {'seat_ids': self.seat_ids[:3]})
+        self.assertEqual(response.status_code, 201)
+        token = response.data['hold_token']
+        self.assertEqual(self.statuses(), ['LOCKED'] * 3 + ['AVAILABLE'] * 3)
+
+        # All or nothing: one taken seat refuses the whole hold
+        response = self.post('hold', {'seat_ids': self.seat_ids[2:5]})
+        self.assertEqual((response.status_code, response.data['seat_ids']), (409, [self.seat_ids[2]]))
+        self.assertEqual(self.statuses(), ['LOCKED'] * 3 + ['AVAILABLE'] * 3)
+
+        before = ShowSeat.objects.get(pk=self.seat_ids[0]).locked_until
+        with override_settings(SEAT_HOLD_TTL_SECONDS=3600):
+            self.assertEqual(self.post('hold/extend', {'hold_token': token}).status_code, 200)
+        self.assertGreater(ShowSeat.objects.get(pk=self.seat_ids[0]).locked_until, before)
+
+        response = self.post('hold/release', {'hold_token': token, 'seat_ids': self.seat_ids[:1]})
+        self.assertEqual(response.data, {'released': 1})
+        response = self.client.post(
+            '/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': self.seat_ids[1:3], 'hold_token': token}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.statuses(), ['AVAILABLE', 'BOOKED', 'BOOKED'] + ['AVAILABLE'] * 3)
+
+        # The hold is gone once checked out
+        self.assertEqual(self.post('hold/extend', {'hold_token': token}).status_code, 404)
+        self.assertEqual(self.post('hold/release', {'hold_token': token}).data, {'released': 0})
+
+    def test_holds_belong_to_their_user(self):
+        token, _ = holds.hold_seats(self.show.id, self.seat_ids[:2], self.customer)
+        other = APIClient()
+        other.force_authenticate(CustomUser.objects.create_user('other', 'other@example.com', 'pw'))
+        url = f'/api/shows/{self.show.id}/hold'
+
+        self.assertEqual(other.post(f'{url}/extend/', {'hold_token': token}, format='json').status_code, 404)
+        self.assertEqual(other.post(f'{url}/release/', {'hold_token': token}, format='json').data, {'released': 0})
+        self.assertEqual(self.statuses(), ['LOCKED'] * 2 + ['AVAILABLE'] * 4)
+
+        anonymous = APIClient()
+        for action in ('', 'extend/', 'release/'):
+            response = anonymous.post(f'{url}/{action}', {'hold_token': token, 'seat_ids': self.seat_ids[2:3]}, format='json')
+            self.assertEqual(response.status_code, 401)
+        # Seats are only ever BOOKED by a checkout, there is no other way to confirm a hold
+        self.assertEqual(self.client.post(f'{url}/confirm/', {'hold_token': token}, format='json').status_code, 404)
+        self.assertEqual(self.post('hold/extend', {'hold_token': token}).status_code, 200)
+
+    def test_non_numeric_show(self):
+        for action in ('hold', 'hold/extend', 'hold/release'):
+            response = self.client.post(f'/api/shows/abc/{action}/', {'seat_ids': [1], 'hold_token': 'x'}, format='json')
+            self.assertEqual(response.status_code, 404)
+
+    def test_expired_holds_are_claimable(self):
+        token, _ = holds.hold_seats(self.show.id, self.seat_ids[:2], self.customer)
+        ShowSeat.objects.filter(hold_token=token).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertRaises(holds.HoldNotFound):
+            holds.extend_hold(self.show.id, token, self.customer)
+        other, _ = holds.hold_seats(self.show.id, self.seat_ids[1:3], self.customer)
+        self.assertNotEqual(other, token)
+        # The old token no longer covers the seat taken over
+        self.assertEqual(holds.release_hold(self.show.id, token, self.customer), 1)
+        self.assertEqual(holds.release_hold(self.show.id, other, self.customer), 2)
+
+    def test_holds_are_per_show(self):
+        other = make_show(self.show.screen.theatre.owner, seats=2)
+        with self.assertRaises(holds.SeatUnavailable):
+            holds.hold_seats(other.id, self.seat_ids[:1], self.customer)
+
+
+@override_settings(SEAT_PRICING_RULES=FLAT_PRICING)
+class OfferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        evaluator._index = None
+        throttling.get_backend().reset()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner)
+        # Four SILVER seats at 250 and two GOLD at 312.50
+        layouts.apply(self.show.screen, {'rows': [{'row': 'A', 'type': 'SILVER', 'seats': [[1, 4], [5, 6, 'GOLD']]}]})
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('ordinal').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post_checkout(self, seat_ids, **extra):
+        return self.client.post('/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': seat_ids, **extra}, format='json')
+
+    def test_best_automatic_offer_applies(self):
+        Offer.objects.create(name='Mumbai weekdays', value=10, city='Mumbai', weekdays=[date.today().weekday()])
+        Offer.objects.create(name='Gold pairs', discount_type='FLAT', value=100, seat_types=['GOLD'], min_seats=2)
+        Offer.objects.create(name='Elsewhere', value=50, city='Pune')
+
+        response = self.post_checkout(self.seat_ids[3:5])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['total_amount'], response.data['discount_amount']), ('506.25', '56.25'))
+
+        response = self.post_checkout(self.seat_ids[:3] + self.seat_ids[5:])
+        booking = Booking.objects.get(pk=response.data['id'])
+        self.assertEqual(booking.offer.name, 'Mumbai weekdays')
+        self.assertEqual(booking.total_amount, Decimal('956.25'))
+
+    def test_cities_match_case_insensitively(self):
+        Offer.objects.create(name='Mumbai', value=10, city='mumbai')
+        self.assertEqual(self.post_checkout(self.seat_ids[:1]).data['discount_amount'], '25.00')
+        listed = self.client.get('/api/offers/', {'city': 'MUMBAI'}).data['results']
+        self.assertEqual([offer['name'] for offer in listed], ['Mumbai'])
+
+    def test_evaluation_is_in_memory(self):
+        Offer.objects.create(name='Gold', value=20, seat_types=['GOLD'])
+        show, seats = cart(ShowSeat.objects.filter(id__in=self.seat_ids))
+        evaluator.evaluate(self.customer, show, seats)
+        with self.assertNumQueries(0):
+            quote = evaluator.evaluate(self.customer, show, seats)
+        self.assertEqual(quote.discount, Decimal('125.00'))
+
+    @override_settings(OFFERS_INDEX_CHECK_SECONDS=0)
+    def test_changes_made_elsewhere_are_noticed(self):
+        offer = Offer.objects.create(name='Gold', value=20, seat_types=['GOLD'])
+        show, seats = cart(ShowSeat.objects.filter(id__in=self.seat_ids))
+        self.assertEqual(evaluator.evaluate(self.customer, show, seats).discount, Decimal('125.00'))
+        # As another process would: no signal reaches this one
+        Offer.objects.filter(pk=offer.pk).update(is_active=False, updated_at=timezone.now())
+        self.assertEqual(evaluator.evaluate(self.customer, show, seats).discount, Decimal('0'))
+
+    def test_promo_codes(self):
+        Offer.objects.create(name='Welcome', code='HELLO50', value=50, max_discount=200, first_booking_only=True)
+        Offer.objects.create(name='Launch', code='ONCE', discount_type='FLAT', value=75, max_uses=1)
+
+        self.assertEqual(self.post_checkout(self.seat_ids[:1], promo_code='NOPE').status_code, 400)
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 0)
+        response = self.post_checkout(self.seat_ids[:2], promo_code='hello50')
+        self.assertEqual((response.status_code, response.data['total_amount']), (201, '300.00'))
+        response = self.post_checkout(self.seat_ids[2:3], promo_code='HELLO50')
+        self.assertEqual(response.data, {'error': 'Promo code HELLO50 is for first bookings only'})
+
+        self.assertEqual(self.post_checkout(self.seat_ids[2:3], promo_code='ONCE').data['total_amount'], '175.00')
+        self.assertEqual(self.post_checkout(self.seat_ids[3:4], promo_code='ONCE').status_code, 400)
+        self.assertEqual(Offer.objects.get(code='ONCE').uses, 1)
+
+    def test_admins_manage_offers_and_anyone_gets_quotes(self):
+        self.assertEqual(self.client.post('/api/offers/', {'name': 'x', 'value': 10}, format='json').status_code, 403)
+        admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/offers/', {'name': 'Gold', 'code': ' gold ', 'value': 10, 'seat_types': ['GOLD']}, format='json')
+        self.assertEqual((response.status_code, response.data['code']), (201, 'GOLD'))
+        self.assertEqual(self.client.post('/api/offers/', {'name': 'Too much', 'value': 120}, format='json').status_code, 400)
+
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/offers/quote/', {'show': self.show.id, 'seat_ids': self.seat_ids[4:], 'promo_code': 'gold'}, format='json')
+        self.assertEqual(response.data, {
+            'subtotal': '625.00', 'discount': '62.50', 'total': '562.50',
+            'offer': {'id': Offer.objects.get().id, 'name': 'Gold', 'code': 'GOLD'},
+        })
+        Offer.objects.update(is_active=False)
+        self.assertEqual(self.client.get('/api/offers/').data['results'], [])
+
+
+@override_settings(SEAT_PRICING_RULES=FLAT_PRICING)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(self.owner, seats=10)
+        seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        for n in range(4):
+            pay(checkout(self.customer, self.show.id, seat_ids[2 * n:2 * n + 2]))
+        Booking.objects.filter(pk=Booking.objects.order_by('id').first().pk).update(status='CANCELLED')
+        other_show = make_show(other, seats=2)
+        pay(checkout(self.customer, other_show.id, list(ShowSeat.objects.filter(show=other_show).values_list('id', flat=True))))
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/bookings/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_of_own_theatres_only(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['booking_id', 'booking_date', 'status'])
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].endswith(',PVR,Mumbai,Screen 1,A1 A2'))
+
+    def test_jsonl_with_filters(self):
+        _, body = self.export('?format=jsonl&status=CONFIRMED')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['seats'] for row in rows], ['A3 A4', 'A5 A6', 'A7 A8'])
+        self.assertEqual(rows[0]['total_amount'], '500.00')
+
+    @override_settings(EXPORT_MAX_ROWS=3, EXPORT_CHUNK_SIZE=2)
+    def test_pages_through_next_links(self):
+        response, body = self.export()
+        self.assertEqual(len(body.splitlines()), 4)
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response, body = self.export(next_url[next_url.index('?'):])
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertFalse(response.has_header('Link'))
+
+    def test_customers_cannot_export(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/bookings/export/').status_code, 403)
+
+
+@override_settings(SEAT_PRICING_RULES=FLAT_PRICING, BOOKING_PENDING_TTL_SECONDS=60)
+class PaymentTests(TestCase):
+    def setUp(self):
+        gateways._gateway = None
+        jobs.seen.clear()
+        throttling.get_backend().reset()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner, seats=4)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post_callback(self, body, headers):
+        return self.client.post('/api/payments/callback/', body, content_type='application/json',
+                                HTTP_X_SIGNATURE=headers['X-Signature'])
+
+    def test_callbacks_are_settled_by_the_worker(self):
+        response = self.client.post('/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': self.seat_ids[:2]}, format='json')
+        booking = Booking.objects.get(pk=response.data['id'])
+        callback = gateways.get_gateway().pay(response.data['payment']['reference'])
+
+        self.assertEqual(self.post_callback(*callback).status_code, 202)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'PENDING')
+
+        self.assertEqual(jobs.process()['confirmed'], 1)
+        booking.refresh_from_db()
+        payment = Payment.objects.get()
+        self.assertEqual((booking.status, payment.status), ('CONFIRMED', 'SUCCEEDED'))
+        self.assertEqual(booking.transaction_id, payment.transaction_id)
+        self.assertEqual(dict(DailyRevenueRollup.objects.values_list('status', 'booking_count')), {'PENDING': 0, 'CONFIRMED': 1})
+        self.assertEqual(self.client.get('/api/payments/').data['results'][0]['status'], 'SUCCEEDED')
+
+    def test_retried_callbacks_change_nothing(self):
+        booking = checkout(self.customer, self.show.id, self.seat_ids[:1])
+        callback = gateways.get_gateway().pay(booking.payment.reference)
+        self.post_callback(*callback)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post_callback(*callback).data, {'status': 'duplicate'})
+        # As if the retry reached another process
+        jobs.seen.clear()
+        self.assertEqual(self.post_callback(*callback).data, {'status': 'duplicate'})
+        self.assertEqual(jobs.process()['confirmed'], 1)
+        self.assertEqual(jobs.process()['confirmed'], 0)
+
+        other = checkout(self.customer, self.show.id, self.seat_ids[1:2])
+        body, headers = gateways.get_gateway().pay(other.payment.reference)
+        self.assertEqual(self.post_callback(body.replace(b'SUCCESS', b'FAILURE'), headers).status_code, 400)
+        self.assertEqual(self.post_callback(*gateways.get_gateway().pay('nope')).status_code, 404)
+
+    def test_failed_and_late_payments(self):
+        failed = pay(checkout(self.customer, self.show.id, self.seat_ids[:2]), succeed=False)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'CANCELLED')
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 0)
+
+        reported = checkout(self.customer, self.show.id, self.seat_ids[:1])
+        jobs.receive(gateways.get_gateway().parse_callback(*gateways.get_gateway().pay(reported.payment.reference)))
+        late = checkout(self.customer, self.show.id, self.seat_ids[1:2])
+        Booking.objects.update(booking_date=timezone.now() - timedelta(minutes=5))
+        # The sweeper leaves bookings whose payment has been reported alone
+        self.assertEqual(sweeper.sweep()['bookings_cancelled'], 1)
+
+        pay(late)
+        statuses = dict(Payment.objects.values_list('booking_id', 'status'))
+        self.assertEqual((statuses[reported.id], statuses[late.id]), ('SUCCEEDED', 'REFUNDED'))
+        self.assertEqual(Booking.objects.get(pk=reported.id).status, 'CONFIRMED')
+        self.assertIn(Payment.objects.get(booking=late).transaction_id, gateways.get_gateway().refunds)
+
+    def test_failed_refunds_stay_queued(self):
+        late = checkout(self.customer, self.show.id, self.seat_ids[:1])
+        jobs.receive(gateways.get_gateway().parse_callback(*gateways.get_gateway().pay(late.payment.reference)))
+        Booking.objects.filter(pk=late.pk).update(status='CANCELLED')
+
+        gateways._gateway = BrokenGateway()
+        with self.assertLogs('payments.jobs', 'ERROR'):
+            self.assertEqual(jobs.process()['errors'], 1)
+            self.assertEqual(Payment.objects.get().status, 'REFUND_PENDING')
+            self.assertEqual(jobs.process()['errors'], 1)
+        gateways._gateway = None
+        self.assertEqual(jobs.process()['refunded'], 1)
+        self.assertEqual(Payment.objects.get().status, 'REFUNDED')
+
+    def test_any_process_can_settle(self):
+        response = self.client.post('/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': self.seat_ids[:1]}, format='json')
+        payment_id = Payment.objects.get().id
+        self.assertEqual(self.client.post(f'/api/payments/{payment_id}/pay/').status_code, 202)
+        self.assertEqual(self.client.post(f'/api/payments/{payment_id}/pay/').status_code, 409)
+        # The worker runs elsewhere, with a gateway of its own
+        gateways._gateway = None
+        self.assertEqual(jobs.process()['confirmed'], 1)
+        self.assertEqual(Booking.objects.get(pk=response.data['id']).status, 'CONFIRMED')
+
+    def test_gateway_must_be_configured(self):
+        gateways._gateway = None
+        with self.settings(PAYMENT_GATEWAY=''), self.assertRaises(ImproperlyConfigured):
+            gateways.get_gateway()
+        with self.settings(PAYMENT_GATEWAY_SECRET=''), self.assertRaises(ImproperlyConfigured):
+            gateways.get_gateway()
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        gateways._gateway = None
+        jobs.seen.clear()
+        throttling.get_backend().reset()
+        idempotency.get_backend().reset()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner, seats=4)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post_checkout(self, seat_ids, key):
+        return self.client.post('/api/bookings/checkout/', {'show': self.show.id, 'seat_ids': seat_ids},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.post_checkout(self.seat_ids[:2], 'k1')
+        self.assertEqual(first.status_code, 201)
+        # As if the retry reached another worker process
+        idempotency._backend = None
+        retry = self.post_checkout(self.seat_ids[:2], 'k1')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(Booking.objects.count(), 1)
+
+        # Same key, other request; other customer, same key
+        self.assertEqual(self.post_checkout(self.seat_ids[2:], 'k1').status_code, 422)
+        self.client.force_authenticate(CustomUser.objects.create_user('other', 'other@example.com', 'pw'))
+        self.assertEqual(self.post_checkout(self.seat_ids[2:], 'k1').status_code, 201)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_conflicts_are_replayed_and_errors_are_not(self):
+        self.post_checkout(self.seat_ids[:1], 'first')
+        self.assertEqual(self.post_checkout(self.seat_ids[:1], 'taken').status_code, 409)
+        ShowSeat.objects.filter(pk=self.seat_ids[0]).update(status='AVAILABLE')
+        self.assertEqual(self.post_checkout(self.seat_ids[:1], 'taken').status_code, 409)
+
+        with self.settings(PAYMENT_GATEWAY='bookings.tests.BrokenGateway'):
+            gateways._gateway = None
+            with self.assertRaises(gateways.GatewayError):
+                self.post_checkout(self.seat_ids[1:2], 'broken')
+        gateways._gateway = None
+        # Run again, not replayed; the first try's booking holds the seat
+        retry = self.post_checkout(self.seat_ids[1:2], 'broken')
+        self.assertEqual(retry.status_code, 409)
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+
+    def test_payment_retries(self):
+        booking = checkout(self.customer, self.show.id, self.seat_ids[:1])
+        pay = lambda: self.client.post(f'/api/payments/{booking.payment.id}/pay/', HTTP_IDEMPOTENCY_KEY='p1')
+        self.assertEqual(pay().status_code, 202)
+        retry = pay()
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (202, 'true'))
+        # Anonymous requests are not keyed
+        body, headers = gateways.get_gateway().pay(booking.payment.reference)
+        response = APIClient().post('/api/payments/callback/', body, content_type='application/json',
+                                    HTTP_X_SIGNATURE=headers['X-Signature'], HTTP_IDEMPOTENCY_KEY='p1')
+        self.assertEqual((response.status_code, response.has_header('Idempotent-Replayed')), (409, False))
+
+    def test_database_store(self):
+        store = idempotency.DatabaseIdempotencyStore()
+        self.assertIsNone(store.begin('k', 'fp', 0, 60))
+        with self.assertRaises(idempotency.StillInProgress):
+            store.begin('k', 'fp', 0, 60)
+        with self.assertRaises(idempotency.KeyReused):
+            store.begin('k', 'other', 0, 60)
+        store.finish('k', 'fp', (201, b'{}', [('Content-Type', 'application/json')]), 60)
+        self.assertEqual(store.begin('k', 'fp', 0, 60), (201, b'{}', [('Content-Type', 'application/json')]))
+
+        # A request that died holds its key until the lock runs out
+        self.assertIsNone(store.begin('dead', 'fp', 0, 60))
+        IdempotencyKey.objects.filter(status_code__isnull=True).update(expires_at=timezone.now())
+        self.assertIsNone(store.begin('dead', 'fp', 0, 60))
+        store.finish('dead', 'fp', None, 60)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertEqual(idempotency.delete_expired(timezone.now() + timedelta(seconds=61)), 1)
+
+    def test_concurrent_retries_wait_for_the_first(self):
+        store = idempotency.LocalIdempotencyStore()
+        self.assertIsNone(store.begin('k', 'fp', 5, 60))
+        results = []
+        waiters = [threading.Thread(target=lambda: results.append(store.begin('k', 'fp', 5, 60))) for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        store.finish('k', 'fp', (201, b'{}', []), 60)
+        for waiter in waiters:
+            waiter.join()
+        self.assertEqual(results, [(201, b'{}', [])] * 3)
+
+        self.assertIsNone(store.begin('slow', 'fp', 0, 60))
+        with self.assertRaises(idempotency.StillInProgress):
+            store.begin('slow', 'fp', 0, 60)
+        # A first request that failed gives its key up to the next try
+        store.finish('slow', 'fp', None, 60)
+        self.assertIsNone(store.begin('slow', 'fp', 0, 60))
+
+
+@override_settings(BOOKING_PENDING_TTL_SECONDS=60)
+class SweeperTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.show = make_show(owner, seats=6)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+
+    def pending_booking(self, seat_ids, age):
+        ShowSeat.objects.filter(id__in=seat_ids).update(status='BOOKED')
+        booking = Booking.objects.create(user=self.customer, show=self.show, total_amount=250 * len(seat_ids))
+        booking.seats.set(seat_ids)
+        # booking_date is auto_now_add, and the rollup is keyed by day only
+        Booking.objects.filter(pk=booking.pk).update(booking_date=timezone.now() - age)
+        return booking
+
+    def test_releases_expired_holds_in_batches(self):
+        holds.hold_seats(self.show.id, self.seat_ids[:3], self.customer, ttl=timedelta(seconds=-1))
+        holds.hold_seats(self.show.id, self.seat_ids[3:4], self.customer)
+
+        self.assertEqual(holds.release_expired(batch_size=2), 3)
+        self.assertEqual(
+            dict(ShowSeat.objects.filter(show=self.show).values_list('status').annotate(n=models.Count('id'))),
+            {'AVAILABLE': 5, 'LOCKED': 1},
+        )
+
+    def test_cancels_stale_pending_bookings(self):
+        stale = self.pending_booking(self.seat_ids[:2], timedelta(minutes=2))
+        fresh = self.pending_booking(self.seat_ids[2:3], timedelta(seconds=10))
+
+        with self.assertLogs('bookings.sweeper'):
+            result = sweeper.sweep()
+
+        self.assertEqual((result['bookings_cancelled'], result['booking_seats_released']), (1, 2))
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), ('CANCELLED', 'PENDING'))
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 1)
+        rollups = dict(DailyRevenueRollup.objects.values_list('status', 'booking_count'))
+        self.assertEqual(rollups, {'PENDING': 1, 'CANCELLED': 1})
+
+
+class DatasetGeneratorTests(TestCase):
+    def test_generates_consistent_bookings(self):
+        counts = dataset.generate(
+            cities=1, theatres_per_city=1, screens_per_theatre=2, layouts=((3, 4), (2, 5)), days=2,
+            shows_per_day=2, movies=2, users=3, fill_rate=0.5, start=date.today() - timedelta(days=1),
+        )
+
+        self.assertEqual(counts['shows'], 8)
+        self.assertEqual(counts['show_seats'], ShowSeat.objects.count())
+        self.assertEqual(ShowSeat.objects.count(), 2 * 2 * (12 + 10))
+        self.assertEqual(
+            ShowSeat.objects.filter(status='BOOKED').count(),
+            ShowSeat.objects.filter(booking__status='CONFIRMED').count(),
+        )
+        for booking in Booking.objects.annotate(seat_total=Sum('seats__price')):
+            self.assertEqual(booking.total_amount, booking.seat_total)
+        generated = set(DailyRevenueRollup.objects.values_list('date', 'theatre', 'movie', 'status', 'booking_count', 'amount'))
+        rollup.rebuild()
+        self.assertEqual(generated, set(DailyRevenueRollup.objects.values_list(
+            'date', 'theatre', 'movie', 'status', 'booking_count', 'amount')))
+
+        with self.assertRaises(dataset.DatasetExists):
+            dataset.generate(cities=1, theatres_per_city=1, screens_per_theatre=1, days=1, shows_per_day=1,
+                             movies=1, users=1)
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    def test_no_oversell_under_concurrent_checkouts(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        buyers = [CustomUser.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pw') for i in range(8)]
+        show = make_show(owner, seats=4)
+        seat_ids = list(ShowSeat.objects.filter(show=show).values_list('id', flat=True))
+        start = threading.Barrier(len(buyers))
+        outcomes = []
+
+        def buy(user):
+            try:
+                start.wait()
+                for _ in range(500):
+                    try:
+                        checkout(user, show.id, seat_ids[:2])
+                        outcomes.append('booked')
+                        return
+                    except holds.SeatUnavailable:
+                        outcomes.append('rejected')
+                        return
+                    except OperationalError:
+                        # The test database (in-memory SQLite, shared cache) fails on a
+                        # table lock instead of waiting for it; the transaction rolled back
+                        sleep(0.01)
+                outcomes.append('gave up')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Every loser got as far as the conditional UPDATE and found the seats taken
+        self.assertEqual(sorted(outcomes), ['booked'] + ['rejected'] * (len(buyers) - 1))
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(Booking.seats.through.objects.count(), 2)
+        self.assertEqual(ShowSeat.objects.filter(status='BOOKED').count(), 2)
+
+
+class SeatHoldConcurrencyTests(TransactionTestCase):
+    def test_racing_holders_get_all_seats_or_none(self):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        show = make_show(owner, seats=8)
+        seat_ids = list(ShowSeat.objects.filter(show=show).order_by('id').values_list('id', flat=True))
+        start = threading.Barrier(7)
+        tokens, rejected = [], []
+
+        def hold(extra):
+            try:
+                start.wait()
+                for _ in range(500):
+                    try:
+                        # Everyone wants the first seat, and one seat of their own
+                        tokens.append((holds.hold_seats(show.id, [seat_ids[0], extra], customer)[0], extra))
+                        return
+                    except holds.SeatUnavailable as exc:
+                        rejected.append(exc.seat_ids)
+                        return
+                    except OperationalError:
+                        # See CheckoutConcurrencyTests
+                        sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hold, args=(seat_id,)) for seat_id in seat_ids[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(rejected, [[seat_ids[0]]] * 6)
+        token, extra = tokens[0]
+        locked = ShowSeat.objects.filter(status='LOCKED').values_list('id', 'hold_token')
+        self.assertEqual(sorted(locked), sorted([(seat_ids[0], token), (extra, token)]))
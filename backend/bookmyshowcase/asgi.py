@@ -0,0 +1,21 @@
+import os
+try:
+    import pymysql
+    pymysql.install_as_MySQLdb()
+    import MySQLdb
+    MySQLdb.version_info = (2, 2, 2, 'final', 0)
+    MySQLdb.version = '2.2.2'
+except ImportError:
+    pass
+
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyshowcase.settings')
+
+application = get_asgi_application()
+
+# The in-process sweeper and payments worker, when enabled
+from bookmyshowcase import background  # noqa: E402
+
+background.start()
@@ -0,0 +1,101 @@
+"""
+Async versions of the hottest read endpoints.
+
+These are plain Django async views using the async ORM, mounted under
+/api/async/. Served through bookmyshowcase.asgi they never occupy a worker
+thread while waiting on the database; under WSGI they still work, Django
+just runs them in an event loop per request.
+
+Responses are flat JSON lists with keyset pagination (?after=<last id>)
+rather than the DRF serializers, which are sync-only.
+"""
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+
+from movies.models import Movie
+from seats import availability, events
+from shows.models import Show
+
+MAX_PAGE_SIZE = 100
+
+
+def _page(request, queryset, default_size=20):
+    try:
+        size = min(int(request.GET.get('page_size', default_size)), MAX_PAGE_SIZE)
+        after = request.GET.get('after')
+        if after:
+            queryset = queryset.filter(id__gt=int(after))
+    except ValueError:
+        raise ValidationError("page_size and after must be integers")
+    return queryset.order_by('id')[:max(size, 1)]
+
+
+def _bad_request(exc):
+    return JsonResponse({'error': ' '.join(exc.messages)}, status=400)
+
+
+async def movie_list(request):
+    movies = Movie.objects.all()
+    if request.GET.get('language'):
+        movies = movies.filter(language__iexact=request.GET['language'])
+    if request.GET.get('genre'):
+        movies = movies.filter(genre__icontains=request.GET['genre'])
+    try:
+        page = _page(request, movies)
+    except ValidationError as exc:
+        return _bad_request(exc)
+    results = [
+        movie async for movie in page.values(
+            'id', 'title', 'language', 'genre', 'duration_minutes', 'release_date', 'rating', 'poster_image',
+        )
+    ]
+    return JsonResponse({'results': results})
+
+
+async def show_list(request):
+    shows = Show.objects.all()
+    filters = {'movie': 'movie_id', 'theatre': 'screen__theatre_id', 'city': 'screen__theatre__city__lower', 'date': 'date'}
+    try:
+        for param, lookup in filters.items():
+            if request.GET.get(param):
+                value = request.GET[param]
+                shows = shows.filter(**{lookup: value.lower() if param == 'city' else value})
+        page = _page(request, shows)
+        results = [
+            show async for show in page.values(
+                'id', 'date', 'time', 'price', 'movie_id', 'movie__title',
+                'screen_id', 'screen__name', 'screen__theatre_id', 'screen__theatre__name',
+            )
+        ]
+    except ValidationError as exc:
+        return _bad_request(exc)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid filter value'}, status=400)
+    return JsonResponse({'results': results})
+
+
+async def seat_availability(request, pk):
+    entry = await availability.aget_availability(pk)
+    if not entry.status and not await Show.objects.filter(pk=pk).aexists():
+        raise Http404
+    include = request.GET.get('include', '').split(',')
+    return JsonResponse(entry.as_dict(include_ids='ids' in include, include_layout='layout' in include))
+
+
+async def seat_events(request, pk):
+    """Server-sent seat status deltas, see seats.events. Under WSGI, only the events so far."""
+    since = request.GET.get('since') or request.headers.get('Last-Event-ID', '')
+    if since and not since.isdigit():
+        return JsonResponse({'error': 'since must be a non-negative integer'}, status=400)
+    if not await Show.objects.filter(pk=pk).aexists():
+        raise Http404
+    since = int(since) if since else None
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(events.astream(pk, since), content_type='text/event-stream')
+    else:
+        # Django would drive the stream from a sync worker for its whole length
+        response = HttpResponse(await events.asnapshot(pk, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
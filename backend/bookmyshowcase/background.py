@@ -0,0 +1,25 @@
+"""
+Background threads of the web server process.
+
+With SWEEPER_IN_PROCESS or PAYMENTS_WORKER_IN_PROCESS set, the expiry
+sweeper (bookings.sweeper) and the payments worker (payments.jobs) run on
+daemon threads of the server itself. start() is called from the WSGI and
+ASGI entry points only, not from AppConfig.ready(), so management commands
+(migrate, test, shell) never start them.
+
+Every server process that loads the entry point starts its own threads.
+Both jobs are safe to run concurrently, but with several workers (gunicorn
+-w N) leave the flags off and run ``manage.py sweep_expired_holds --loop``
+and ``manage.py process_payments --loop`` once instead.
+"""
+from django.conf import settings
+
+
+def start():
+    from bookings import sweeper
+    from payments import jobs
+
+    if getattr(settings, 'SWEEPER_IN_PROCESS', False):
+        sweeper.start_in_process()
+    if getattr(settings, 'PAYMENTS_WORKER_IN_PROCESS', False):
+        jobs.start_in_process()
@@ -0,0 +1,138 @@
+"""
+Response caching for the catalog viewsets.
+
+Every cached response is keyed on the request path and the version numbers
+of the data it was built from. A version is the time (in ms) of the last
+change, kept in Django's cache:
+
+* ``<namespace>``        changes on any save/delete in that namespace and
+                         invalidates list responses;
+* ``<namespace>:<pk>``   changes when that object changes and invalidates
+                         its detail response.
+
+Model signals call ``changed()`` (see the apps' ``signals`` modules), so an
+edit to one movie drops that movie's detail page and the movie lists, and
+nothing else. The versions move when the edit commits: a reader in between
+still sees the old rows, and caches them under the old version. Because
+keys embed versions, nothing is ever deleted: stale entries simply stop
+being read and age out.
+
+The ETag is derived from the key, and Last-Modified from the newest
+version, so conditional requests are answered with a 304 before the view
+or the cached body is touched. Last-Modified has one-second resolution, so
+it is left out while the newest version is from the current second: an
+edit later in that second would not change it.
+
+Versions must be seen by every process, or one process keeps answering
+from (and with 304s for) data another has changed. With a per-process
+cache (LocMemCache) CATALOG_CACHE_ENABLED therefore defaults to off.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _version_key(name):
+    return f'catalog-version:{name}'
+
+
+def versions(*names):
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), None)
+            version = cache.get(key)
+        result.append(version)
+    return result
+
+
+def changed(namespace, pk=None):
+    """Move the versions of ``namespace`` (and of its object ``pk``) once the current transaction commits."""
+    names = [namespace] if pk is None else [namespace, f'{namespace}:{pk}']
+    transaction.on_commit(lambda: _bump(names))
+
+
+def _bump(names):
+    now = int(time.time() * 1000)
+    current = cache.get_many([_version_key(name) for name in names])
+    cache.set_many({
+        _version_key(name): max(now, current.get(_version_key(name), 0) + 1)
+        for name in names
+    }, None)
+
+
+class CachedResponseMixin:
+    """
+    Cache list and retrieve responses of a viewset.
+
+    ``cache_namespace`` names the viewset's own data; ``cache_depends``
+    lists other namespaces embedded in its responses (e.g. shows nest their
+    movie), any change in which invalidates every response of this viewset.
+    """
+    cache_namespace = None
+    cache_depends = ()
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOG_CACHE_ENABLED', True):
+            return super().list(request, *args, **kwargs)
+        names = [self.cache_namespace, *self.cache_depends]
+        return self._cached_response(request, names, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOG_CACHE_ENABLED', True):
+            return super().retrieve(request, *args, **kwargs)
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        names = [f'{self.cache_namespace}:{pk}', *self.cache_depends]
+        return self._cached_response(request, names, super().retrieve, *args, **kwargs)
+
+    def _cached_response(self, request, names, handler, *args, **kwargs):
+        data_versions = versions(*names)
+        fingerprint = '|'.join([
+            request.get_host(),
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            *map(str, data_versions),
+        ])
+        digest = hashlib.md5(fingerprint.encode()).hexdigest()
+        etag = f'"{digest}"'
+        last_modified = max(data_versions) // 1000
+
+        if self._not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'catalog-response:{digest}'
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600))
+            else:
+                response = Response(data)
+
+        response['ETag'] = etag
+        if last_modified < int(time.time()):
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+
+    @staticmethod
+    def _not_modified(request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return (
+            if_modified_since is not None
+            and last_modified <= if_modified_since
+            and last_modified < int(time.time())
+        )
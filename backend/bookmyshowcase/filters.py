@@ -0,0 +1,28 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class QueryParamFilter(BaseFilterBackend):
+    """
+    Filter list endpoints on the query parameters a view declares.
+
+    Views map parameter names to ORM lookups, e.g.
+    ``filter_params = {'movie': 'movie_id'}``; only declared (and indexed)
+    lookups can be filtered on. A lookup may come with a function that
+    cleans the value first, e.g. ``('city__lower', str.lower)``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        for param, lookup in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            if isinstance(lookup, tuple):
+                lookup, clean = lookup
+                value = clean(value)
+            try:
+                queryset = queryset.filter(**{lookup: value})
+            except (ValueError, DjangoValidationError):
+                raise ValidationError({param: [f"Invalid value: {value}"]})
+        return queryset
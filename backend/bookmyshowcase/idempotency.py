@@ -0,0 +1,291 @@
+"""
+Idempotency-Key handling for unsafe requests.
+
+Clients on flaky networks retry POSTs they never saw an answer to. An
+authenticated request that carries an Idempotency-Key header is run once
+per (user, key). The first response is stored for IDEMPOTENCY_TTL_SECONDS.
+Retries get it back without the view running again, marked with
+"Idempotent-Replayed: true". Anonymous requests are not keyed: there is no
+client identity to scope the key to that the client cannot change at will.
+
+- A retry that arrives while the first request is still running waits for
+  its response, up to IDEMPOTENCY_WAIT_SECONDS, and then gets a 409.
+- Reusing a key for a different request (another path or body) gets a 422.
+- 5xx and 429 responses are not stored, so the request can be retried.
+
+The key is taken after authentication and permissions but before the
+throttles, so replays do not use up the client's rate.
+
+Keys live in a store chosen by IDEMPOTENCY_BACKEND:
+
+- DatabaseIdempotencyStore (the default) keeps them in the
+  bookings.IdempotencyKey table, shared by every process. The first request
+  takes its key by inserting the row (the key is unique); retries poll the
+  row for its response. bookings.sweeper deletes expired rows.
+- CacheIdempotencyStore keeps them in Django's cache, which works the same
+  way as long as the cache is shared (Redis, Memcached), not LocMemCache.
+- LocalIdempotencyStore keeps them in process memory. Only retries that
+  reach the same worker process are coalesced or replayed, so it is only
+  fit for a single process (tests, runserver).
+
+An unfinished request holds its key for IDEMPOTENCY_LOCK_SECONDS at most,
+in case its process dies mid-request.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, status
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Response headers that are stored and replayed along with the body
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+
+class KeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = f"This {HEADER} was used for a different request."
+    default_code = 'idempotency_key_reused'
+
+
+class StillInProgress(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = f"A request with this {HEADER} is still in progress."
+    default_code = 'idempotency_key_in_progress'
+
+
+class _Replay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class LocalIdempotencyStore:
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        # key -> (fingerprint, stored response or None while in flight, expires)
+        self._entries = OrderedDict()
+        self._changed = threading.Condition()
+
+    def begin(self, key, fingerprint, wait, lock):
+        """
+        Take ``key`` for a new request (returns None), or return the stored
+        response of the request that took it. Raises KeyReused or
+        StillInProgress.
+        """
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                entry = self._entries.get(key)
+                if entry is None or entry[2] <= now:
+                    self._entries[key] = (fingerprint, None, now + lock)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                    return None
+                if entry[0] != fingerprint:
+                    raise KeyReused()
+                if entry[1] is not None:
+                    return entry[1]
+                if now >= deadline:
+                    raise StillInProgress()
+                self._changed.wait(deadline - now)
+
+    def finish(self, key, fingerprint, stored, ttl):
+        """Store the response for ``key``, or with ``stored`` None give the key up."""
+        with self._changed:
+            if stored is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (fingerprint, stored, time.monotonic() + ttl)
+                self._entries.move_to_end(key)
+            self._changed.notify_all()
+
+    def reset(self):
+        with self._changed:
+            self._entries.clear()
+
+
+class CacheIdempotencyStore:
+    key_prefix = 'idempotency'
+    poll_interval = 0.05
+
+    def begin(self, key, fingerprint, wait, lock):
+        cache_key = f'{self.key_prefix}:{key}'
+        deadline = time.monotonic() + wait
+        while True:
+            if cache.add(cache_key, (fingerprint, None), lock):
+                return None
+            entry = cache.get(cache_key)
+            if entry is None:
+                # Given up or expired between the add() and the get()
+                continue
+            if entry[0] != fingerprint:
+                raise KeyReused()
+            if entry[1] is not None:
+                return entry[1]
+            if time.monotonic() >= deadline:
+                raise StillInProgress()
+            time.sleep(self.poll_interval)
+
+    def finish(self, key, fingerprint, stored, ttl):
+        cache_key = f'{self.key_prefix}:{key}'
+        if stored is None:
+            cache.delete(cache_key)
+        else:
+            cache.set(cache_key, (fingerprint, stored), ttl)
+
+    def reset(self):
+        # Cache entries expire on their own; nothing to clear per process
+        pass
+
+
+class DatabaseIdempotencyStore:
+    poll_interval = 0.05
+
+    def begin(self, key, fingerprint, wait, lock):
+        from bookings.models import IdempotencyKey
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        deadline = time.monotonic() + wait
+        while True:
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(key=digest, fingerprint=fingerprint, expires_at=now + timedelta(seconds=lock))
+                return None
+            except IntegrityError:
+                pass
+            entry = IdempotencyKey.objects.filter(key=digest).first()
+            if entry is None:
+                # Given up between the insert and the read
+                continue
+            if entry.expires_at <= now:
+                # Expired, or its request died: take it over, unless another retry just did
+                taken = IdempotencyKey.objects.filter(pk=entry.pk, expires_at=entry.expires_at).update(
+                    fingerprint=fingerprint, status_code=None, content=None, headers=[],
+                    expires_at=now + timedelta(seconds=lock),
+                )
+                if taken:
+                    return None
+                continue
+            if entry.fingerprint != fingerprint:
+                raise KeyReused()
+            if entry.status_code is not None:
+                return entry.status_code, bytes(entry.content), [tuple(header) for header in entry.headers]
+            if time.monotonic() >= deadline:
+                raise StillInProgress()
+            time.sleep(self.poll_interval)
+
+    def finish(self, key, fingerprint, stored, ttl):
+        from bookings.models import IdempotencyKey
+        entries = IdempotencyKey.objects.filter(key=hashlib.sha256(key.encode()).hexdigest(), fingerprint=fingerprint)
+        if stored is None:
+            entries.filter(status_code__isnull=True).delete()
+        else:
+            status_code, content, headers = stored
+            entries.update(
+                status_code=status_code, content=content, headers=[list(header) for header in headers],
+                expires_at=timezone.now() + timedelta(seconds=ttl),
+            )
+
+    def reset(self):
+        # Rows expire on their own (bookings.sweeper deletes them)
+        pass
+
+
+def delete_expired(now=None):
+    """Delete expired keys of DatabaseIdempotencyStore; returns how many."""
+    from bookings.models import IdempotencyKey
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=now or timezone.now()).delete()
+    return deleted
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'IDEMPOTENCY_BACKEND', 'bookmyshowcase.idempotency.DatabaseIdempotencyStore')
+        _backend = import_string(path)()
+    return _backend
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def storable(response):
+    return (
+        not response.streaming
+        and response.status_code < 500
+        and response.status_code != status.HTTP_429_TOO_MANY_REQUESTS
+    )
+
+
+def replay(stored):
+    status_code, content, headers = stored
+    response = HttpResponse(content, status=status_code)
+    for name, value in headers:
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotentMixin:
+    """Run unsafe requests of a viewset at most once per Idempotency-Key."""
+    idempotent_methods = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+    def dispatch(self, request, *args, **kwargs):
+        self._idempotency = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # The view raised past finalize_response(): let a retry run it again
+            if self._idempotency is not None:
+                get_backend().finish(*self._idempotency, None, 0)
+
+    def check_throttles(self, request):
+        key = request.headers.get(HEADER)
+        if key is not None and request.method in self.idempotent_methods and request.user.is_authenticated:
+            if not key or len(key) > MAX_KEY_LENGTH:
+                raise exceptions.ValidationError({HEADER: f"Must be 1 to {MAX_KEY_LENGTH} characters."})
+            key = f'user:{request.user.pk}:{key}'
+            request_fingerprint = fingerprint(request)
+            stored = get_backend().begin(
+                key, request_fingerprint,
+                getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10), getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60),
+            )
+            if stored is not None:
+                raise _Replay(replay(stored))
+            self._idempotency = (key, request_fingerprint)
+        super().check_throttles(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Replay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self._idempotency is not None:
+            stored = None
+            if storable(response):
+                if hasattr(response, 'render'):
+                    response.render()
+                headers = [(name, response[name]) for name in REPLAYED_HEADERS if response.has_header(name)]
+                stored = (response.status_code, response.content, headers)
+            get_backend().finish(*self._idempotency, stored, getattr(settings, 'IDEMPOTENCY_TTL_SECONDS', 86400))
+            self._idempotency = None
+        return response
@@ -1,14 +1,16 @@
 from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, F, Value
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from theatres.models import Theatre, Screen
 from shows.models import Show
-from bookings.models import Booking
+from bookings.models import Booking, DailyRevenueRollup
 from movies.models import Movie
 from users.models import CustomUser
+from users.permissions import IsAdmin, IsTheatreOwner
 from .serializers import TheatreSerializer, ShowSerializer, BookingSerializer
 
 
@@ -20,19 +22,20 @@ class DashboardStatsView(views.APIView):
         is_admin = user.is_staff or user.is_superuser
         is_theatre_owner = user.is_theatre_owner
         
-        # Base queries
+        # Base queries. Admins and owners read the daily rollup, customers
+        # only have a handful of bookings and read them directly.
         if is_admin:
             # Admin sees everything
             theatres = Theatre.objects.all()
             shows = Show.objects.all()
-            bookings = Booking.objects.all()
+            bookings = DailyRevenueRollup.objects.all()
             users = CustomUser.objects.all()
             movies = Movie.objects.all()
         elif is_theatre_owner:
             # Theatre owner sees only their data
             theatres = Theatre.objects.filter(owner=user)
             shows = Show.objects.filter(screen__theatre__owner=user)
-            bookings = Booking.objects.filter(show__screen__theatre__owner=user)
+            bookings = DailyRevenueRollup.objects.filter(theatre__owner=user)
             users = None
             movies = Movie.objects.all()
         else:
@@ -48,23 +51,48 @@ class DashboardStatsView(views.APIView):
         this_month_start = today.replace(day=1)
         last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
         last_month_end = this_month_start - timedelta(days=1)
-        
+        week_start = today - timedelta(days=6)
+
+        # Give rollup rows and raw bookings the same shape: day, count, amount
+        if bookings.model is DailyRevenueRollup:
+            bookings = bookings.annotate(day=F('date'), rows_count=F('booking_count'), rows_amount=F('amount'))
+        else:
+            bookings = bookings.annotate(day=TruncDate('booking_date'), rows_count=Value(1), rows_amount=F('total_amount'))
+
+        # Every booking figure comes from one conditional aggregate
+        confirmed = Q(status='CONFIRMED')
+        totals = bookings.aggregate(
+            total=Sum('rows_count'),
+            pending=Sum('rows_count', filter=Q(status='PENDING')),
+            confirmed=Sum('rows_count', filter=confirmed),
+            cancelled=Sum('rows_count', filter=Q(status='CANCELLED')),
+            today=Sum('rows_count', filter=Q(day=today)),
+            this_month=Sum('rows_count', filter=Q(day__gte=this_month_start)),
+            revenue=Sum('rows_amount', filter=confirmed),
+            revenue_today=Sum('rows_amount', filter=confirmed & Q(day=today)),
+            revenue_this_month=Sum('rows_amount', filter=confirmed & Q(day__gte=this_month_start)),
+            revenue_last_month=Sum('rows_amount', filter=confirmed & Q(day__gte=last_month_start, day__lte=last_month_end)),
+        )
+        totals = {key: value or 0 for key, value in totals.items()}
+
         # Chart Data: Last 7 days sales
+        sales_by_day = dict(
+            bookings.filter(confirmed, day__gte=week_start)
+            .order_by()
+            .values('day')
+            .annotate(sales=Sum('rows_amount'))
+            .values_list('day', 'sales')
+        )
         daily_sales = []
         for i in range(6, -1, -1):
             date = today - timedelta(days=i)
-            day_label = date.strftime('%a')
-            amount = float(bookings.filter(
-                status='CONFIRMED',
-                booking_date__date=date
-            ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0)
-            daily_sales.append({'name': day_label, 'sales': amount})
+            daily_sales.append({'name': date.strftime('%a'), 'sales': float(sales_by_day.get(date) or 0)})
 
         # Pie Data: Booking status distribution or source (simulated)
         pie_data = [
-            {'name': 'Confirmed', 'value': bookings.filter(status='CONFIRMED').count(), 'color': '#2ed8b6'},
-            {'name': 'Pending', 'value': bookings.filter(status='PENDING').count(), 'color': '#ffb64d'},
-            {'name': 'Cancelled', 'value': bookings.filter(status='CANCELLED').count(), 'color': '#ff5370'},
+            {'name': 'Confirmed', 'value': totals['confirmed'], 'color': '#2ed8b6'},
+            {'name': 'Pending', 'value': totals['pending'], 'color': '#ffb64d'},
+            {'name': 'Cancelled', 'value': totals['cancelled'], 'color': '#ff5370'},
         ]
 
         # Simulated Notifications
@@ -76,34 +104,24 @@ class DashboardStatsView(views.APIView):
         
         stats = {
             'overview': {
-                'total_theatres': theatres.count() if theatres else 0,
-                'total_shows': shows.count() if shows else 0,
-                'total_bookings': bookings.count() if bookings else 0,
-                'total_revenue': float(bookings.filter(status='CONFIRMED').aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-                'total_users': users.count() if users else 0,
-                'total_movies': movies.count() if movies else 0,
+                'total_theatres': theatres.count(),
+                'total_shows': shows.count(),
+                'total_bookings': totals['total'],
+                'total_revenue': float(totals['revenue']),
+                'total_users': users.count() if users is not None else 0,
+                'total_movies': movies.count(),
             },
             'revenue': {
-                'today': float(bookings.filter(
-                    status='CONFIRMED',
-                    booking_date__date=today
-                ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-                'this_month': float(bookings.filter(
-                    status='CONFIRMED',
-                    booking_date__date__gte=this_month_start
-                ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-                'last_month': float(bookings.filter(
-                    status='CONFIRMED',
-                    booking_date__date__gte=last_month_start,
-                    booking_date__date__lte=last_month_end
-                ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
+                'today': float(totals['revenue_today']),
+                'this_month': float(totals['revenue_this_month']),
+                'last_month': float(totals['revenue_last_month']),
             },
             'bookings': {
-                'today': bookings.filter(booking_date__date=today).count(),
-                'this_month': bookings.filter(booking_date__date__gte=this_month_start).count(),
-                'pending': bookings.filter(status='PENDING').count(),
-                'confirmed': bookings.filter(status='CONFIRMED').count(),
-                'cancelled': bookings.filter(status='CANCELLED').count(),
+                'today': totals['today'],
+                'this_month': totals['this_month'],
+                'pending': totals['pending'],
+                'confirmed': totals['confirmed'],
+                'cancelled': totals['cancelled'],
             },
             'charts': {
                 'sales_history': daily_sales,
@@ -121,28 +139,30 @@ class DashboardStatsView(views.APIView):
 
 
 class TheatreOwnerDashboardView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsTheatreOwner]
     
     def get(self, request):
-        if not request.user.is_theatre_owner:
-            return Response({'error': 'Only theatre owners can access this'}, status=status.HTTP_403_FORBIDDEN)
-        
         user = request.user
-        theatres = Theatre.objects.filter(owner=user)
-        shows = Show.objects.filter(screen__theatre__owner=user)
+        theatres = TheatreSerializer.setup_eager_loading(Theatre.objects.filter(owner=user))
         bookings = Booking.objects.filter(show__screen__theatre__owner=user)
         
         # Recent bookings
-        recent_bookings = bookings.order_by('-booking_date')[:10]
+        recent_bookings = BookingSerializer.setup_eager_loading(bookings.order_by('-booking_date'))[:10]
         
         # Top performing theatres
+        totals_by_theatre = {
+            row['theatre']: row
+            for row in DailyRevenueRollup.objects.filter(theatre__owner=user)
+            .values('theatre')
+            .annotate(total_bookings=Sum('booking_count'), total_revenue=Sum('amount', filter=Q(status='CONFIRMED')))
+        }
         theatre_stats = []
         for theatre in theatres:
-            theatre_bookings = bookings.filter(show__screen__theatre=theatre)
+            totals = totals_by_theatre.get(theatre.id, {})
             theatre_stats.append({
                 'theatre': TheatreSerializer(theatre).data,
-                'total_bookings': theatre_bookings.count(),
-                'total_revenue': float(theatre_bookings.filter(status='CONFIRMED').aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
+                'total_bookings': totals.get('total_bookings') or 0,
+                'total_revenue': float(totals.get('total_revenue') or 0),
             })
         theatre_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
         
@@ -154,33 +174,35 @@ class TheatreOwnerDashboardView(views.APIView):
 
 
 class AdminDashboardView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAdmin]
     
     def get(self, request):
-        if not (request.user.is_staff or request.user.is_superuser):
-            return Response({'error': 'Only admins can access this'}, status=status.HTTP_403_FORBIDDEN)
-        
         # Recent bookings
-        recent_bookings = Booking.objects.order_by('-booking_date')[:10]
+        recent_bookings = BookingSerializer.setup_eager_loading(Booking.objects.order_by('-booking_date'))[:10]
         
         # Top theatres by revenue
-        theatres = Theatre.objects.annotate(
-            revenue=Sum('screens__shows__booking__total_amount', filter=Q(screens__shows__booking__status='CONFIRMED'))
-        ).order_by('-revenue')[:10]
+        top_theatres = list(
+            DailyRevenueRollup.objects.values('theatre')
+            .annotate(revenue=Sum('amount', filter=Q(status='CONFIRMED')))
+            .order_by(F('revenue').desc(nulls_last=True))[:10]
+        )
+        theatres_by_id = TheatreSerializer.setup_eager_loading(Theatre.objects.all()).in_bulk([row['theatre'] for row in top_theatres])
         
         # Top movies by bookings
-        movies = Movie.objects.annotate(
-            booking_count=Count('shows__booking')
-        ).order_by('-booking_count')[:10]
+        movies = (
+            DailyRevenueRollup.objects.values('movie', 'movie__title')
+            .annotate(booking_count=Sum('booking_count'))
+            .order_by('-booking_count')[:10]
+        )
         
         return Response({
             'recent_bookings': BookingSerializer(recent_bookings, many=True).data,
             'top_theatres': [{
-                'theatre': TheatreSerializer(t).data,
-                'revenue': float(t.revenue or 0),
-            } for t in theatres],
+                'theatre': TheatreSerializer(theatres_by_id[row['theatre']]).data,
+                'revenue': float(row['revenue'] or 0),
+            } for row in top_theatres],
             'top_movies': [{
-                'movie': {'id': m.id, 'title': m.title},
-                'booking_count': m.booking_count,
-            } for m in movies],
+                'movie': {'id': row['movie'], 'title': row['movie__title']},
+                'booking_count': row['booking_count'],
+            } for row in movies],
         })
@@ -0,0 +1,160 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+RequestMetricsMiddleware (bookmyshowcase.middleware) feeds ``registry`` for
+every request; /api/_metrics renders it. Counters live in process memory,
+so under gunicorn each worker reports its own totals. Scrape every worker,
+or treat one scrape as a sample, as is usual for per-process exporters.
+
+Other components export their own numbers by adding a callable to
+``collectors``: it returns ``(name, type, help, value)`` tuples.
+"""
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+collectors = []
+
+
+class _ViewStats:
+    __slots__ = (
+        'statuses', 'buckets', 'duration_sum', 'count', 'bytes_sum', 'bytes_count',
+        'sampled', 'queries', 'duplicates', 'db_seconds',
+    )
+
+    def __init__(self):
+        self.statuses = defaultdict(int)
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.duration_sum = 0.0
+        self.count = 0
+        self.bytes_sum = 0
+        self.bytes_count = 0
+        self.sampled = 0
+        self.queries = 0
+        self.duplicates = 0
+        self.db_seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(_ViewStats)
+
+    def observe_request(self, view, method, status, seconds, response_bytes=None):
+        with self._lock:
+            stats = self._views[view, method]
+            stats.statuses[status] += 1
+            stats.count += 1
+            stats.duration_sum += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+            if response_bytes is not None:
+                stats.bytes_sum += response_bytes
+                stats.bytes_count += 1
+
+    def observe_queries(self, view, method, queries, duplicates, db_seconds):
+        with self._lock:
+            stats = self._views[view, method]
+            stats.sampled += 1
+            stats.queries += queries
+            stats.duplicates += duplicates
+            stats.db_seconds += db_seconds
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+
+            def family(name, kind, help_text, samples):
+                lines.append(f'# HELP bookmyshowcase_{name} {help_text}')
+                lines.append(f'# TYPE bookmyshowcase_{name} {kind}')
+                lines.extend(f'bookmyshowcase_{sample}' for sample in samples)
+
+            family('http_requests_total', 'counter', 'Requests by view, method and status.', [
+                f'http_requests_total{{{_labels(view, method)},status="{code}"}} {n}'
+                for (view, method), stats in views for code, n in sorted(stats.statuses.items())
+            ])
+            samples = []
+            for (view, method), stats in views:
+                labels = _labels(view, method)
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += n
+                    samples.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                samples.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                samples.append(f'http_request_duration_seconds_sum{{{labels}}} {stats.duration_sum:.6f}')
+                samples.append(f'http_request_duration_seconds_count{{{labels}}} {stats.count}')
+            family('http_request_duration_seconds', 'histogram', 'Wall time of requests.', samples)
+            family('http_response_size_bytes', 'summary', 'Size of non-streaming response bodies.', [
+                sample for (view, method), stats in views for sample in (
+                    f'http_response_size_bytes_sum{{{_labels(view, method)}}} {stats.bytes_sum}',
+                    f'http_response_size_bytes_count{{{_labels(view, method)}}} {stats.bytes_count}',
+                )
+            ])
+            for name, attr, kind, help_text in (
+                ('db_sampled_requests_total', 'sampled', 'counter', 'Requests whose queries were recorded.'),
+                ('db_queries_total', 'queries', 'counter', 'Queries issued by sampled requests.'),
+                ('db_duplicate_queries_total', 'duplicates', 'counter',
+                 'Queries repeating an earlier query (same SQL and parameters) of the same sampled request.'),
+                ('db_seconds_total', 'db_seconds', 'counter', 'Time spent in queries by sampled requests.'),
+            ):
+                family(name, kind, help_text, [
+                    f'{name}{{{_labels(view, method)}}} {_number(getattr(stats, attr))}'
+                    for (view, method), stats in views
+                ])
+
+        for collect in collectors:
+            for name, kind, help_text, value in collect():
+                family(name, kind, help_text, [f'{name} {_number(value)}'])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(view, method):
+    return f'view="{_escape(view)}",method="{method}"'
+
+
+def _number(value):
+    return f'{value:.6f}' if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+def _is_staff(request):
+    from rest_framework.exceptions import AuthenticationFailed
+    from users.authentication import CachedJWTAuthentication
+
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def metrics_view(request):
+    """The registry for scrapers with METRICS_TOKEN, or for staff users when no token is set."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = _is_staff(request)
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,120 @@
+"""
+Per-request timing and query instrumentation.
+
+Every request's wall time, status and response size are counted in
+bookmyshowcase.metrics. A random METRICS_SAMPLE_RATE share of requests
+also wrap the database connection to count queries, DB time and duplicate
+queries (the same SQL with the same parameters, typically an N+1). Only
+sampled requests pay for that wrapper.
+
+Sampled requests get a Server-Timing header. They are logged to
+``bookmyshowcase.requests``, and so is any request slower than
+METRICS_SLOW_REQUEST_MS.
+
+Async views are timed too. Their queries run on a worker thread with its
+own connection, so they are not sampled.
+"""
+import logging
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry
+
+logger = logging.getLogger('bookmyshowcase.requests')
+
+
+class QueryRecorder:
+    """A connection.execute_wrapper that counts and times queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.seen = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.seen[sql, repr(params)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self.seen.values())
+
+    def most_repeated(self):
+        (sql, _), n = self.seen.most_common(1)[0]
+        return sql, n
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.1)
+        self.slow_seconds = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500) / 1000
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if self.sample_rate and random.random() < self.sample_rate:
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        else:
+            recorder = None
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, None)
+        return response
+
+    def record(self, request, response, seconds, recorder):
+        view = _view_name(request)
+        size = None if response.streaming else len(response.content)
+        registry.observe_request(view, request.method, response.status_code, seconds, size)
+        if recorder is not None:
+            registry.observe_queries(view, request.method, recorder.count, recorder.duplicates, recorder.seconds)
+            response['Server-Timing'] = f'app;dur={seconds * 1000:.1f}, db;dur={recorder.seconds * 1000:.1f}'
+
+        if recorder is None and seconds < self.slow_seconds:
+            return
+        fields = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(seconds * 1000, 2),
+            'response_bytes': size,
+        }
+        if recorder is not None:
+            fields.update(queries=recorder.count, db_ms=round(recorder.seconds * 1000, 2))
+            if recorder.duplicates:
+                sql, n = recorder.most_repeated()
+                fields.update(duplicate_queries=recorder.duplicates, most_repeated_sql=sql[:300], most_repeated_count=n)
+        level = logging.WARNING if seconds >= self.slow_seconds or recorder and recorder.duplicates else logging.INFO
+        logger.log(level, "%(method)s %(path)s %(status)s in %(duration_ms)sms", fields, extra=fields)
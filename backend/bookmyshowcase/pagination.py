@@ -0,0 +1,75 @@
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OffsetPagination(BasePagination):
+    """
+    next/previous links by row offset, without a COUNT query.
+
+    Used by StableCursorPagination for orderings a cursor cannot follow.
+    """
+    offset_query_param = 'offset'
+
+    def __init__(self, page_size, cursor_query_param):
+        self.page_size = page_size
+        self.cursor_query_param = cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.offset = max(0, int(request.query_params.get(self.offset_query_param, 0)))
+        except ValueError:
+            self.offset = 0
+        rows = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def _url(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self._url(), self.offset_query_param, self.offset + self.page_size)
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        if self.offset <= self.page_size:
+            return remove_query_param(self._url(), self.offset_query_param)
+        return replace_query_param(self._url(), self.offset_query_param, self.offset - self.page_size)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on a unique, indexed column.
+
+    DRF positions a cursor on the first ordering field only. On a unique
+    column (``unique_fields``) pages stay consistent while rows are being
+    inserted, and every page is an indexed range scan instead of an OFFSET
+    over the whole table. Ordered on anything else (a show's date, a price)
+    rows share positions and a cursor would skip or repeat them, so those
+    requests get OffsetPagination pages, with the same next/previous links.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+    unique_fields = ('id', 'pk')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.offset_pages = None
+        ordering = self.get_ordering(request, queryset, view)
+        if ordering[0].lstrip('-') in self.unique_fields:
+            return super().paginate_queryset(queryset, request, view)
+        self.offset_pages = OffsetPagination(self.get_page_size(request), self.cursor_query_param)
+        return self.offset_pages.paginate_queryset(queryset.order_by(*ordering), request, view)
+
+    def get_paginated_response(self, data):
+        if self.offset_pages is not None:
+            return self.offset_pages.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,34 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Lets views negotiate a streamed media type. Such views return a
+    StreamingHttpResponse themselves; anything else that reaches the
+    renderer, such as an error, is sent as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return json.dumps(data).encode()
+
+
+class EventStreamRenderer(StreamingRenderer):
+    """``Accept: text/event-stream``, what EventSource sends."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONLinesRenderer(StreamingRenderer):
+    media_type = 'application/jsonl'
+    format = 'jsonl'
@@ -2,13 +2,15 @@ from rest_framework import serializers
 from theatres.models import Theatre, Screen
 from shows.models import Show
 from bookings.models import Booking
+from seats import layouts
 from seats.models import Seat, ShowSeat
 from movies.serializers import MovieSerializer
 
 class ScreenSerializer(serializers.ModelSerializer):
     class Meta:
         model = Screen
-        fields = '__all__'
+        # The layout template is served with the seat map, see ShowViewSet.availability
+        exclude = ('layout',)
 
 class TheatreSerializer(serializers.ModelSerializer):
     screens = ScreenSerializer(many=True, read_only=True)
@@ -16,6 +18,10 @@ class TheatreSerializer(serializers.ModelSerializer):
         model = Theatre
         fields = '__all__'
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related('screens')
+
 class ShowSerializer(serializers.ModelSerializer):
     movie = MovieSerializer(read_only=True)
     screen = ScreenSerializer(read_only=True)
@@ -23,16 +29,21 @@ class ShowSerializer(serializers.ModelSerializer):
         model = Show
         fields = '__all__'
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('movie', 'screen')
+
 class SeatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Seat
         fields = '__all__'
+        read_only_fields = ('ordinal',)
 
 class ShowSeatSerializer(serializers.ModelSerializer):
     seat = SeatSerializer(read_only=True)
     class Meta:
         model = ShowSeat
-        fields = '__all__'
+        exclude = ('hold_token',)
 
 class BookingSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
@@ -42,6 +53,10 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = '__all__'
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user', 'show__movie', 'show__screen__theatre').prefetch_related('seats')
+
     def get_show_details(self, obj):
         return {
             'movie_title': obj.show.movie.title,
@@ -49,3 +64,49 @@ class BookingSerializer(serializers.ModelSerializer):
             'time': obj.show.time.strftime('%H:%M'),
             'date': obj.show.date.strftime('%Y-%m-%d')
         }
+
+class SeatHoldSerializer(serializers.Serializer):
+    seat_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+class HoldTokenSerializer(serializers.Serializer):
+    hold_token = serializers.CharField(max_length=32)
+    seat_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, required=False)
+
+class ShowInventorySerializer(serializers.Serializer):
+    show_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, required=False)
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Pass show_ids or a date range")
+        return attrs
+
+class ShowtimesQuerySerializer(serializers.Serializer):
+    city = serializers.CharField(max_length=100)
+    date = serializers.DateField(required=False)
+
+class SeatEventsQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False)
+
+class ScreenLayoutSerializer(serializers.Serializer):
+    layout = serializers.JSONField()
+
+    def validate_layout(self, value):
+        try:
+            return layouts.normalize(value)
+        except layouts.LayoutError as exc:
+            raise serializers.ValidationError(str(exc))
+
+class BookingExportQuerySerializer(serializers.Serializer):
+    theatre = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES, required=False)
+    after = serializers.IntegerField(min_value=0, required=False)
+
+class CheckoutSerializer(serializers.Serializer):
+    show = serializers.IntegerField()
+    seat_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    hold_token = serializers.CharField(max_length=32, required=False)
+    promo_code = serializers.CharField(max_length=30, required=False)
@@ -1,10 +1,13 @@
 from pathlib import Path
 import os
+import sys
+from corsheaders.defaults import default_headers
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-placeholder-key'
-DEBUG = True
+# DEBUG keeps every SQL query of a request in memory, turn it off with DEBUG=0
+DEBUG = os.getenv("DEBUG", "1") == "1"
 ALLOWED_HOSTS = ["*"] if DEBUG else os.getenv("ALLOWED_HOSTS", "").split(",")
 
 INSTALLED_APPS = [
@@ -37,11 +40,32 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:5174",
 ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'bookmyshowcase.pagination.StableCursorPagination',
+    'DEFAULT_FILTER_BACKENDS': (
+        'bookmyshowcase.filters.QueryParamFilter',
+        'rest_framework.filters.OrderingFilter',
+    ),
+    # Proxies in front of the app that append to X-Forwarded-For; client IPs for
+    # throttling are read from behind them. 0 by default: the shipped setup
+    # publishes the backend directly, so X-Forwarded-For is whatever the client
+    # sent. Set NUM_PROXIES=1 when requests do go through the nginx in frontend/
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", "0")),
+    # Token buckets, see bookmyshowcase.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': os.getenv("THROTTLE_RATE_AUTH", "30/min"),
+        'login': os.getenv("THROTTLE_RATE_LOGIN", "10/min"),
+        'otp': os.getenv("THROTTLE_RATE_OTP", "5/hour"),
+        'otp_verify': os.getenv("THROTTLE_RATE_OTP_VERIFY", "10/hour"),
+        'seat_hold': os.getenv("THROTTLE_RATE_SEAT_HOLD", "20/min"),
+        'booking': os.getenv("THROTTLE_RATE_BOOKING", "10/min"),
+        'promo_code': os.getenv("THROTTLE_RATE_PROMO_CODE", "20/hour"),
+    },
 }
 
 from datetime import timedelta
@@ -51,6 +75,7 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'bookmyshowcase.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,6 +105,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bookmyshowcase.wsgi.application'
+ASGI_APPLICATION = 'bookmyshowcase.asgi.application'
 
 USE_MYSQL = os.getenv("USE_MYSQL", "0") == "1"
 if USE_MYSQL:
@@ -97,10 +123,30 @@ else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
-            "NAME": BASE_DIR / "db.sqlite3",
+            # SQLITE_PATH points at another database file, e.g. for benchmarks
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
         }
     }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "bookmyshowcase"),
+    }
+}
+# LocMemCache is per process: what one worker sets or deletes, the others never see
+CACHE_IS_PER_PROCESS = CACHES["default"]["BACKEND"].endswith("LocMemCache")
+if CACHE_IS_PER_PROCESS:
+    # The default of 300 entries is culled constantly once per-show entries
+    # (availability, seat pricing) are cached
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "50000"))}
+
+# Catalog response caching and ETags, see bookmyshowcase.caching: off with a
+# per-process cache, whose versions other workers never see
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "0" if CACHE_IS_PER_PROCESS else "1") == "1"
+# Seconds a cached catalog response is kept
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "600"))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -117,3 +163,103 @@ AUTHENTICATION_BACKENDS = [
     'users.backends.EmailBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
+
+# Seconds a checkout seat hold stays LOCKED before it can be reclaimed
+SEAT_HOLD_TTL_SECONDS = int(os.getenv("SEAT_HOLD_TTL_SECONDS", "600"))
+
+# Where per-show seat availability vectors live, see seats.availability
+SEAT_AVAILABILITY_BACKEND = os.getenv("SEAT_AVAILABILITY_BACKEND", "seats.availability.LocalAvailabilityBackend")
+SEAT_AVAILABILITY_MAX_AGE = int(os.getenv("SEAT_AVAILABILITY_MAX_AGE", "30"))
+
+# Show.price multiplier per Seat.seat_type, see seats.pricing
+SEAT_TYPE_PRICE_MULTIPLIERS = {'SILVER': '1.00', 'GOLD': '1.25', 'PLATINUM': '1.50'}
+# Further Show.price multipliers, see seats.pricing: by show start time ("HH:MM" the
+# band starts at), weekday (Monday is 0) and share of the show's seats booked
+SEAT_PRICING_RULES = {
+    'time_of_day': [['00:00', '0.90'], ['17:00', '1.10'], ['22:30', '1.00']],
+    'weekdays': {4: '1.10', 5: '1.20', 6: '1.20'},
+    'occupancy': [['0.60', '1.10'], ['0.85', '1.25']],
+    'round_to': '1',
+}
+
+# Seconds before a process checks whether offers changed elsewhere, see offers.evaluator
+OFFERS_INDEX_CHECK_SECONDS = int(os.getenv("OFFERS_INDEX_CHECK_SECONDS", "5"))
+
+# Seconds a (city, date) showtime listing stays cached, see shows.listings.
+# Off with a per-process cache, which other workers' invalidations never reach
+SHOWTIMES_CACHE_TIMEOUT = int(os.getenv("SHOWTIMES_CACHE_TIMEOUT", "0" if CACHE_IS_PER_PROCESS else "300"))
+
+# Seat status event fan-out, see seats.events
+SEAT_EVENTS_BROKER = os.getenv("SEAT_EVENTS_BROKER", "seats.events.LocalSeatEventBroker")
+SEAT_EVENTS_BUFFER_SIZE = int(os.getenv("SEAT_EVENTS_BUFFER_SIZE", "256"))
+SEAT_EVENTS_STREAM_MAX_SECONDS = int(os.getenv("SEAT_EVENTS_STREAM_MAX_SECONDS", "300"))
+SEAT_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("SEAT_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# Expiry sweeper for stale seat holds and PENDING bookings, see bookings.sweeper
+BOOKING_PENDING_TTL_SECONDS = int(os.getenv("BOOKING_PENDING_TTL_SECONDS", "900"))
+SWEEPER_INTERVAL_SECONDS = int(os.getenv("SWEEPER_INTERVAL_SECONDS", "30"))
+SWEEPER_BATCH_SIZE = int(os.getenv("SWEEPER_BATCH_SIZE", "500"))
+# Run it on a thread of each web server process, see bookmyshowcase.background
+SWEEPER_IN_PROCESS = os.getenv("SWEEPER_IN_PROCESS", "0") == "1"
+
+# Payments, see payments.gateways and payments.jobs. The fake gateway is only
+# the default in development; elsewhere set a real gateway and its secret
+PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "payments.gateways.FakeGateway" if DEBUG else "")
+PAYMENT_GATEWAY_SECRET = os.getenv("PAYMENT_GATEWAY_SECRET", "fake-gateway-secret" if DEBUG else "")
+FAKE_GATEWAY_LATENCY_MS = int(os.getenv("FAKE_GATEWAY_LATENCY_MS", "0"))
+PAYMENTS_CALLBACK_LRU_SIZE = int(os.getenv("PAYMENTS_CALLBACK_LRU_SIZE", "10000"))
+PAYMENTS_WORKER_INTERVAL_SECONDS = int(os.getenv("PAYMENTS_WORKER_INTERVAL_SECONDS", "2"))
+PAYMENTS_WORKER_BATCH_SIZE = int(os.getenv("PAYMENTS_WORKER_BATCH_SIZE", "100"))
+# Run the worker on a thread of each web server process, see bookmyshowcase.background
+PAYMENTS_WORKER_IN_PROCESS = os.getenv("PAYMENTS_WORKER_IN_PROCESS", "0") == "1"
+
+# Request metrics, see bookmyshowcase.middleware; /api/_metrics requires
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set, a staff user otherwise
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0.1"))
+METRICS_SLOW_REQUEST_MS = int(os.getenv("METRICS_SLOW_REQUEST_MS", "500"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Seconds an authenticated user's row stays cached by id, see
+# users.authentication. Off with a per-process cache, which other workers'
+# invalidations never reach
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "0" if CACHE_IS_PER_PROCESS else "300"))
+
+# Request throttling, see bookmyshowcase.throttling (rates are in REST_FRAMEWORK)
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "bookmyshowcase.throttling.LocalBucketBackend")
+# Buckets of the auth, login and OTP scopes, which every worker must share
+THROTTLE_SHARED_BACKEND = os.getenv("THROTTLE_SHARED_BACKEND", "bookmyshowcase.throttling.DatabaseBucketBackend")
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") == "1"
+
+# Idempotency-Key handling, see bookmyshowcase.idempotency: seconds a first response
+# is replayed, a retry waits for it, and an unfinished request holds its key
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "bookmyshowcase.idempotency.DatabaseIdempotencyStore")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = int(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+# Booking exports, see bookings.export: bookings per response (keep it small
+# enough to stream within the gunicorn timeout) and per query
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "200000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+# Seconds a password reset OTP stays valid, see users.otp
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "600"))
+
+# manage.py test: sampled request logs and sweeper reports would flood the output
+TESTING = sys.argv[1:2] == ['test']
+LOG_LEVEL = "ERROR" if TESTING else "INFO"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'bookmyshowcase.logs.JSONFormatter'},
+    },
+    'handlers': {
+        'json_console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'bookmyshowcase.requests': {'handlers': ['json_console'], 'level': os.getenv("REQUEST_LOG_LEVEL", LOG_LEVEL), 'propagate': False},
+        'bookings.sweeper': {'handlers': ['json_console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
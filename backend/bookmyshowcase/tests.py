@@ -0,0 +1,838 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from bookings.models import Booking
+from movies.models import Movie
+from seats import availability, events, layouts, pricing
+from shows import listings
+from . import caching, throttling
+from .metrics import registry
+from .middleware import QueryRecorder
+from seats.models import Seat, ShowSeat
+from shows.models import Show
+from theatres.models import Theatre, Screen
+from users import otp
+from users.authentication import RoleRefreshToken, cached_fields, get_cached_user
+from users.models import CustomUser, OTP, ThrottleBucket
+
+
+class DashboardStatsTests(TestCase):
+    # Queries DashboardStatsView may issue for an admin, whatever the data size
+    QUERY_BUDGET = 6
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True)
+        self.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=self.owner)
+        screen = Screen.objects.create(name='Screen 1', theatre=theatre, capacity=100)
+        self.show = Show.objects.create(movie=movie, screen=screen, date=date.today(), time=time(18), price=250)
+
+    def book(self, amount, status, days_ago=0):
+        booking = Booking.objects.create(user=self.customer, show=self.show, total_amount=amount, status=status)
+        if days_ago:
+            # Saved through the model so the revenue rollup follows the date change
+            booking.booking_date = timezone.now() - timedelta(days=days_ago)
+            booking.save()
+        return booking
+
+    def get_stats(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/dashboard/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_totals(self):
+        self.book(Decimal('500'), 'CONFIRMED')
+        self.book(Decimal('250'), 'CONFIRMED', days_ago=2)
+        self.book(Decimal('750'), 'PENDING')
+        self.book(Decimal('100'), 'CANCELLED')
+
+        stats, _ = self.get_stats(self.admin)
+
+        self.assertEqual(stats['overview']['total_bookings'], 4)
+        self.assertEqual(stats['overview']['total_revenue'], 750.0)
+        self.assertEqual(stats['overview']['total_theatres'], 1)
+        self.assertEqual(stats['overview']['total_users'], 3)
+        self.assertEqual(stats['revenue']['today'], 500.0)
+        self.assertEqual(stats['bookings']['today'], 3)
+        self.assertEqual(
+            {item['name']: item['value'] for item in stats['charts']['distribution']},
+            {'Confirmed': 2, 'Pending': 1, 'Cancelled': 1},
+        )
+        sales = [day['sales'] for day in stats['charts']['sales_history']]
+        self.assertEqual(sales, [0, 0, 0, 0, 250.0, 0, 500.0])
+
+    def test_owner_and_customer_scope(self):
+        self.book(Decimal('500'), 'CONFIRMED')
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw')
+        Booking.objects.create(user=other, show=self.show, total_amount=100, status='CONFIRMED')
+
+        owner_stats, _ = self.get_stats(self.owner)
+        customer_stats, _ = self.get_stats(self.customer)
+
+        self.assertEqual(owner_stats['overview']['total_revenue'], 600.0)
+        self.assertEqual(owner_stats['overview']['total_users'], 0)
+        self.assertEqual(customer_stats['overview']['total_revenue'], 500.0)
+        self.assertEqual(customer_stats['overview']['total_theatres'], 0)
+
+    def test_query_budget(self):
+        for days_ago in range(10):
+            self.book(Decimal('100'), 'CONFIRMED', days_ago=days_ago)
+            self.book(Decimal('100'), 'PENDING', days_ago=days_ago)
+
+        _, query_count = self.get_stats(self.admin)
+
+        self.assertLessEqual(query_count, self.QUERY_BUDGET)
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints must cost the same number of queries for 1 row or many."""
+
+    ENDPOINTS = [
+        '/api/movies/',
+        '/api/theatres/',
+        '/api/shows/',
+        '/api/bookings/',
+        '/api/seats/',
+        '/api/users/',
+        '/api/dashboard/theatre-owner/',
+        '/api/dashboard/admin/',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True, is_theatre_owner=True)
+        self.batch = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.batch += 1
+            n = self.batch
+            customer = CustomUser.objects.create_user(f'customer{n}', f'customer{n}@example.com', 'pw')
+            movie = Movie.objects.create(
+                title=f'Movie {n}', description='', duration_minutes=120, language='Hindi',
+                release_date=date(2023, 1, 1), genre='Drama',
+            )
+            theatre = Theatre.objects.create(name=f'Theatre {n}', address='Andheri', city='Mumbai', owner=self.admin)
+            screens = [Screen.objects.create(name=f'Screen {i}', theatre=theatre, capacity=10) for i in range(2)]
+            show = Show.objects.create(movie=movie, screen=screens[0], date=date.today(), time=time(18), price=250)
+            seat = Seat.objects.create(screen=screens[0], row_number='A', seat_number='1', seat_type='SILVER')
+            show_seat = ShowSeat.objects.create(show=show, seat=seat, price=250)
+            booking = Booking.objects.create(user=customer, show=show, total_amount=250, status='CONFIRMED')
+            booking.seats.add(show_seat)
+
+    def count_queries(self, url):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_constant_queries_per_list(self):
+        self.add_rows(1)
+        small = {url: self.count_queries(url) for url in self.ENDPOINTS}
+        self.add_rows(5)
+        large = {url: self.count_queries(url) for url in self.ENDPOINTS}
+
+        self.assertEqual(small, large)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=owner)
+        self.url = f'/api/theatres/{self.theatre.id}/'
+        self.client = APIClient()
+
+    def age_versions(self, seconds=5):
+        """Move every catalog version ``seconds`` into the past, as if nothing changed since."""
+        for name in ['theatres', f'theatres:{self.theatre.id}']:
+            cache.set(caching._version_key(name), caching.versions(name)[0] - seconds * 1000, None)
+
+    def rename(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.theatre.name = name
+            self.theatre.save()
+
+    def test_edits_invalidate_detail_and_list(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        listed = self.client.get('/api/theatres/')['ETag']
+
+        self.rename('PVR Icon')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['name']), (200, 'PVR Icon'))
+        self.assertNotEqual(self.client.get('/api/theatres/')['ETag'], listed)
+
+    def test_versions_move_on_commit(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.theatre.name = 'PVR Icon'
+            self.theatre.save()
+            # Not committed yet: a reader here may only see the old row
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified_only_once_a_second_has_passed(self):
+        response = self.client.get(self.url)
+        # The version is from this very second
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(timezone.now().timestamp())).status_code, 200)
+
+        self.age_versions()
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    @override_settings(CATALOG_CACHE_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(SHOWTIMES_CACHE_TIMEOUT=300)
+class ShowtimesTests(TestCase):
+    DAY = date(2030, 1, 5)
+
+    def setUp(self):
+        cache.clear()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        self.theatre = Theatre.objects.create(name='PVR', address='Saket', city='New Delhi', owner=owner)
+        self.screen = Screen.objects.create(name='Screen 1', theatre=self.theatre)
+        self.show = Show.objects.create(movie=movie, screen=self.screen, date=self.DAY, time=time(19), price=200)
+        self.client = APIClient()
+
+    def showtimes(self, city):
+        response = self.client.get('/api/shows/showtimes/', {'city': city, 'date': str(self.DAY)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def theatres(self, city):
+        return [theatre for movie in self.showtimes(city)['movies'] for theatre in movie['theatres']]
+
+    def test_cities_share_one_entry(self):
+        listing = self.showtimes('New Delhi')
+        self.assertEqual([movie['title'] for movie in listing['movies']], ['Jawan'])
+        self.assertEqual(listing['movies'][0]['theatres'][0]['showtimes'][0]['show'], self.show.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.showtimes('new  DELHI')['city'], 'new  DELHI')
+        self.assertEqual(self.showtimes('Mumbai')['movies'], [])
+        key = listings._key('New Delhi', self.DAY)
+        self.assertNotIn(' ', key)
+        self.assertEqual(key, listings._key('new delhi', self.DAY))
+
+    def test_theatre_and_screen_renames_invalidate(self):
+        self.theatres('New Delhi')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.theatre.name = 'PVR Select'
+            self.theatre.save()
+            # Until the rename commits, the old listing is still the right one
+            self.assertEqual(self.theatres('New Delhi')[0]['name'], 'PVR')
+        self.assertEqual(self.theatres('New Delhi')[0]['name'], 'PVR Select')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.screen.name = 'Audi 1'
+            self.screen.save()
+        self.assertEqual(self.theatres('New Delhi')[0]['showtimes'][0]['screen'], 'Audi 1')
+
+        # Layout changes do not touch listings
+        with self.captureOnCommitCallbacks(execute=True):
+            self.screen.save(update_fields=['layout', 'capacity'])
+        with self.assertNumQueries(0):
+            self.theatres('New Delhi')
+
+    def test_show_changes_invalidate_on_commit(self):
+        self.showtimes('New Delhi')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.show.time = time(21)
+            self.show.save()
+        self.assertEqual(self.theatres('New Delhi')[0]['showtimes'][0]['time'], '21:00')
+
+    @override_settings(SHOWTIMES_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.showtimes('New Delhi')
+        self.show.time = time(21)
+        self.show.save()
+        self.assertEqual(self.theatres('New Delhi')[0]['showtimes'][0]['time'], '21:00')
+
+
+class PaginationTests(TestCase):
+    DAY = date(2030, 1, 5)
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        self.theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=self.owner)
+        self.screen = Screen.objects.create(name='Screen 1', theatre=self.theatre)
+        self.client = APIClient()
+
+    def make_show(self, start, price=200):
+        return Show.objects.create(movie=self.movie, screen=self.screen, date=self.DAY, time=start, price=price)
+
+    def walk(self, url, params, between=None):
+        """Ids of every page from ``url``, calling ``between`` after the first page."""
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            pages += 1
+            if pages == 1 and between:
+                between()
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_by_id_survive_inserts(self):
+        theatres = [self.theatre] + [
+            Theatre.objects.create(name=f'Theatre {n}', address='Andheri', city='Mumbai', owner=self.owner)
+            for n in range(4)
+        ]
+        added = []
+
+        def insert():
+            added.append(Theatre.objects.create(name='New', address='Andheri', city='Mumbai', owner=self.owner))
+
+        response = self.client.get('/api/theatres/', {'page_size': 2})
+        self.assertIn('cursor=', response.data['next'])
+        ids = self.walk('/api/theatres/', {'page_size': 2}, between=insert)
+        # Newer than the first page, so not in this walk; nothing skipped or repeated
+        self.assertEqual(ids, [theatre.id for theatre in reversed(theatres)])
+        self.assertTrue(added)
+
+    def test_non_unique_orderings_page_by_offset(self):
+        # Same date, and the same price, for every show
+        shows = [self.make_show(time(hour)) for hour in (10, 13, 16, 19, 22)]
+        response = self.client.get('/api/shows/', {'page_size': 2})
+        self.assertIn('offset=2', response.data['next'])
+        self.assertNotIn('cursor=', response.data['next'])
+        self.assertEqual(self.walk('/api/shows/', {'page_size': 2}), [show.id for show in shows])
+        self.assertEqual(self.walk('/api/shows/', {'page_size': 2, 'ordering': '-price'}), [show.id for show in shows])
+        self.assertEqual(self.walk('/api/shows/', {'page_size': 2, 'ordering': '-id'}), [show.id for show in reversed(shows)])
+
+        second = self.client.get(response.data['next'])
+        self.assertIsNone(self.client.get(second.data['previous']).data['previous'])
+
+    def test_city_filters_ignore_case(self):
+        show = self.make_show(time(19))
+        Theatre.objects.create(name='INOX', address='Saket', city='New Delhi', owner=self.owner)
+        for city in ('Mumbai', 'mumbai', 'MUMBAI'):
+            self.assertEqual([row['id'] for row in self.client.get('/api/theatres/', {'city': city}).data['results']], [self.theatre.id])
+            self.assertEqual([row['id'] for row in self.client.get('/api/shows/', {'city': city}).data['results']], [show.id])
+        self.assertEqual(self.client.get('/api/shows/', {'city': 'Pune'}).data['results'], [])
+
+    def test_invalid_filter_values(self):
+        self.assertEqual(self.client.get('/api/shows/', {'date': 'tomorrow'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/shows/', {'movie': 'x'}).status_code, 400)
+
+
+class SeatEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Show ids are reused between tests, start from empty buffers
+        events._broker = None
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=owner)
+        screen = Screen.objects.create(name='Screen 1', theatre=theatre)
+        layouts.apply(screen, {'rows': [{'row': 'A', 'type': 'SILVER', 'seats': [[1, 3]]}]})
+        self.show = Show.objects.create(movie=movie, screen=screen, date=date.today(), time=time(18), price=250)
+        self.seat_ids = list(ShowSeat.objects.filter(show=self.show).order_by('id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.url = f'/api/shows/{self.show.id}/seat-events/'
+
+    def poll(self, since):
+        response = self.client.get(self.url, {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_long_poll_returns_hold_and_release_deltas(self):
+        start = self.client.get(self.url).data['seq']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/shows/{self.show.id}/hold/', {'seat_ids': self.seat_ids[:2]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/shows/{self.show.id}/hold/release/', {'hold_token': response.data['hold_token']}, format='json')
+
+        data = self.poll(start)
+        held, released = data['events']
+        self.assertEqual(held['seats'], {str(seat_id): 'LOCKED' for seat_id in self.seat_ids[:2]})
+        self.assertIn('until', held)
+        self.assertEqual(released['seats'], {str(seat_id): 'AVAILABLE' for seat_id in self.seat_ids[:2]})
+        self.assertEqual(self.poll(data['seq']), {'seq': data['seq'], 'events': []})
+
+    @override_settings(SEAT_EVENTS_BUFFER_SIZE=2)
+    def test_client_behind_the_buffer_is_told_to_resync(self):
+        for seat_id in self.seat_ids:
+            events.publish_changes(self.show.id, [seat_id], 'BOOKED')
+        self.assertTrue(self.poll(0)['resync'])
+        self.assertEqual(len(self.poll(1)['events']), 2)
+
+    def test_event_stream_under_wsgi_ends_after_the_events_so_far(self):
+        seq = events.publish_changes(self.show.id, self.seat_ids[:1], 'BOOKED')
+        for url in (self.url, f'/api/async/shows/{self.show.id}/seat-events/'):
+            response = self.client.get(url, HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID=str(seq - 1))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            # Not streamed: the sync worker is free again at once
+            self.assertFalse(response.streaming)
+            body = response.content.decode()
+            self.assertIn(f'id: {seq}\nevent: ready', body)
+            self.assertIn(f'event: seats\ndata: {{"seq":{seq},"seats":{{"{self.seat_ids[0]}":"BOOKED"}}}}', body)
+
+    @override_settings(SEAT_EVENTS_BROKER='seats.events.CacheSeatEventBroker', SEAT_EVENTS_STREAM_MAX_SECONDS=1)
+    async def test_event_stream_under_asgi(self):
+        events._broker = None
+        seq = events.publish_changes(self.show.id, self.seat_ids[:1], 'BOOKED')
+        response = await AsyncClient().get(self.url, headers={'Accept': 'text/event-stream', 'Last-Event-ID': str(seq - 1)})
+        self.assertTrue(response.is_async)
+        chunks = response.streaming_content
+        self.assertIn('event: ready', (await anext(chunks)).decode())
+        later = events.publish_changes(self.show.id, self.seat_ids[1:2], 'BOOKED')
+        self.assertIn(f'id: {later}\nevent: seats', (await anext(chunks)).decode())
+        await chunks.aclose()
+
+    def test_unknown_show(self):
+        self.assertEqual(self.client.get('/api/shows/999999/seat-events/').status_code, 404)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        availability._backend = None
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.movies = [
+            Movie.objects.create(
+                title=f'Movie {n}', description='', duration_minutes=120, language='Hindi',
+                release_date=date(2023, 1, 1), genre='Drama',
+            )
+            for n in range(3)
+        ]
+        theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=owner)
+        screen = Screen.objects.create(name='Screen 1', theatre=theatre)
+        layouts.apply(screen, {'rows': [{'row': 'A', 'type': 'SILVER', 'seats': [[1, 4]]}]})
+        self.show = Show.objects.create(movie=self.movies[0], screen=screen, date=date.today(), time=time(18), price=250)
+        self.client = AsyncClient()
+
+    def tearDown(self):
+        availability._backend = None
+
+    async def get(self, url, params=None, status=200):
+        response = await self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    async def test_lists(self):
+        first = await self.get('/api/async/movies/', {'page_size': 2})
+        self.assertEqual([movie['id'] for movie in first['results']], [movie.id for movie in self.movies[:2]])
+        rest = await self.get('/api/async/movies/', {'after': first['results'][-1]['id']})
+        self.assertEqual([movie['id'] for movie in rest['results']], [self.movies[2].id])
+
+        shows = await self.get('/api/async/shows/', {'city': 'mumbai'})
+        self.assertEqual([show['id'] for show in shows['results']], [self.show.id])
+        self.assertEqual((await self.get('/api/async/shows/', {'city': 'Pune'}))['results'], [])
+        await self.get('/api/async/shows/', {'movie': 'x'}, status=400)
+        await self.get('/api/async/movies/', {'page_size': 'x'}, status=400)
+
+    async def test_seat_availability_from_each_backend(self):
+        for backend in ('seats.availability.LocalAvailabilityBackend', 'seats.availability.CacheAvailabilityBackend'):
+            with self.subTest(backend=backend), override_settings(SEAT_AVAILABILITY_BACKEND=backend):
+                availability._backend = None
+                url = f'/api/async/shows/{self.show.id}/availability/'
+                self.assertEqual((await self.get(url))['status'], '0000')
+                # Served from the backend now
+                self.assertIsNotNone(await availability.get_backend().aget(self.show.id))
+                self.assertEqual((await self.get(url, {'include': 'ids'}))['seats'], 4)
+        self.assertEqual((await self.client.get('/api/async/shows/999999/availability/')).status_code, 404)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_TOKEN='')
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_requests_are_counted_and_sampled(self):
+        client = APIClient()
+        client.force_login(CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True))
+        with self.assertLogs('bookmyshowcase.requests') as logs:
+            response = client.get('/api/movies/')
+            client.get('/api/movies/')
+            body = client.get('/api/_metrics').content.decode()
+
+        self.assertEqual(logs.records[0].view, 'movie-list')
+        self.assertEqual(logs.records[0].response_bytes, len(response.content))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+$')
+        self.assertIn('bookmyshowcase_http_requests_total{view="movie-list",method="GET",status="200"} 2', body)
+        self.assertIn('bookmyshowcase_http_request_duration_seconds_count{view="movie-list",method="GET"} 2', body)
+        self.assertIn('bookmyshowcase_db_sampled_requests_total{view="movie-list",method="GET"} 2', body)
+        self.assertIn('# TYPE bookmyshowcase_sweeper_runs_total counter', body)
+
+    def test_duplicate_queries_are_detected(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for _ in range(3):
+                list(Movie.objects.filter(pk=1))
+            list(Movie.objects.filter(pk=2))
+
+        self.assertEqual((recorder.count, recorder.duplicates), (4, 2))
+        self.assertEqual(recorder.most_repeated()[1], 3)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_protects_the_endpoint(self):
+        with self.assertLogs('bookmyshowcase.requests'):
+            self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+            self.assertEqual(self.client.get('/api/_metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_staff_only_without_a_token(self):
+        customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        admin = CustomUser.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True)
+        with self.assertLogs('bookmyshowcase.requests'):
+            self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+            self.assertEqual(self.client.get('/api/_metrics', HTTP_AUTHORIZATION='Bearer nonsense').status_code, 403)
+            for user, status in ((customer, 403), (admin, 200)):
+                access = RoleRefreshToken.for_user(user).access_token
+                self.assertEqual(self.client.get('/api/_metrics', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, status)
+
+
+@override_settings(AUTH_USER_CACHE_TIMEOUT=300)
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.get_backend().reset()
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.client = APIClient()
+
+    def login(self, username='customer'):
+        response = self.client.post('/api/users/login/', {'username': username, 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get(self, path, access):
+        return self.client.get(path, HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_login_by_email_is_a_single_lookup(self):
+        with CaptureQueriesContext(connection) as queries:
+            tokens = self.login('customer@example.com')
+        # Besides the throttle buckets
+        self.assertEqual(len([q for q in queries if 'users_customuser' in q['sql']]), 1)
+        self.assertEqual(tokens['user']['username'], 'customer')
+
+    def test_role_checks_use_token_and_cached_user(self):
+        access = self.login()['access']
+        self.assertEqual(self.get('/api/dashboard/admin/', access).status_code, 403)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/api/dashboard/theatre-owner/', access)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['detail'], 'Only theatre owners can access this')
+        self.assertEqual(len(queries), 0)
+
+    def test_saving_user_drops_cached_copy(self):
+        access = self.login()['access']
+        self.assertEqual(self.get('/api/dashboard/admin/', access).status_code, 403)
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.get('/api/dashboard/admin/', access).status_code, 401)
+
+    def test_cached_user_is_the_row_without_its_password(self):
+        access = self.login()['access']
+        self.get('/api/dashboard/admin/', access)
+        cached = cache.get(f'auth-user:{self.customer.pk}')
+        self.assertNotIn(self.customer.password, cached)
+        self.assertEqual(len(cached), len(cached_fields(CustomUser)))
+
+        with self.assertNumQueries(0):
+            user = get_cached_user(self.customer.pk)
+            self.assertEqual((user.email, user.first_name, user.date_joined), (self.customer.email, '', self.customer.date_joined))
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+        self.assertEqual(user._state.db, 'default')
+        self.assertTrue(user.check_password('pw'))
+
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_uncached_users_are_read_every_time(self):
+        access = self.login()['access']
+        self.assertEqual(self.get('/api/dashboard/admin/', access).status_code, 403)
+        # As if another worker deactivated the user
+        CustomUser.objects.filter(pk=self.customer.pk).update(is_active=False)
+        self.assertEqual(self.get('/api/dashboard/admin/', access).status_code, 401)
+
+    def test_role_change_requires_refreshed_token(self):
+        tokens = self.login()
+        self.customer.is_theatre_owner = True
+        self.customer.save()
+        self.assertEqual(self.get('/api/dashboard/theatre-owner/', tokens['access']).status_code, 401)
+
+        response = self.client.post('/api/users/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/api/dashboard/theatre-owner/', response.json()['access']).status_code, 200)
+
+
+def throttle_rates(num_proxies=0, **rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'NUM_PROXIES': num_proxies,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+    })
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.get_backend().reset()
+        self.customer = CustomUser.objects.create_user('customer', 'customer@example.com', 'pw')
+        self.client = APIClient()
+
+    @throttle_rates(login='2/min')
+    def test_login_attempts_limited_per_username(self):
+        def attempt(username):
+            return self.client.post('/api/users/login/', {'username': username, 'password': 'wrong'}, format='json')
+
+        self.assertEqual(attempt('customer').status_code, 401)
+        self.assertEqual(attempt('Customer').status_code, 401)
+        response = attempt('customer')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(attempt('someone-else').status_code, 401)
+
+    @throttle_rates(seat_hold='1/min')
+    def test_seat_holds_limited_per_show(self):
+        self.client.force_authenticate(self.customer)
+
+        def hold(show_id):
+            return self.client.post(f'/api/shows/{show_id}/hold/', {'seat_ids': [1]}, format='json')
+
+        self.assertNotEqual(hold(1).status_code, 429)
+        self.assertEqual(hold(1).status_code, 429)
+        self.assertNotEqual(hold(2).status_code, 429)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    @throttle_rates(login='1/min')
+    def test_disabled(self):
+        for _ in range(3):
+            response = self.client.post('/api/users/login/', {'username': 'customer', 'password': 'pw'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+    @throttle_rates(auth='2/min')
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        def attempt(spoofed):
+            return self.client.post('/api/users/login/', {'username': spoofed, 'password': 'wrong'}, format='json',
+                                    HTTP_X_FORWARDED_FOR=spoofed)
+
+        self.assertEqual([attempt(f'10.0.0.{n}').status_code for n in range(3)], [401, 401, 429])
+
+    @throttle_rates(num_proxies=1, auth='2/min')
+    def test_spoofed_forwarded_for_is_ignored_behind_proxy(self):
+        def attempt(spoofed):
+            # nginx appends the address it saw to whatever the client sent
+            return self.client.post('/api/users/login/', {'username': spoofed, 'password': 'wrong'}, format='json',
+                                    HTTP_X_FORWARDED_FOR=f'{spoofed}, 203.0.113.7')
+
+        self.assertEqual([attempt(f'10.0.0.{n}').status_code for n in range(3)], [401, 401, 429])
+        self.assertEqual(ThrottleBucket.objects.count(), 4)
+        self.assertEqual(throttling.delete_expired_buckets(timezone.now() + timedelta(minutes=2)), 4)
+
+    def test_cache_backend_refills(self):
+        backend = throttling.CacheBucketBackend()
+        self.assertEqual([backend.consume('k', 2, 1.0)[0] for _ in range(3)], [True, True, False])
+        cache.set('throttle:k', (0.0, cache.get('throttle:k')[1] - 1.5))
+        self.assertTrue(backend.consume('k', 2, 1.0)[0])
+
+    def test_otp_is_single_use_and_expires(self):
+        code = otp.issue(self.customer).otp_code
+        self.assertFalse(otp.verify(self.customer, 'nope'))
+        self.assertTrue(otp.verify(self.customer, code))
+        self.assertFalse(otp.verify(self.customer, code))
+
+        code = otp.issue(self.customer).otp_code
+        OTP.objects.update(created_at=timezone.now() - timedelta(seconds=settings.OTP_TTL_SECONDS + 1))
+        self.assertFalse(otp.verify(self.customer, code))
+        self.assertEqual(otp.purge_expired(), 1)
+        self.assertFalse(OTP.objects.exists())
+
+
+class SeatLayoutTests(TestCase):
+    LAYOUT = {'rows': [
+        {'row': 'A', 'type': 'SILVER', 'seats': [[1, 3], [6, 8]]},
+        {'row': 'B', 'type': 'SILVER', 'seats': [[1, 3], [6, 8, 'GOLD']]},
+    ]}
+
+    def setUp(self):
+        cache.clear()
+        # Show ids are reused between tests, start from empty vectors
+        availability._backend = None
+        self.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        self.theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=self.owner)
+        self.screen = Screen.objects.create(name='Screen 1', theatre=self.theatre, capacity=100)
+        self.url = f'/api/theatres/{self.theatre.id}/screens/{self.screen.id}/layout/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.put(self.url, {'layout': self.LAYOUT}, format='json').status_code, 200)
+        self.show = Show.objects.create(movie=movie, screen=self.screen, date=date.today(), time=time(18), price=250)
+
+    def seat_map(self):
+        return self.client.get(f'/api/shows/{self.show.id}/availability/?include=ids,layout').json()
+
+    def test_seat_map_from_template(self):
+        self.screen.refresh_from_db()
+        self.assertEqual(self.screen.capacity, 12)
+        seat_map = self.seat_map()
+        self.assertEqual(seat_map['layout'], self.LAYOUT)
+        self.assertEqual(seat_map['zones'], {'SILVER': [[0, 9]], 'GOLD': [[9, 12]]})
+        self.assertEqual(seat_map['status'], '0' * 12)
+        labels = dict(ShowSeat.objects.values_list('id', 'seat__seat_number'))
+        self.assertEqual([labels[i] for i in seat_map['show_seat_ids'][:6]], ['1', '2', '3', '6', '7', '8'])
+
+    def test_changing_the_layout_keeps_shows_in_line(self):
+        booked = self.seat_map()['show_seat_ids'][0]
+        ShowSeat.objects.filter(pk=booked).update(status='BOOKED')
+        layout = {'rows': [{'row': 'AA', 'type': 'PLATINUM', 'seats': [[1, 2]]}, *self.LAYOUT['rows']]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.put(self.url, {'layout': layout}, format='json').status_code, 200)
+
+        seat_map = self.seat_map()
+        self.assertEqual(seat_map['seats'], 14)
+        self.assertEqual(seat_map['status'], '00' + '2' + '0' * 11)
+        self.assertEqual(seat_map['show_seat_ids'][2], booked)
+
+        response = self.client.put(self.url, {'layout': {'rows': layout['rows'][:1]}}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.seat_map()['seats'], 14)
+
+    def test_single_seat_edits_rebuild_the_template(self):
+        response = self.client.post('/api/seats/', {
+            'screen': self.screen.id, 'row_number': 'A', 'seat_number': '4', 'seat_type': 'SILVER',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.screen.refresh_from_db()
+        self.assertEqual(self.screen.layout['rows'][0]['seats'], [[1, 4], [6, 8]])
+        self.assertEqual(self.screen.capacity, 13)
+        self.assertEqual(Seat.objects.get(pk=response.json()['id']).ordinal, 3)
+
+    def test_validation_and_permissions(self):
+        bad = {'rows': [{'row': 'A', 'type': 'SILVER', 'seats': [[3, 1]]}]}
+        self.assertEqual(self.client.put(self.url, {'layout': bad}, format='json').status_code, 400)
+        self.client.force_authenticate(CustomUser.objects.create_user('customer', 'c@example.com', 'pw'))
+        self.assertEqual(self.client.put(self.url, {'layout': self.LAYOUT}, format='json').status_code, 403)
+        self.assertEqual(self.client.get(self.url).json()['layout'], self.LAYOUT)
+
+
+@override_settings(SEAT_PRICING_RULES={
+    'time_of_day': [['00:00', '0.90'], ['17:00', '1.10']],
+    'weekdays': {5: '1.20'},
+    'occupancy': [['0.50', '1.50']],
+    'round_to': '0.01',
+})
+class PricingTests(TestCase):
+    # A Saturday
+    DAY = date(2030, 1, 5)
+
+    def setUp(self):
+        cache.clear()
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pw', is_theatre_owner=True)
+        self.movie = Movie.objects.create(
+            title='Jawan', description='', duration_minutes=169, language='Hindi',
+            release_date=date(2023, 9, 7), genre='Action',
+        )
+        theatre = Theatre.objects.create(name='PVR', address='Goregaon', city='Mumbai', owner=owner)
+        self.screen = Screen.objects.create(name='Screen 1', theatre=theatre)
+        layouts.apply(self.screen, {'rows': [
+            {'row': 'A', 'type': 'SILVER', 'seats': [[1, 4]]},
+            {'row': 'B', 'type': 'GOLD', 'seats': [[1, 4]]},
+        ]})
+
+    def make_show(self, start=time(19), screen=None):
+        return Show.objects.create(movie=self.movie, screen=screen or self.screen, date=self.DAY, time=start, price=200)
+
+    def prices(self, show):
+        return list(ShowSeat.objects.filter(show=show).order_by('ordinal').values_list('price', flat=True))
+
+    def test_new_seats_are_priced_by_the_rules(self):
+        evening, morning = self.make_show(), self.make_show(time(10))
+        # 200 x 1.10 evening x 1.20 Saturday, GOLD x 1.25
+        self.assertEqual(self.prices(evening), [Decimal('264.00')] * 4 + [Decimal('330.00')] * 4)
+        self.assertEqual(self.prices(morning), [Decimal('216.00')] * 4 + [Decimal('270.00')] * 4)
+
+    def test_reprice_surges_available_seats_only(self):
+        show, other = self.make_show(), self.make_show()
+        ShowSeat.objects.filter(show=show, ordinal__lt=4).update(status='BOOKED')
+
+        result = pricing.reprice(Show.objects.all())
+        self.assertEqual(result, {'shows': 2, 'repriced': 2, 'seats': 12, 'statements': 4})
+        self.assertEqual(self.prices(show), [Decimal('264.00')] * 4 + [Decimal('495.00')] * 4)
+        self.assertEqual(self.prices(other), [Decimal('264.00')] * 4 + [Decimal('330.00')] * 4)
+
+        # Nothing changed since, so nothing is written
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(pricing.reprice(Show.objects.all())['repriced'], 0)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_retyped_seats_are_repriced(self):
+        show = self.make_show()
+        pricing.reprice([show.id])
+        layouts.apply(self.screen, {'rows': [
+            {'row': 'A', 'type': 'GOLD', 'seats': [[1, 4]]},
+            {'row': 'B', 'type': 'GOLD', 'seats': [[1, 4]]},
+        ]})
+        # Another process, with nothing cached
+        cache.clear()
+
+        self.assertEqual(pricing.reprice([show.id])['repriced'], 1)
+        self.assertEqual(self.prices(show), [Decimal('330.00')] * 8)
+        self.assertEqual(pricing.reprice([show.id])['repriced'], 0)
+
+    def test_reprice_command_matches_cities_case_insensitively(self):
+        self.make_show()
+        out = StringIO()
+        call_command('reprice_shows', '--city', ' mumbai', stdout=out)
+        self.assertIn('of 1 shows', out.getvalue())
+
+    def test_screens_without_a_template(self):
+        screen = Screen.objects.create(name='Screen 2', theatre=self.screen.theatre)
+        for number, seat_type in (('1', 'SILVER'), ('X', 'PLATINUM')):
+            Seat.objects.create(screen=screen, row_number='A', seat_number=number, seat_type=seat_type)
+        self.assertIsNone(layouts.refresh(screen.id))
+        show = self.make_show(screen=screen)
+        ShowSeat.objects.filter(show=show, ordinal=0).update(status='BOOKED')
+
+        pricing.reprice([show.id])
+        self.assertEqual(self.prices(show), [Decimal('264.00'), Decimal('594.00')])
@@ -0,0 +1,254 @@
+"""
+Token-bucket request throttling.
+
+Each throttle scope has a rate in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+such as "10/min": a bucket holds up to 10 tokens and refills at 10 per
+minute, so a client may burst up to the full bucket and is then held to the
+steady rate. Every request takes one token from the bucket for its
+scope and key (client IP, user, show or login name, see the classes
+below); a request that finds the bucket empty gets a 429 with Retry-After.
+
+Buckets live in a backend chosen by THROTTLE_BACKEND:
+
+- LocalBucketBackend keeps them in process memory. Each worker process
+  counts on its own, so the effective limit is per worker.
+- CacheBucketBackend keeps them in Django's cache, so every process shares
+  them (given a shared cache, not LocMemCache). Its read-modify-write is
+  not atomic: two requests racing on one bucket may both get the last
+  token, which is acceptable for abuse limits.
+- DatabaseBucketBackend keeps them in the users.ThrottleBucket table, one
+  row lock per request.
+
+Scopes that guard credentials (``shared = True``: auth, login and OTPs)
+must not be multiplied by the number of workers. They use
+THROTTLE_SHARED_BACKEND instead: DatabaseBucketBackend by default, or
+CacheBucketBackend given a shared cache.
+
+Client IPs come from DRF's get_ident(). NUM_PROXIES is 0 by default, so
+that is the socket's address and X-Forwarded-For is ignored. Deployments
+behind the nginx in frontend/, which appends the address it saw to
+X-Forwarded-For, set NUM_PROXIES=1 to read the address the proxy saw, not
+whatever the client put in the header.
+
+THROTTLE_ENABLED=0 turns all of these throttles off (benchmarks do).
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 10 / 60): bucket capacity and tokens added per second."""
+    count, _, period = rate.partition('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()[0]]
+
+
+def _take(tokens, stamp, now, capacity, per_second):
+    """Refill a bucket up to ``now`` and take a token: (allowed, tokens, wait)."""
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * per_second)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / per_second
+
+
+class LocalBucketBackend:
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, per_second):
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, wait = _take(tokens, stamp, now, capacity, per_second)
+            self._buckets[key] = (tokens, now)
+            # Least recently used buckets go first; they are the fullest anyway
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketBackend:
+    key_prefix = 'throttle'
+
+    def consume(self, key, capacity, per_second):
+        now = time.time()
+        cache_key = f'{self.key_prefix}:{key}'
+        tokens, stamp = cache.get(cache_key) or (capacity, now)
+        allowed, tokens, wait = _take(tokens, stamp, now, capacity, per_second)
+        # Once the bucket would be full again the entry can simply expire
+        cache.set(cache_key, (tokens, now), math.ceil(capacity / per_second) + 1)
+        return allowed, wait
+
+    def reset(self):
+        # Cache entries expire on their own; nothing to clear per process
+        pass
+
+
+class DatabaseBucketBackend:
+    def consume(self, key, capacity, per_second):
+        from users.models import ThrottleBucket
+        now = time.time()
+        # Once the bucket would be full again the row can simply go
+        expires_at = datetime.fromtimestamp(now + capacity / per_second + 1, dt_timezone.utc)
+        with transaction.atomic():
+            bucket, _ = ThrottleBucket.objects.select_for_update().get_or_create(
+                key=hashlib.sha256(key.encode()).hexdigest(),
+                defaults={'tokens': capacity, 'stamp': now, 'expires_at': expires_at},
+            )
+            allowed, tokens, wait = _take(bucket.tokens, bucket.stamp, now, capacity, per_second)
+            ThrottleBucket.objects.filter(pk=bucket.pk).update(tokens=tokens, stamp=now, expires_at=expires_at)
+        return allowed, wait
+
+    def reset(self):
+        # Rows expire on their own (bookings.sweeper deletes them)
+        pass
+
+
+def delete_expired_buckets(now=None):
+    """Delete DatabaseBucketBackend buckets that are full again; returns how many."""
+    from users.models import ThrottleBucket
+    deleted, _ = ThrottleBucket.objects.filter(expires_at__lt=now or timezone.now()).delete()
+    return deleted
+
+
+_backend = None
+_shared_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'THROTTLE_BACKEND', 'bookmyshowcase.throttling.LocalBucketBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+def get_shared_backend():
+    """The backend of ``shared`` scopes, whose buckets every process must see."""
+    global _shared_backend
+    if _shared_backend is None:
+        path = getattr(settings, 'THROTTLE_SHARED_BACKEND', 'bookmyshowcase.throttling.DatabaseBucketBackend')
+        _shared_backend = import_string(path)()
+    return _shared_backend
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class: subclasses set ``scope`` and implement get_key(), and set
+    ``shared`` if the limit must hold across worker processes.
+    """
+    scope = None
+    shared = False
+
+    def __init__(self):
+        self._wait = None
+
+    def get_key(self, request, view):
+        """The bucket for this request within the scope, or None to let it through."""
+        raise NotImplementedError
+
+    def client_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def data_value(self, request, name):
+        data = request.data
+        value = data.get(name) if hasattr(data, 'get') else None
+        return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if rate is None:
+            return True
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        backend = get_shared_backend() if self.shared else get_backend()
+        allowed, self._wait = backend.consume(f'{self.scope}:{key}', *parse_rate(rate))
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    """Every auth endpoint, per client IP."""
+    scope = 'auth'
+    shared = True
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """Password attempts per login name, from any number of IPs."""
+    scope = 'login'
+    shared = True
+
+    def get_key(self, request, view):
+        return self.data_value(request, 'username')
+
+
+class OTPRateThrottle(TokenBucketThrottle):
+    """OTPs sent per email address."""
+    scope = 'otp'
+    shared = True
+
+    def get_key(self, request, view):
+        return self.data_value(request, 'email')
+
+
+class OTPVerifyRateThrottle(TokenBucketThrottle):
+    """OTP guesses per email address."""
+    scope = 'otp_verify'
+    shared = True
+
+    def get_key(self, request, view):
+        return self.data_value(request, 'email')
+
+
+class SeatHoldRateThrottle(TokenBucketThrottle):
+    """Seat holds per user (or IP) and show."""
+    scope = 'seat_hold'
+
+    def get_key(self, request, view):
+        return f"{self.client_key(request)}:show:{view.kwargs.get('pk')}"
+
+
+class BookingRateThrottle(TokenBucketThrottle):
+    """Bookings per user (or IP)."""
+    scope = 'booking'
+
+    def get_key(self, request, view):
+        return self.client_key(request)
+
+
+class PromoCodeRateThrottle(TokenBucketThrottle):
+    """Promo code tries per user (or IP), so codes cannot be guessed."""
+    scope = 'promo_code'
+
+    def get_key(self, request, view):
+        return self.client_key(request) if self.data_value(request, 'promo_code') else None
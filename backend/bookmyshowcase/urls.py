@@ -4,7 +4,11 @@ from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 from users.views import UserViewSet
 from movies.views import MovieViewSet
+from offers.views import OfferViewSet
+from payments.views import PaymentViewSet
 from bookmyshowcase.views import TheatreViewSet, ShowViewSet, BookingViewSet, SeatViewSet
+from bookmyshowcase import async_views
+from bookmyshowcase.metrics import metrics_view
 from bookmyshowcase.management_views import DashboardStatsView, TheatreOwnerDashboardView, AdminDashboardView
 
 router = DefaultRouter()
@@ -13,6 +17,8 @@ router.register(r'theatres', TheatreViewSet)
 router.register(r'shows', ShowViewSet)
 router.register(r'bookings', BookingViewSet)
 router.register(r'seats', SeatViewSet)
+router.register(r'offers', OfferViewSet)
+router.register(r'payments', PaymentViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -20,6 +26,11 @@ urlpatterns = [
     path('api/dashboard/stats/', DashboardStatsView.as_view(), name='dashboard_stats'),
     path('api/dashboard/theatre-owner/', TheatreOwnerDashboardView.as_view(), name='theatre_owner_dashboard'),
     path('api/dashboard/admin/', AdminDashboardView.as_view(), name='admin_dashboard'),
+    path('api/_metrics', metrics_view, name='metrics'),
+    path('api/async/movies/', async_views.movie_list, name='async_movie_list'),
+    path('api/async/shows/', async_views.show_list, name='async_show_list'),
+    path('api/async/shows/<int:pk>/availability/', async_views.seat_availability, name='async_seat_availability'),
+    path('api/async/shows/<int:pk>/seat-events/', async_views.seat_events, name='async_seat_events'),
     path('api/', include(router.urls)),
     path('', RedirectView.as_view(url='/api/', permanent=False)),
 ]
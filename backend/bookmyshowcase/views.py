@@ -1,22 +1,280 @@
-from rest_framework import viewsets
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from theatres.models import Theatre, Screen
 from shows.models import Show
 from bookings.models import Booking
 from seats.models import Seat, ShowSeat
-from .serializers import TheatreSerializer, ShowSerializer, BookingSerializer, SeatSerializer, ShowSeatSerializer
+from seats import availability, events, holds, layouts
+from .caching import CachedResponseMixin
+from .idempotency import IdempotentMixin
+from .renderers import CSVRenderer, EventStreamRenderer, JSONLinesRenderer
+from .throttling import BookingRateThrottle, PromoCodeRateThrottle, SeatHoldRateThrottle
+from seats.inventory import materialize_show_seats
+from bookings import export
+from bookings.checkout import checkout
+from offers.evaluator import OfferError
+from payments.gateways import get_gateway
+from shows.listings import get_showtimes
+from users.permissions import IsTheatreOwnerOrAdmin, is_admin
+from .serializers import TheatreSerializer, ShowSerializer, BookingSerializer, SeatSerializer, ShowSeatSerializer, SeatHoldSerializer, HoldTokenSerializer, ShowInventorySerializer, ShowtimesQuerySerializer, SeatEventsQuerySerializer, CheckoutSerializer, BookingExportQuerySerializer, ScreenLayoutSerializer
 
-class TheatreViewSet(viewsets.ModelViewSet):
-    queryset = Theatre.objects.all()
+class TheatreViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = TheatreSerializer.setup_eager_loading(Theatre.objects.all())
     serializer_class = TheatreSerializer
+    cache_namespace = 'theatres'
+    filter_params = {'city': ('city__lower', str.lower), 'owner': 'owner_id'}
+    ordering_fields = ['id', 'name']
+    ordering = ['-id']
 
-class ShowViewSet(viewsets.ModelViewSet):
-    queryset = Show.objects.all()
+    @action(detail=True, methods=['get', 'put'], url_path=r'screens/(?P<screen_id>[0-9]+)/layout')
+    def screen_layout(self, request, pk=None, screen_id=None):
+        """A screen's seat layout template, see seats.layouts; its owner and admins may replace it."""
+        theatre = self.get_object()
+        screen = get_object_or_404(Screen, pk=screen_id, theatre=theatre)
+        if request.method == 'PUT':
+            if not (is_admin(request) or (request.user.is_authenticated and theatre.owner_id == request.user.id)):
+                self.permission_denied(request, message="Only the theatre's owner and admins can change its layout")
+            serializer = ScreenLayoutSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                layouts.apply(screen, serializer.validated_data['layout'])
+            except layouts.LayoutError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({'screen': screen.id, 'capacity': screen.capacity, 'layout': screen.layout})
+
+class ShowViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = ShowSerializer.setup_eager_loading(Show.objects.all())
     serializer_class = ShowSerializer
+    cache_namespace = 'shows'
+    cache_depends = ('movies', 'screens')
+    filter_params = {
+        'movie': 'movie_id',
+        'screen': 'screen_id',
+        'theatre': 'screen__theatre_id',
+        'city': ('screen__theatre__city__lower', str.lower),
+        'date': 'date',
+        'date_from': 'date__gte',
+        'date_to': 'date__lte',
+    }
+    ordering_fields = ['id', 'date', 'price']
+    ordering = ['date', 'time', 'id']
+
+    @action(detail=False, methods=['get'])
+    def showtimes(self, request):
+        serializer = ShowtimesQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data.get('date') or timezone.localdate()
+        return Response(get_showtimes(serializer.validated_data['city'], day))
+
+    @action(detail=False, methods=['post'], url_path='materialize-seats', permission_classes=[IsTheatreOwnerOrAdmin])
+    def materialize_seats(self, request):
+        if is_admin(request):
+            shows = Show.objects.all()
+        else:
+            shows = Show.objects.filter(screen__theatre__owner=request.user)
+
+        serializer = ShowInventorySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if 'show_ids' in data:
+            shows = shows.filter(id__in=data['show_ids'])
+        if 'from_date' in data:
+            shows = shows.filter(date__gte=data['from_date'])
+        if 'to_date' in data:
+            shows = shows.filter(date__lte=data['to_date'])
+        return Response({'created': materialize_show_seats(shows)})
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        try:
+            entry = availability.get_availability(pk)
+        except ValueError:
+            raise Http404
+        if not entry.status and not Show.objects.filter(pk=entry.show_id).exists():
+            raise Http404
+        include = request.query_params.get('include', '').split(',')
+        return Response(entry.as_dict(include_ids='ids' in include, include_layout='layout' in include))
+
+    @action(detail=True, methods=['get'], url_path='seat-events', renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def seat_events(self, request, pk=None):
+        """
+        Seat status deltas of the show, see seats.events.
+
+        With ``Accept: text/event-stream`` this is a server-sent event stream
+        (resuming after Last-Event-ID), which under WSGI ends after the
+        events so far; otherwise the events after ``?since=``, at once.
+        """
+        serializer = SeatEventsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        try:
+            show_id = int(pk)
+        except ValueError:
+            raise Http404
+        if not Show.objects.filter(pk=show_id).exists():
+            raise Http404
+        since = serializer.validated_data.get('since')
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        if since is None and last_event_id.isdigit():
+            since = int(last_event_id)
+
+        if request.accepted_renderer.format == 'sse':
+            # Waiting for events would hold a sync worker: only ASGI streams
+            if isinstance(request._request, ASGIRequest):
+                response = StreamingHttpResponse(events.astream(show_id, since), content_type='text/event-stream')
+            else:
+                response = HttpResponse(events.snapshot(show_id, since), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        seq, changes = events.get_broker().read(show_id, since)
+        if changes is None:
+            return Response({'seq': seq, 'resync': True})
+        return Response({'seq': seq, 'events': changes})
+
+    @staticmethod
+    def _show_id(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated], throttle_classes=[SeatHoldRateThrottle])
+    def hold(self, request, pk=None):
+        show_id = self._show_id(pk)
+        serializer = SeatHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        seat_ids = serializer.validated_data['seat_ids']
+        try:
+            token, expires_at = holds.hold_seats(show_id, seat_ids, request.user)
+        except holds.SeatUnavailable as exc:
+            return Response({'error': 'Seats not available', 'seat_ids': exc.seat_ids}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'hold_token': token,
+            'expires_at': expires_at,
+            'seat_ids': sorted(set(seat_ids)),
+        }, status=status.HTTP_201_CREATED)
 
-class BookingViewSet(viewsets.ModelViewSet):
-    queryset = Booking.objects.all()
+    @action(detail=True, methods=['post'], url_path='hold/extend', permission_classes=[IsAuthenticated])
+    def extend_hold(self, request, pk=None):
+        show_id = self._show_id(pk)
+        serializer = HoldTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = serializer.validated_data['hold_token']
+        try:
+            expires_at = holds.extend_hold(show_id, token, request.user)
+        except holds.HoldNotFound:
+            return Response({'error': 'Hold expired or not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'hold_token': token, 'expires_at': expires_at})
+
+    @action(detail=True, methods=['post'], url_path='hold/release', permission_classes=[IsAuthenticated])
+    def release_hold(self, request, pk=None):
+        show_id = self._show_id(pk)
+        serializer = HoldTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        released = holds.release_hold(show_id, data['hold_token'], request.user, data.get('seat_ids'))
+        return Response({'released': released})
+
+class BookingViewSet(IdempotentMixin, viewsets.ModelViewSet):
+    queryset = BookingSerializer.setup_eager_loading(Booking.objects.all())
     serializer_class = BookingSerializer
+    filter_params = {
+        'user': 'user_id',
+        'show': 'show_id',
+        'status': 'status',
+        'date_from': 'booking_date__date__gte',
+        'date_to': 'booking_date__date__lte',
+    }
+    ordering_fields = ['id', 'booking_date']
+    ordering = ['-id']
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [BookingRateThrottle()]
+        return super().get_throttles()
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], throttle_classes=[BookingRateThrottle, PromoCodeRateThrottle])
+    def checkout(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            booking = checkout(
+                request.user, data['show'], data['seat_ids'], data.get('hold_token'), data.get('promo_code'),
+            )
+        except holds.SeatUnavailable as exc:
+            return Response({'error': 'Seats not available', 'seat_ids': exc.seat_ids}, status=status.HTTP_409_CONFLICT)
+        except OfferError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        payment = booking.payment
+        data = BookingSerializer(self.get_queryset().get(pk=booking.pk)).data
+        # What the client needs to pay, see payments.gateways
+        data['payment'] = payment and get_gateway().checkout_params(payment)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsTheatreOwnerOrAdmin],
+            renderer_classes=[CSVRenderer, JSONLinesRenderer])
+    def export(self, request):
+        """
+        Stream bookings as CSV (the default) or JSON lines (?format=jsonl),
+        owners' own theatres only. Large exports come in pages, see
+        bookings.export.
+        """
+        serializer = BookingExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        bookings = Booking.objects.all()
+        if not is_admin(request):
+            bookings = bookings.filter(show__screen__theatre__owner=request.user)
+        if 'theatre' in data:
+            bookings = bookings.filter(show__screen__theatre_id=data['theatre'])
+        if 'date_from' in data:
+            bookings = bookings.filter(booking_date__date__gte=data['date_from'])
+        if 'date_to' in data:
+            bookings = bookings.filter(booking_date__date__lte=data['date_to'])
+        if 'status' in data:
+            bookings = bookings.filter(status=data['status'])
+
+        after = data.get('after', 0)
+        bookings, next_after = export.page(bookings, after)
+        fmt = request.accepted_renderer.format
+        # Under ASGI a sync iterator would be read into memory in one go
+        rows = export.astream if isinstance(request._request, ASGIRequest) else export.stream
+        response = StreamingHttpResponse(rows(bookings, fmt, after), content_type=export.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="bookings.{fmt}"'
+        if next_after is not None:
+            response['Link'] = f'<{replace_query_param(request.build_absolute_uri(), "after", next_after)}>; rel="next"'
+        return response
 
 class SeatViewSet(viewsets.ModelViewSet):
     queryset = Seat.objects.all()
     serializer_class = SeatSerializer
+    filter_params = {'screen': 'screen_id', 'seat_type': 'seat_type'}
+    ordering_fields = ['id', 'ordinal']
+    ordering = ['id']
+
+    # Single seats change the screen's layout, see seats.layouts
+
+    def perform_create(self, serializer):
+        seat = serializer.save()
+        layouts.refresh(seat.screen_id)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.screen_id
+        seat = serializer.save()
+        layouts.refresh(seat.screen_id)
+        if previous != seat.screen_id:
+            layouts.refresh(previous)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        layouts.refresh(instance.screen_id)
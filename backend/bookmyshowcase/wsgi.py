@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyshowcase.settings')
 
 application = get_wsgi_application()
+
+# The in-process sweeper and payments worker, when enabled
+from bookmyshowcase import background  # noqa: E402
+
+background.start()
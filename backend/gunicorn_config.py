@@ -1,10 +1,27 @@
 # Gunicorn configuration file
+#
+# Sync (default):  gunicorn -c gunicorn_config.py
+# ASGI:            GUNICORN_ASGI=1 gunicorn -c gunicorn_config.py
+#
+# The ASGI mode serves bookmyshowcase.asgi through uvicorn workers, so slow
+# requests (streams, long polls, async views) wait on the event loop instead
+# of pinning a whole worker process.
 import multiprocessing
+import os
+
+ASGI = os.getenv("GUNICORN_ASGI", "0") == "1"
 
 bind = "0.0.0.0:8000"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-timeout = 120
+if ASGI:
+    wsgi_app = "bookmyshowcase.asgi:application"
+    workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() + 1))
+    worker_class = "uvicorn.workers.UvicornWorker"
+    timeout = 30
+else:
+    wsgi_app = "bookmyshowcase.wsgi:application"
+    workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+    worker_class = "sync"
+    timeout = 120
 keepalive = 5
 max_requests = 1000
 max_requests_jitter = 100
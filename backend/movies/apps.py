@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MoviesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'movies'
+
+    def ready(self):
+        from . import signals  # noqa: F401
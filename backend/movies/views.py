@@ -1,7 +1,12 @@
 from rest_framework import viewsets
+from bookmyshowcase.caching import CachedResponseMixin
 from .models import Movie
 from .serializers import MovieSerializer
 
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
+    cache_namespace = 'movies'
+    filter_params = {'language': 'language__iexact', 'genre': 'genre__icontains'}
+    ordering_fields = ['id', 'title', 'release_date', 'rating']
+    ordering = ['-id']
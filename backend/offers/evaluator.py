@@ -0,0 +1,216 @@
+"""
+Offer evaluation at checkout.
+
+Active offers are read once into an in-process index. For each
+(city, movie, show date) the index works out, once, which offers can apply
+at all: the city (compared normalised, as shows.listings does), movie and
+weekday fit. Everything that depends on the cart (theatre, seat types,
+number of seats, the time of booking, first booking) is then checked
+against those few candidates, so evaluating a cart costs no queries. The one exception is an EXISTS over the customer's
+bookings, made only when a candidate is for first bookings only.
+
+The index is rebuilt when the offers table changes: its generation is the
+number of offers and their latest updated_at, read from the database (one
+aggregate query) at most every OFFERS_INDEX_CHECK_SECONDS. The process that
+made a change drops its index right away (offers.signals); other processes
+notice within that interval. Bulk updates must set updated_at themselves;
+counting a redemption deliberately does not.
+
+One offer applies per booking, whichever discounts most: automatic offers
+apply by themselves, a promo code only when it is entered.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from bookings.models import Booking
+from shows.listings import normalize_city
+from .models import Offer
+
+CENTS = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+class OfferError(ValueError):
+    pass
+
+
+class CompiledOffer(NamedTuple):
+    id: int
+    name: str
+    code: Optional[str]
+    percent: bool
+    value: Decimal
+    max_discount: Optional[Decimal]
+    movie_id: Optional[int]
+    theatre_id: Optional[int]
+    city: str
+    weekdays: frozenset
+    seat_types: frozenset
+    min_seats: int
+    first_booking_only: bool
+    starts_at: object
+    ends_at: object
+    limited: bool
+
+    def fits_show(self, city, movie_id, day):
+        return (
+            (not self.city or self.city == normalize_city(city))
+            and (self.movie_id is None or self.movie_id == movie_id)
+            and (not self.weekdays or day.weekday() in self.weekdays)
+        )
+
+    def problem(self, theatre_id, seats, now):
+        """Why the offer does not apply to the cart, or None."""
+        if self.theatre_id is not None and self.theatre_id != theatre_id:
+            return "is not valid at this theatre"
+        if (self.starts_at and now < self.starts_at) or (self.ends_at and now >= self.ends_at):
+            return "is not valid now"
+        if len(self.eligible(seats)) < self.min_seats:
+            return f"needs at least {self.min_seats} eligible seats"
+        return None
+
+    def eligible(self, seats):
+        return [price for price, seat_type in seats if not self.seat_types or seat_type in self.seat_types]
+
+    def discount(self, seats):
+        amount = sum(self.eligible(seats), Decimal('0'))
+        discount = amount * self.value / HUNDRED if self.percent else self.value
+        if self.max_discount is not None:
+            discount = min(discount, self.max_discount)
+        return min(discount, amount).quantize(CENTS)
+
+
+class Quote(NamedTuple):
+    subtotal: Decimal
+    discount: Decimal
+    total: Decimal
+    offer: Optional[CompiledOffer]
+
+
+def compile_offer(offer):
+    return CompiledOffer(
+        id=offer.id, name=offer.name, code=offer.code, percent=offer.discount_type == 'PERCENT',
+        value=offer.value, max_discount=offer.max_discount, movie_id=offer.movie_id,
+        theatre_id=offer.theatre_id, city=normalize_city(offer.city), weekdays=frozenset(offer.weekdays),
+        seat_types=frozenset(offer.seat_types), min_seats=offer.min_seats,
+        first_booking_only=offer.first_booking_only, starts_at=offer.starts_at, ends_at=offer.ends_at,
+        limited=offer.max_uses is not None,
+    )
+
+
+class OfferIndex:
+    def __init__(self, offers, generation, max_entries=10_000):
+        self.generation = generation
+        self.checked = time.monotonic()
+        self.automatic = [offer for offer in offers if offer.code is None]
+        self.codes = {offer.code.upper(): offer for offer in offers if offer.code is not None}
+        self.max_entries = max_entries
+        self._candidates = OrderedDict()
+
+    @classmethod
+    def build(cls, generation):
+        now = timezone.now()
+        offers = (
+            Offer.objects.filter(is_active=True)
+            .filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+            .filter(Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses')))
+        )
+        return cls([compile_offer(offer) for offer in offers], generation)
+
+    def candidates(self, city, movie_id, day):
+        """Automatic offers that can apply to shows of ``movie_id`` in ``city`` on ``day``."""
+        city = normalize_city(city)
+        key = (city, movie_id, day)
+        found = self._candidates.pop(key, None)
+        if found is None:
+            found = tuple(offer for offer in self.automatic if offer.fits_show(city, movie_id, day))
+        self._candidates[key] = found
+        while len(self._candidates) > self.max_entries:
+            self._candidates.popitem(last=False)
+        return found
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _generation():
+    row = Offer.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return row['count'], row['updated']
+
+
+def get_index():
+    global _index
+    index = _index
+    max_age = getattr(settings, 'OFFERS_INDEX_CHECK_SECONDS', 5)
+    if index is not None and time.monotonic() - index.checked < max_age:
+        return index
+    generation = _generation()
+    if index is not None and index.generation == generation:
+        index.checked = time.monotonic()
+        return index
+    with _lock:
+        if _index is None or _index.generation != generation:
+            _index = OfferIndex.build(generation)
+        return _index
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def evaluate(user, show, seats, promo_code=None, exclude=()):
+    """
+    The best Quote for ``seats`` ((price, seat type) pairs) of ``show``
+    ((movie id, theatre id, city, date)). Offers in ``exclude`` (ids) are
+    skipped.
+
+    Raises OfferError if ``promo_code`` is unknown or does not apply.
+    """
+    movie_id, theatre_id, city, day = show
+    subtotal = sum((price for price, _ in seats), Decimal('0'))
+    index = get_index()
+    now = timezone.now()
+    first_booking = None
+
+    def applies(offer):
+        nonlocal first_booking
+        problem = offer.problem(theatre_id, seats, now)
+        if problem is None and offer.first_booking_only:
+            if first_booking is None:
+                first_booking = not Booking.objects.filter(user=user).exclude(status='CANCELLED').exists()
+            if not first_booking:
+                problem = "is for first bookings only"
+        return problem
+
+    best, best_discount = None, Decimal('0')
+    if promo_code:
+        offer = index.codes.get(promo_code.strip().upper())
+        if offer is None or offer.id in exclude:
+            raise OfferError("Unknown or expired promo code")
+        problem = "is not valid for this show" if not offer.fits_show(city, movie_id, day) else applies(offer)
+        if problem:
+            raise OfferError(f"Promo code {offer.code} {problem}")
+        best, best_discount = offer, offer.discount(seats)
+    for offer in index.candidates(city, movie_id, day):
+        if offer.id in exclude or applies(offer):
+            continue
+        discount = offer.discount(seats)
+        if discount > best_discount:
+            best, best_discount = offer, discount
+    return Quote(subtotal, best_discount, subtotal - best_discount, best)
+
+
+def redeem(offer):
+    """Count a redemption of ``offer``; False if it has run out."""
+    if not offer.limited:
+        return True
+    return bool(Offer.objects.filter(pk=offer.id, uses__lt=F('max_uses')).update(uses=F('uses') + 1))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('theatres', '0003_screen_layout'),
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Offer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('code', models.CharField(blank=True, max_length=30, null=True, unique=True)),
+                ('discount_type', models.CharField(choices=[('PERCENT', 'Percent'), ('FLAT', 'Flat')], default='PERCENT', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('max_discount', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('weekdays', models.JSONField(blank=True, default=list)),
+                ('seat_types', models.JSONField(blank=True, default=list)),
+                ('min_seats', models.PositiveIntegerField(default=1)),
+                ('first_booking_only', models.BooleanField(default=False)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('max_uses', models.PositiveIntegerField(blank=True, null=True)),
+                ('uses', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('movie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='movies.movie')),
+                ('theatre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='theatres.theatre')),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import models
+from movies.models import Movie
+from theatres.models import Theatre
+
+class Offer(models.Model):
+    """A discount, applied at checkout by offers.evaluator"""
+    DISCOUNT_TYPES = (
+        ('PERCENT', 'Percent'),
+        ('FLAT', 'Flat'),
+    )
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    # Promo codes apply when the customer enters them; offers without a code apply by themselves
+    code = models.CharField(max_length=30, unique=True, null=True, blank=True)
+    discount_type = models.CharField(max_length=10, choices=DISCOUNT_TYPES, default='PERCENT')
+    value = models.DecimalField(max_digits=8, decimal_places=2) # Percent or amount
+    max_discount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    # Conditions, all of which must hold; empty means any
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True, related_name='offers')
+    theatre = models.ForeignKey(Theatre, on_delete=models.CASCADE, null=True, blank=True, related_name='offers')
+    city = models.CharField(max_length=100, blank=True)
+    weekdays = models.JSONField(default=list, blank=True) # Show.date weekdays, Monday is 0
+    seat_types = models.JSONField(default=list, blank=True) # Only these seats are discounted
+    min_seats = models.PositiveIntegerField(default=1)
+    first_booking_only = models.BooleanField(default=False)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    # Redemptions are only counted for offers with a limit
+    max_uses = models.PositiveIntegerField(null=True, blank=True)
+    uses = models.PositiveIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Other processes rebuild their offer index when this moves, see offers.evaluator
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.code or self.name
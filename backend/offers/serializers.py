@@ -0,0 +1,41 @@
+from rest_framework import serializers
+from seats.models import Seat
+from .models import Offer
+
+SEAT_TYPES = {seat_type for seat_type, _ in Seat.SEAT_TYPES}
+
+class OfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Offer
+        fields = '__all__'
+        read_only_fields = ('uses',)
+
+    def validate_code(self, value):
+        # Codes are matched case-insensitively, see offers.evaluator
+        return (value or '').strip().upper() or None
+
+    def validate_weekdays(self, value):
+        if not isinstance(value, list) or not all(day in range(7) for day in value):
+            raise serializers.ValidationError("A list of weekdays, Monday is 0")
+        return sorted(set(value))
+
+    def validate_seat_types(self, value):
+        if not isinstance(value, list) or not set(value) <= SEAT_TYPES:
+            raise serializers.ValidationError(f"A list of seat types out of {', '.join(sorted(SEAT_TYPES))}")
+        return sorted(set(value))
+
+    def validate(self, attrs):
+        discount_type = attrs.get('discount_type', getattr(self.instance, 'discount_type', 'PERCENT'))
+        value = attrs.get('value', getattr(self.instance, 'value', None))
+        if value is not None and (value <= 0 or (discount_type == 'PERCENT' and value > 100)):
+            raise serializers.ValidationError({'value': "Must be above 0, and at most 100 for a percentage"})
+        starts_at = attrs.get('starts_at', getattr(self.instance, 'starts_at', None))
+        ends_at = attrs.get('ends_at', getattr(self.instance, 'ends_at', None))
+        if starts_at and ends_at and starts_at >= ends_at:
+            raise serializers.ValidationError({'ends_at': "Must be after starts_at"})
+        return attrs
+
+class OfferQuoteSerializer(serializers.Serializer):
+    show = serializers.IntegerField()
+    seat_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    promo_code = serializers.CharField(max_length=30, required=False)
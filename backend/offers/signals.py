@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import evaluator
+from .models import Offer
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def offer_changed(sender, update_fields=None, **kwargs):
+    # Counting a redemption does not change what applies where
+    if update_fields is not None and set(update_fields) <= {'uses'}:
+        return
+    evaluator.invalidate()
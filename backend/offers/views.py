@@ -0,0 +1,55 @@
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from bookings.checkout import cart
+from bookmyshowcase.throttling import PromoCodeRateThrottle
+from seats.models import ShowSeat
+from users.permissions import IsAdmin, is_admin
+from . import evaluator
+from .models import Offer
+from .serializers import OfferSerializer, OfferQuoteSerializer
+
+class OfferViewSet(viewsets.ModelViewSet):
+    queryset = Offer.objects.all()
+    serializer_class = OfferSerializer
+    filter_params = {'movie': 'movie_id', 'theatre': 'theatre_id', 'city': ('city__lower', str.lower)}
+    ordering_fields = ['id', 'ends_at']
+    ordering = ['-id']
+
+    def get_permissions(self):
+        if self.action in ('list', 'retrieve'):
+            return []
+        if self.action == 'quote':
+            return [IsAuthenticated()]
+        return [IsAdmin()]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if is_admin(self.request):
+            return queryset
+        # Everyone else sees the offers they can use
+        return queryset.filter(Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()), is_active=True)
+
+    @action(detail=False, methods=['post'], throttle_classes=[PromoCodeRateThrottle])
+    def quote(self, request):
+        """What checkout would charge for these seats, with the best offer."""
+        serializer = OfferQuoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        show, seats = cart(ShowSeat.objects.filter(show_id=data['show'], id__in=data['seat_ids']))
+        if not seats:
+            return Response({'error': 'No such seats for this show'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            quote = evaluator.evaluate(request.user, show, seats, data.get('promo_code'))
+        except evaluator.OfferError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        offer = quote.offer
+        return Response({
+            'subtotal': str(quote.subtotal),
+            'discount': str(quote.discount),
+            'total': str(quote.total),
+            'offer': offer and {'id': offer.id, 'name': offer.name, 'code': offer.code},
+        })
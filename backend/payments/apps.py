@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class PaymentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'payments'
+
+    def ready(self):
+        from bookmyshowcase import metrics
+        from . import jobs
+
+        metrics.collectors.append(jobs.collect)
@@ -0,0 +1,133 @@
+"""
+Payment gateways.
+
+A gateway has three parts, split by where they run:
+
+* checkout_params() runs on the checkout request and must not make network
+  calls. It returns what the client needs to pay with the gateway: the
+  payment's reference and amount, signed where the gateway wants that.
+* parse_callback() runs on the gateway's callback request. It checks the
+  signature and reads the result, again without network calls.
+* verify() and refund() run on the payments worker (payments.jobs) and may
+  call the gateway's API.
+
+PAYMENT_GATEWAY names the class. FakeGateway stands in for a real one in
+development and tests: pay() plays the customer and returns the callback
+the gateway would send. It is only the default with DEBUG on; otherwise
+PAYMENT_GATEWAY and PAYMENT_GATEWAY_SECRET must be set.
+"""
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class GatewayError(Exception):
+    pass
+
+
+class Callback(NamedTuple):
+    reference: str
+    transaction_id: str
+    succeeded: bool
+    reason: str = ''
+
+
+class PaymentGateway:
+    name = None
+
+    def checkout_params(self, payment):
+        raise NotImplementedError
+
+    def parse_callback(self, body, headers):
+        """A Callback from the raw request ``body``; GatewayError if it is not genuine."""
+        raise NotImplementedError
+
+    def verify(self, payment):
+        """(succeeded, reason) for ``payment``'s transaction, asked of the gateway."""
+        raise NotImplementedError
+
+    def refund(self, payment):
+        raise NotImplementedError
+
+
+class FakeGateway(PaymentGateway):
+    """
+    An in-process gateway. Callbacks are signed with HMAC-SHA256 over the
+    body in the X-Signature header. There is no API to ask, so verify()
+    trusts the signed callback; any process can settle a payment.
+    FAKE_GATEWAY_LATENCY_MS adds a delay to verify() and refund(), as a real
+    gateway's API calls would.
+    """
+    name = 'fake'
+
+    def __init__(self):
+        secret = getattr(settings, 'PAYMENT_GATEWAY_SECRET', '')
+        if not secret:
+            raise ImproperlyConfigured("PAYMENT_GATEWAY_SECRET is not set")
+        self.secret = secret.encode()
+        self.refunds = set()
+        self._lock = threading.Lock()
+
+    def _sign(self, body):
+        return hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+
+    def _call_api(self):
+        latency = getattr(settings, 'FAKE_GATEWAY_LATENCY_MS', 0)
+        if latency:
+            time.sleep(latency / 1000)
+
+    def checkout_params(self, payment):
+        return {
+            'gateway': self.name,
+            'reference': payment.reference,
+            'amount': str(payment.amount),
+            'signature': self._sign(f'{payment.reference}:{payment.amount}'.encode()),
+        }
+
+    def pay(self, reference, succeed=True, reason=''):
+        """Pay ``reference`` as a customer would: the (body, headers) of the gateway's callback."""
+        transaction_id = f'fake_{secrets.token_hex(8)}'
+        body = json.dumps({
+            'reference': reference, 'transaction_id': transaction_id,
+            'status': 'SUCCESS' if succeed else 'FAILURE', 'reason': reason,
+        }).encode()
+        return body, {'X-Signature': self._sign(body)}
+
+    def parse_callback(self, body, headers):
+        if not hmac.compare_digest(self._sign(body), headers.get('X-Signature', '')):
+            raise GatewayError("Bad signature")
+        try:
+            data = json.loads(body)
+            return Callback(data['reference'], data['transaction_id'], data['status'] == 'SUCCESS', data.get('reason', ''))
+        except (ValueError, KeyError, TypeError):
+            raise GatewayError("Malformed callback")
+
+    def verify(self, payment):
+        self._call_api()
+        return payment.succeeded, payment.failure_reason
+
+    def refund(self, payment):
+        self._call_api()
+        with self._lock:
+            self.refunds.add(payment.transaction_id)
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        path = getattr(settings, 'PAYMENT_GATEWAY', '')
+        if not path:
+            raise ImproperlyConfigured("PAYMENT_GATEWAY is not set")
+        _gateway = import_string(path)()
+    return _gateway
@@ -0,0 +1,250 @@
+"""
+Payment confirmation, off the request path.
+
+The gateway's callback (receive()) does as little as it can. One
+conditional UPDATE moves the payment from PENDING to RECEIVED, with the
+gateway's transaction id and result, and the worker is woken up.
+
+Gateways retry a callback until they get a 2xx, often several times. This
+process remembers the transaction ids it has taken in an LRU
+(PAYMENTS_CALLBACK_LRU_SIZE), so a retry is answered without touching the
+database. A retry that reaches another process finds the payment no longer
+PENDING. The unique index on Payment.transaction_id keeps one transaction
+from settling two payments.
+
+The RECEIVED rows are the job queue: process() settles them, oldest first.
+For each payment it:
+
+1. asks the gateway whether a reported success is real (verify(), a
+   network call);
+2. in one transaction, marks the payment SUCCEEDED or FAILED, and the
+   booking CONFIRMED, or CANCELLED with its seats released.
+
+Every step is a conditional UPDATE, so a payment is settled once however
+many workers see it. A payment that succeeds for a booking the sweeper
+already cancelled becomes REFUND_PENDING. It stays in the queue, and is
+tried again on later passes, until the gateway's refund() goes through.
+
+Run the worker with ``manage.py process_payments --loop``, or set
+PAYMENTS_WORKER_IN_PROCESS to run it on a daemon thread of the web
+server (see bookmyshowcase.background). There, callbacks wake it up at
+once; otherwise it polls every PAYMENTS_WORKER_INTERVAL_SECONDS.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from bookings import rollup
+from bookings.models import Booking
+from bookings.sweeper import release_seats
+from .gateways import get_gateway
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+metrics = {
+    'callbacks': 0,
+    'duplicate_callbacks': 0,
+    'confirmed': 0,
+    'failed': 0,
+    'refunded': 0,
+    'errors': 0,
+}
+_metrics_lock = threading.Lock()
+
+
+class UnknownPayment(Exception):
+    pass
+
+
+class TransactionConflict(Exception):
+    """The transaction id belongs to another payment, or the payment to another transaction."""
+
+
+def _count(name, value=1):
+    with _metrics_lock:
+        metrics[name] += value
+
+
+class _SeenTransactions:
+    def __init__(self):
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, transaction_id):
+        with self._lock:
+            if transaction_id in self._ids:
+                self._ids.move_to_end(transaction_id)
+                return True
+            return False
+
+    def add(self, transaction_id):
+        with self._lock:
+            self._ids[transaction_id] = True
+            self._ids.move_to_end(transaction_id)
+            while len(self._ids) > getattr(settings, 'PAYMENTS_CALLBACK_LRU_SIZE', 10_000):
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+seen = _SeenTransactions()
+_wakeup = threading.Event()
+
+
+def receive(callback):
+    """
+    Record a gateway Callback and queue its payment. Returns False for a
+    retry of a callback already recorded.
+
+    Raises UnknownPayment or TransactionConflict.
+    """
+    if callback.transaction_id in seen:
+        _count('duplicate_callbacks')
+        return False
+    try:
+        with transaction.atomic():
+            received = Payment.objects.filter(reference=callback.reference, status='PENDING').update(
+                status='RECEIVED', transaction_id=callback.transaction_id, succeeded=callback.succeeded,
+                failure_reason=callback.reason[:255], updated_at=timezone.now(),
+            )
+    except IntegrityError:
+        raise TransactionConflict(f"Transaction {callback.transaction_id} already settled another payment")
+    if not received:
+        # Taken already (by another process), or not ours
+        known = list(Payment.objects.filter(reference=callback.reference).values_list('transaction_id', flat=True)[:1])
+        if not known:
+            raise UnknownPayment(callback.reference)
+        if known[0] != callback.transaction_id:
+            raise TransactionConflict(f"Payment {callback.reference} was settled by another transaction")
+    seen.add(callback.transaction_id)
+    if not received:
+        _count('duplicate_callbacks')
+        return False
+    _count('callbacks')
+    transaction.on_commit(_wakeup.set)
+    return True
+
+
+def settle(payment, gateway=None):
+    """Settle one RECEIVED payment; returns what happened to it."""
+    gateway = gateway or get_gateway()
+    succeeded, reason = False, payment.failure_reason
+    if payment.succeeded:
+        succeeded, reason = gateway.verify(payment)
+    now = timezone.now()
+
+    with transaction.atomic():
+        settled = Payment.objects.filter(pk=payment.pk, status='RECEIVED').update(
+            status='SUCCEEDED' if succeeded else 'FAILED', failure_reason=(reason or '')[:255], updated_at=now,
+        )
+        if not settled:
+            return 'skipped'
+        bookings = Booking.objects.filter(pk=payment.booking_id, status='PENDING')
+        rows = list(bookings.values_list('id', 'show_id', 'booking_date', 'total_amount'))
+        if succeeded:
+            if rows and bookings.update(status='CONFIRMED', transaction_id=payment.transaction_id):
+                rollup.move_bookings(rows, 'PENDING', 'CONFIRMED')
+                outcome = 'confirmed'
+            else:
+                Payment.objects.filter(pk=payment.pk).update(status='REFUND_PENDING')
+                outcome = 'refunded'
+        else:
+            if rows and bookings.update(status='CANCELLED'):
+                release_seats([payment.booking_id])
+                rollup.move_bookings(rows, 'PENDING', 'CANCELLED')
+            outcome = 'failed'
+
+    if outcome == 'refunded':
+        # The booking was cancelled (and its seats possibly resold) before the money arrived
+        return refund(payment, gateway)
+    _count(outcome)
+    return outcome
+
+
+def refund(payment, gateway=None):
+    """
+    Refund a REFUND_PENDING payment. If the gateway raises, the payment is
+    left REFUND_PENDING (at the back of the queue) for the next pass.
+    """
+    gateway = gateway or get_gateway()
+    try:
+        gateway.refund(payment)
+    except Exception:
+        Payment.objects.filter(pk=payment.pk, status='REFUND_PENDING').update(updated_at=timezone.now())
+        raise
+    if not Payment.objects.filter(pk=payment.pk, status='REFUND_PENDING').update(status='REFUNDED', updated_at=timezone.now()):
+        return 'skipped'
+    _count('refunded')
+    return 'refunded'
+
+
+def process(limit=None):
+    """Settle or refund up to ``limit`` queued payments, oldest first; returns counts per outcome."""
+    limit = limit or getattr(settings, 'PAYMENTS_WORKER_BATCH_SIZE', 100)
+    gateway = get_gateway()
+    result = {'confirmed': 0, 'failed': 0, 'refunded': 0, 'skipped': 0, 'errors': 0}
+    queued = Payment.objects.filter(status__in=['RECEIVED', 'REFUND_PENDING']).order_by('updated_at')
+    for payment in queued[:limit]:
+        try:
+            if payment.status == 'REFUND_PENDING':
+                result[refund(payment, gateway)] += 1
+            else:
+                result[settle(payment, gateway)] += 1
+        except Exception:
+            # Left RECEIVED or REFUND_PENDING; the next pass tries again
+            logger.exception("Settling payment %s failed", payment.reference)
+            _count('errors')
+            result['errors'] += 1
+    return result
+
+
+def collect():
+    """Payment totals for bookmyshowcase.metrics."""
+    with _metrics_lock:
+        snapshot = dict(metrics)
+    return [
+        ('payments_callbacks_total', 'counter', 'Gateway callbacks recorded.', snapshot['callbacks']),
+        ('payments_duplicate_callbacks_total', 'counter', 'Gateway callback retries answered without a change.',
+         snapshot['duplicate_callbacks']),
+        ('payments_confirmed_total', 'counter', 'Payments that confirmed their booking.', snapshot['confirmed']),
+        ('payments_failed_total', 'counter', 'Failed payments; their bookings were cancelled.', snapshot['failed']),
+        ('payments_refunded_total', 'counter', 'Payments refunded because their booking was gone.',
+         snapshot['refunded']),
+        ('payments_errors_total', 'counter', 'Settlement attempts that raised.', snapshot['errors']),
+    ]
+
+
+def run_forever(interval=None, stop=None):
+    """Call process() until ``stop`` (an Event) is set, waiting up to ``interval`` seconds between passes."""
+    interval = interval or getattr(settings, 'PAYMENTS_WORKER_INTERVAL_SECONDS', 2)
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            result = process()
+        except Exception:
+            logger.exception("Payment worker pass failed")
+            result = {}
+        # A full batch means there is more waiting
+        if sum(result.values()) < getattr(settings, 'PAYMENTS_WORKER_BATCH_SIZE', 100):
+            _wakeup.wait(interval)
+
+
+_thread = None
+
+
+def start_in_process():
+    """Start run_forever() on a daemon thread, once per process."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=run_forever, name='payments-worker', daemon=True)
+        _thread.start()
+    return _thread
@@ -0,0 +1,33 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from payments import jobs
+
+
+class Command(BaseCommand):
+    help = "Settle payments the gateway has reported: confirm or cancel their bookings, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep processing until interrupted")
+        parser.add_argument('--interval', type=float, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            result = jobs.process()
+            self.stdout.write(self.style.SUCCESS(
+                f"Confirmed {result['confirmed']}, failed {result['failed']}, refunded {result['refunded']} "
+                f"payments ({result['errors']} errors)"
+            ))
+            return
+
+        stop = threading.Event()
+        try:
+            jobs.run_forever(options['interval'], stop)
+        except KeyboardInterrupt:
+            stop.set()
+        metrics = jobs.metrics
+        self.stdout.write(
+            f"Stopped: {metrics['confirmed']} payments confirmed, {metrics['failed']} failed, "
+            f"{metrics['refunded']} refunded"
+        )
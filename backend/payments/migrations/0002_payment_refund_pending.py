@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RECEIVED', 'Received'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed'), ('REFUND_PENDING', 'Refund pending'), ('REFUNDED', 'Refunded')], default='PENDING', max_length=15),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import models
+from bookings.models import Booking
+
+class Payment(models.Model):
+    """A payment for a PENDING booking, settled by payments.jobs"""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),      # Waiting for the customer to pay
+        ('RECEIVED', 'Received'),    # The gateway called back; queued for confirmation
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+        ('REFUND_PENDING', 'Refund pending'),  # Paid for a booking that had already been cancelled
+        ('REFUNDED', 'Refunded'),
+    )
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payments')
+    gateway = models.CharField(max_length=30)
+    # Our order id, as the gateway knows it
+    reference = models.CharField(max_length=32, unique=True)
+    # The gateway's id for the transaction; unique, so one transaction settles one payment
+    transaction_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
+    succeeded = models.BooleanField(null=True) # As the gateway reported it
+    failure_reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='payment_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.reference} for booking {self.booking_id}: {self.status}"
@@ -0,0 +1,55 @@
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from bookmyshowcase.idempotency import IdempotentMixin
+from users.permissions import is_admin
+from . import jobs
+from .gateways import FakeGateway, GatewayError, get_gateway
+from .models import Payment
+from .serializers import PaymentSerializer
+
+class PaymentViewSet(IdempotentMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Payment.objects.all()
+    serializer_class = PaymentSerializer
+    permission_classes = [IsAuthenticated]
+    filter_params = {'booking': 'booking_id', 'status': 'status'}
+    ordering_fields = ['id', 'created_at']
+    ordering = ['-id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if is_admin(self.request):
+            return queryset
+        return queryset.filter(booking__user=self.request.user)
+
+    @action(detail=False, methods=['post'], permission_classes=[], authentication_classes=[], throttle_classes=[])
+    def callback(self, request):
+        """The gateway's report of a payment; settled later by payments.jobs."""
+        try:
+            callback = get_gateway().parse_callback(request.body, request.headers)
+            received = jobs.receive(callback)
+        except GatewayError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except jobs.UnknownPayment:
+            return Response({'error': 'Unknown payment'}, status=status.HTTP_404_NOT_FOUND)
+        except jobs.TransactionConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        if received:
+            return Response({'status': 'received'}, status=status.HTTP_202_ACCEPTED)
+        return Response({'status': 'duplicate'})
+
+    @action(detail=True, methods=['post'])
+    def pay(self, request, pk=None):
+        """Pay with FakeGateway, as the customer would on the gateway's page (development only)."""
+        gateway = get_gateway()
+        if not isinstance(gateway, FakeGateway):
+            return Response({'error': 'Pay through the payment gateway'}, status=status.HTTP_404_NOT_FOUND)
+        payment = self.get_object()
+        succeed = request.data.get('succeed', True) not in (False, 'false', '0')
+        callback = gateway.parse_callback(*gateway.pay(payment.reference, succeed))
+        try:
+            jobs.receive(callback)
+        except jobs.TransactionConflict:
+            return Response({'error': 'Payment already made'}, status=status.HTTP_409_CONFLICT)
+        return Response({'status': 'received'}, status=status.HTTP_202_ACCEPTED)
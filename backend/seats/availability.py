@@ -0,0 +1,250 @@
+"""
+Compact per-show seat availability.
+
+Each show is kept as a status vector indexed by seat ordinal (ShowSeat.ordinal,
+the seat's position in its screen's layout template) plus the ordinal ranges
+covered by each seat type, which come from the template (seats.layouts). A
+client can draw the seat map from the template and the vector alone. Reads
+are served from a pluggable backend, selected with
+the SEAT_AVAILABILITY_BACKEND setting:
+
+* LocalAvailabilityBackend (default) keeps vectors in process memory and
+  patches them in place on every status transition made through this
+  module. Entries also expire after SEAT_AVAILABILITY_MAX_AGE seconds so
+  that workers which did not see a transition converge quickly.
+* CacheAvailabilityBackend stores vectors in Django's cache so that all
+  workers share them; transitions simply drop the cached vector.
+
+Async views read through aget_availability(), which uses the backends'
+aget() so a cache round trip does not block the event loop.
+
+Code that changes ShowSeat.status with queryset.update() must report it
+through seat_status_changed() or invalidate(); single-row saves are picked
+up by the signals in seats.signals. Both also publish the change to clients
+watching the show, see seats.events.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from theatres.models import Screen
+from . import events, layouts
+from .models import ShowSeat
+
+STATUS_CODES = {'AVAILABLE': '0', 'LOCKED': '1', 'BOOKED': '2'}
+
+
+class ShowAvailability:
+    __slots__ = ('show_id', 'show_seat_ids', 'ordinals', 'zones', 'layout', 'status', 'expires_at')
+
+    def __init__(self, show_id, rows, max_age, layout=None):
+        """
+        ``rows`` are (show_seat_id, seat_type, status, locked_until) in ordinal
+        order. With the screen's ``layout`` the zones come from the template
+        and seat_type is not needed.
+        """
+        now = timezone.now()
+        self.show_id = show_id
+        self.show_seat_ids = []
+        self.ordinals = {}
+        self.zones = {} if layout is None else layouts.zones(layout)
+        self.layout = layout
+        self.status = bytearray()
+        expires_at = time.time() + max_age
+
+        for ordinal, (show_seat_id, seat_type, status, locked_until) in enumerate(rows):
+            if status == 'LOCKED':
+                if locked_until is None or locked_until < now:
+                    status = 'AVAILABLE'
+                else:
+                    expires_at = min(expires_at, locked_until.timestamp())
+            self.show_seat_ids.append(show_seat_id)
+            self.ordinals[show_seat_id] = ordinal
+            self.status.append(ord(STATUS_CODES[status]))
+            if layout is None:
+                ranges = self.zones.setdefault(seat_type, [])
+                if ranges and ranges[-1][1] == ordinal:
+                    ranges[-1][1] = ordinal + 1
+                else:
+                    ranges.append([ordinal, ordinal + 1])
+        self.expires_at = expires_at
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def apply(self, show_seat_ids, status, until=None):
+        code = ord(STATUS_CODES[status])
+        for show_seat_id in show_seat_ids:
+            ordinal = self.ordinals.get(show_seat_id)
+            if ordinal is not None:
+                self.status[ordinal] = code
+        if until is not None:
+            self.expires_at = min(self.expires_at, until.timestamp())
+
+    def counts(self):
+        counts = {}
+        for seat_type, ranges in self.zones.items():
+            by_status = dict.fromkeys(STATUS_CODES, 0)
+            for start, stop in ranges:
+                chunk = self.status[start:stop]
+                for status, code in STATUS_CODES.items():
+                    by_status[status] += chunk.count(ord(code))
+            counts[seat_type] = by_status
+        return counts
+
+    def as_dict(self, include_ids=False, include_layout=False):
+        data = {
+            'show': self.show_id,
+            'seats': len(self.status),
+            'status': self.status.decode(),
+            'zones': self.zones,
+            'counts': self.counts(),
+        }
+        if include_ids:
+            data['show_seat_ids'] = self.show_seat_ids
+        if include_layout:
+            data['layout'] = self.layout
+        return data
+
+
+class LocalAvailabilityBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, show_id):
+        with self._lock:
+            entry = self._entries.get(show_id)
+            if entry is None or entry.expired:
+                return None
+            self._entries.move_to_end(show_id)
+            return entry
+
+    async def aget(self, show_id):
+        # Process memory, nothing to wait on
+        return self.get(show_id)
+
+    def set(self, entry):
+        with self._lock:
+            self._entries[entry.show_id] = entry
+            self._entries.move_to_end(entry.show_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def apply(self, show_id, show_seat_ids, status, until=None):
+        with self._lock:
+            entry = self._entries.get(show_id)
+            if entry is not None:
+                entry.apply(show_seat_ids, status, until)
+
+    def invalidate(self, show_id):
+        with self._lock:
+            self._entries.pop(show_id, None)
+
+
+class CacheAvailabilityBackend:
+    key_prefix = 'seat-availability'
+
+    def _key(self, show_id):
+        return f'{self.key_prefix}:{show_id}'
+
+    def get(self, show_id):
+        entry = cache.get(self._key(show_id))
+        if entry is None or entry.expired:
+            return None
+        return entry
+
+    async def aget(self, show_id):
+        entry = await cache.aget(self._key(show_id))
+        if entry is None or entry.expired:
+            return None
+        return entry
+
+    def set(self, entry):
+        cache.set(self._key(entry.show_id), entry, max(1, int(entry.expires_at - time.time())))
+
+    def apply(self, show_id, show_seat_ids, status, until=None):
+        # Read-modify-write would race between workers, rebuild instead
+        self.invalidate(show_id)
+
+    def invalidate(self, show_id):
+        cache.delete(self._key(show_id))
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEAT_AVAILABILITY_BACKEND', 'seats.availability.LocalAvailabilityBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+def load(show_id):
+    max_age = getattr(settings, 'SEAT_AVAILABILITY_MAX_AGE', 30)
+    layout = Screen.objects.filter(shows=show_id).values_list('layout', flat=True).first()
+    rows = list(
+        ShowSeat.objects.filter(show_id=show_id)
+        .order_by('ordinal')
+        .values_list('id', 'ordinal', 'status', 'locked_until')
+    )
+    # The template only describes the vector if every seat has its ShowSeat
+    if layout is not None and len(rows) == layouts.seat_count(layout) and all(
+        row[1] == ordinal for ordinal, row in enumerate(rows)
+    ):
+        return ShowAvailability(show_id, [(id_, None, status, until) for id_, _, status, until in rows], max_age, layout)
+    rows = (
+        ShowSeat.objects.filter(show_id=show_id)
+        .order_by('ordinal', 'seat_id')
+        .values_list('id', 'seat__seat_type', 'status', 'locked_until')
+    )
+    return ShowAvailability(show_id, rows, max_age)
+
+
+def get_availability(show_id):
+    show_id = int(show_id)
+    backend = get_backend()
+    entry = backend.get(show_id)
+    if entry is None:
+        entry = load(show_id)
+        backend.set(entry)
+    return entry
+
+
+async def aget_availability(show_id):
+    entry = await get_backend().aget(int(show_id))
+    if entry is None:
+        entry = await sync_to_async(get_availability)(show_id)
+    return entry
+
+
+def seat_status_changed(show_id, show_seat_ids, status, until=None):
+    """Patch the cached vector once the surrounding transaction commits."""
+    show_id, show_seat_ids = int(show_id), list(show_seat_ids)
+
+    def changed():
+        get_backend().apply(show_id, show_seat_ids, status, until)
+        events.publish_changes(show_id, show_seat_ids, status, until)
+
+    transaction.on_commit(changed)
+
+
+def invalidate(show_id):
+    show_id = int(show_id)
+
+    def changed():
+        get_backend().invalidate(show_id)
+        events.publish_resync(show_id)
+
+    transaction.on_commit(changed)
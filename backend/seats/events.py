@@ -0,0 +1,192 @@
+"""
+Seat status deltas pushed to clients of a show.
+
+Every status transition reported to seats.availability is also published
+here as a compact event, numbered per show:
+
+    {"seq": 42, "seats": {"1051": "LOCKED", "1052": "LOCKED"}, "until": "..."}
+
+Events are kept in a bounded ring buffer per show, so a client that
+reconnects with the last ``seq`` it saw gets what it missed. Changes that
+are only known as "something in this show changed" (and clients that fell
+further behind than the buffer) get a ``resync`` event instead, meaning:
+re-read the availability endpoint.
+
+A client should subscribe first, then fetch availability: statuses in
+events are absolute, so applying an event the snapshot already contains
+is harmless, while the reverse order can lose one.
+
+The broker is selected with the SEAT_EVENTS_BROKER setting:
+
+* LocalSeatEventBroker (default) keeps the buffers in process memory. It
+  only sees transitions made in the same process, which is enough for a
+  single worker (e.g. one uvicorn worker per host behind sticky routing).
+* CacheSeatEventBroker keeps them in Django's cache so that every worker
+  sharing it (Redis, Memcached) sees every event.
+
+Only astream(), under ASGI, waits for events: it polls the broker on the
+event loop. Under WSGI a waiting client would hold a whole sync worker, so
+there a stream is just snapshot(), the events so far, and the client
+reconnects after the ``retry`` delay; a poll answers at once the same way.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+
+def buffer_size():
+    return getattr(settings, 'SEAT_EVENTS_BUFFER_SIZE', 256)
+
+
+class LocalSeatEventBroker:
+    def __init__(self, max_shows=4096):
+        self.max_shows = max_shows
+        self._shows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, show_id, event):
+        with self._lock:
+            seq, events = self._shows.get(show_id, (0, None))
+            if events is None:
+                events = deque(maxlen=buffer_size())
+            seq += 1
+            events.append({'seq': seq, **event})
+            self._shows[show_id] = (seq, events)
+            self._shows.move_to_end(show_id)
+            while len(self._shows) > self.max_shows:
+                self._shows.popitem(last=False)
+        return seq
+
+    def read(self, show_id, since=None):
+        """
+        Return ``(seq, events)``: the latest sequence number of the show and
+        the events after ``since``, or None if some of them were dropped.
+        """
+        with self._lock:
+            seq, events = self._shows.get(show_id, (0, ()))
+            if since is None or since >= seq:
+                return seq, []
+            if not events or events[0]['seq'] > since + 1:
+                return seq, None
+            return seq, [event for event in events if event['seq'] > since]
+
+    async def aread(self, show_id, since=None):
+        # Process memory, nothing to wait on
+        return self.read(show_id, since)
+
+
+class CacheSeatEventBroker:
+    key_prefix = 'seat-events'
+
+    def _key(self, show_id, suffix):
+        return f'{self.key_prefix}:{show_id}:{suffix}'
+
+    def publish(self, show_id, event):
+        seq_key = self._key(show_id, 'seq')
+        cache.add(seq_key, 0, None)
+        seq = cache.incr(seq_key)
+        # Long enough for a full buffer to turn over on a busy show
+        cache.set(self._key(show_id, seq), {'seq': seq, **event}, 3600)
+        return seq
+
+    def read(self, show_id, since=None):
+        seq = cache.get(self._key(show_id, 'seq'), 0)
+        if since is None or since >= seq:
+            return seq, []
+        if seq - since > buffer_size():
+            return seq, None
+        keys = [self._key(show_id, n) for n in range(since + 1, seq + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return seq, None
+        return seq, [found[key] for key in keys]
+
+    async def aread(self, show_id, since=None):
+        return await sync_to_async(self.read)(show_id, since)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'SEAT_EVENTS_BROKER', 'seats.events.LocalSeatEventBroker')
+        _broker = import_string(path)()
+    return _broker
+
+
+def publish_changes(show_id, show_seat_ids, status, until=None):
+    event = {'seats': {str(show_seat_id): status for show_seat_id in show_seat_ids}}
+    if until is not None:
+        event['until'] = until.isoformat()
+    return get_broker().publish(show_id, event)
+
+
+def publish_resync(show_id):
+    return get_broker().publish(show_id, {'resync': True})
+
+
+def _frame(event, data, seq=None):
+    lines = [] if seq is None else [f'id: {seq}']
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def _frames(seq, events):
+    if events is None:
+        return [_frame('resync', {'seq': seq}, seq)]
+    return [
+        _frame('resync' if event.get('resync') else 'seats', event, event['seq'])
+        for event in events
+    ]
+
+
+def snapshot(show_id, since=None):
+    """
+    The opening of a server-sent event stream: the ``ready`` frame with the
+    current ``seq``, followed by the events after ``since``.
+    """
+    return _opening(*get_broker().read(show_id, since))
+
+
+async def asnapshot(show_id, since=None):
+    return _opening(*await get_broker().aread(show_id, since))
+
+
+def _opening(seq, events):
+    return 'retry: 2000\n' + _frame('ready', {'seq': seq}, seq) + ''.join(_frames(seq, events))
+
+
+async def astream(show_id, since=None, poll_interval=0.25):
+    """
+    Yield server-sent event frames for ``show_id`` until
+    SEAT_EVENTS_STREAM_MAX_SECONDS; the client then reconnects with
+    Last-Event-ID.
+    """
+    broker = get_broker()
+    max_seconds = getattr(settings, 'SEAT_EVENTS_STREAM_MAX_SECONDS', 300)
+    heartbeat = getattr(settings, 'SEAT_EVENTS_HEARTBEAT_SECONDS', 15)
+    started = last_sent = time.monotonic()
+    seq, events = await broker.aread(show_id, since)
+    yield _opening(seq, events)
+    if events:
+        seq = events[-1]['seq']
+
+    while time.monotonic() - started < max_seconds:
+        await asyncio.sleep(poll_interval)
+        seq, events = await broker.aread(show_id, seq)
+        if events != []:
+            yield ''.join(_frames(seq, events))
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
@@ -0,0 +1,144 @@
+"""
+Seat holds for checkout.
+
+A hold moves a set of ShowSeat rows from AVAILABLE to LOCKED with a single
+conditional UPDATE, so two buyers racing for the same seats can never both
+win: the database only lets one UPDATE match a given row (InnoDB takes row
+locks on the matched rows, SQLite serialises writers). Holds carry a random
+token and the user who took them, who alone can extend, release or check
+them out (bookings.checkout), and expire after SEAT_HOLD_TTL_SECONDS; an
+expired hold is treated as AVAILABLE by every write below, so stale locks
+are reclaimed lazily. The
+expiry sweeper (bookings.sweeper) also returns them to AVAILABLE in the
+background, so that counts and reports stay accurate.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import availability
+from .models import ShowSeat
+
+
+class SeatUnavailable(Exception):
+    def __init__(self, seat_ids):
+        self.seat_ids = sorted(seat_ids)
+        super().__init__(f"Seats not available: {self.seat_ids}")
+
+
+class HoldNotFound(Exception):
+    pass
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'SEAT_HOLD_TTL_SECONDS', 600))
+
+
+def claimable(now):
+    # Seats that a new hold or booking may take
+    return Q(status='AVAILABLE') | Q(status='LOCKED', locked_until__lt=now)
+
+
+def active_hold(token, user, now):
+    return Q(status='LOCKED', hold_token=token, held_by=user, locked_until__gte=now)
+
+
+def _unique_ids(seat_ids):
+    ids = {int(seat_id) for seat_id in seat_ids}
+    if not ids:
+        raise ValueError("At least one seat is required")
+    return ids
+
+
+def hold_seats(show_id, seat_ids, user, ttl=None):
+    """
+    Lock all of ``seat_ids`` for ``show_id`` for ``user``, or none of them.
+
+    Returns ``(token, expires_at)``. Raises SeatUnavailable listing the
+    seats that could not be taken.
+    """
+    ids = _unique_ids(seat_ids)
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    expires_at = now + (ttl or hold_ttl())
+
+    try:
+        with transaction.atomic():
+            locked = ShowSeat.objects.filter(claimable(now), show_id=show_id, id__in=ids).update(
+                status='LOCKED', hold_token=token, held_by=user, locked_until=expires_at
+            )
+            if locked != len(ids):
+                # Roll back the partial hold, the caller gets all seats or none
+                raise SeatUnavailable(())
+    except SeatUnavailable:
+        free = ShowSeat.objects.filter(claimable(now), show_id=show_id, id__in=ids).values_list('id', flat=True)
+        raise SeatUnavailable(ids - set(free))
+
+    availability.seat_status_changed(show_id, ids, 'LOCKED', until=expires_at)
+    return token, expires_at
+
+
+def extend_hold(show_id, token, user, ttl=None):
+    now = timezone.now()
+    expires_at = now + (ttl or hold_ttl())
+    extended = ShowSeat.objects.filter(active_hold(token, user, now), show_id=show_id).update(locked_until=expires_at)
+    if not extended:
+        raise HoldNotFound(token)
+    return expires_at
+
+
+def release_hold(show_id, token, user, seat_ids=None):
+    """Return ``user``'s held seats to AVAILABLE. Releasing an unknown hold is a no-op."""
+    seats = ShowSeat.objects.filter(show_id=show_id, status='LOCKED', hold_token=token, held_by=user)
+    if seat_ids is not None:
+        seats = seats.filter(id__in=_unique_ids(seat_ids))
+    ids = list(seats.values_list('id', flat=True))
+    if not ids:
+        return 0
+    released = seats.filter(id__in=ids).update(status='AVAILABLE', hold_token=None, held_by=None, locked_until=None)
+    if released == len(ids):
+        availability.seat_status_changed(show_id, ids, 'AVAILABLE')
+    elif released:
+        availability.invalidate(show_id)
+    return released
+
+
+def release_expired(show_id=None, now=None, batch_size=500):
+    """
+    Return expired holds to AVAILABLE and report how many seats were freed.
+
+    Expired seats are found through the (status, locked_until) index and
+    released ``batch_size`` at a time, each batch in its own short
+    transaction, so a big show never keeps ShowSeat rows locked for long.
+    """
+    now = now or timezone.now()
+    expired = ShowSeat.objects.filter(status='LOCKED', locked_until__lt=now)
+    if show_id is not None:
+        expired = expired.filter(show_id=show_id)
+
+    released = 0
+    while True:
+        batch = list(expired.order_by('locked_until').values_list('id', 'show_id')[:batch_size])
+        if not batch:
+            return released
+        by_show = defaultdict(list)
+        for seat_id, seat_show_id in batch:
+            by_show[seat_show_id].append(seat_id)
+        with transaction.atomic():
+            count = expired.filter(id__in=[seat_id for seat_id, _ in batch]).update(
+                status='AVAILABLE', hold_token=None, held_by=None, locked_until=None,
+            )
+            for seat_show_id, ids in by_show.items():
+                if count == len(batch):
+                    availability.seat_status_changed(seat_show_id, ids, 'AVAILABLE')
+                else:
+                    # Some were re-held or extended meanwhile
+                    availability.invalidate(seat_show_id)
+        released += count
+        if len(batch) < batch_size:
+            return released
@@ -0,0 +1,62 @@
+"""
+Materialise ShowSeat rows for shows.
+
+Every Seat of a show's screen gets one ShowSeat, priced by the show's
+pricing rules for an empty house (see seats.pricing). Rows are
+written with bulk_create in batches, and shows are processed in chunks so
+that a week of showtimes for a whole multiplex costs a handful of queries
+per chunk rather than one per seat. Running it again only fills in missing
+rows.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from shows.models import Show
+from . import availability, pricing
+from .models import Seat, ShowSeat
+
+
+def materialize_show_seats(shows, rules=None, batch_size=2000, chunk_size=500):
+    """
+    Create the missing ShowSeat rows for ``shows`` (a Show queryset or ids).
+
+    Returns the number of rows created.
+    """
+    if not hasattr(shows, 'values_list'):
+        shows = Show.objects.filter(id__in=list(shows))
+    show_rows = list(shows.order_by('id').values_list('id', 'screen_id', 'price', 'date', 'time'))
+    rules = rules or pricing.Rules.from_settings()
+
+    created = 0
+    seats_by_screen = {}
+    for chunk in pricing.chunks(show_rows, chunk_size):
+        screen_ids = {row[1] for row in chunk} - seats_by_screen.keys()
+        if screen_ids:
+            for screen_id in screen_ids:
+                seats_by_screen[screen_id] = []
+            for seat_id, screen_id, seat_type, ordinal in (
+                Seat.objects.filter(screen_id__in=screen_ids).order_by('ordinal')
+                .values_list('id', 'screen_id', 'seat_type', 'ordinal')
+            ):
+                seats_by_screen[screen_id].append((seat_id, seat_type, ordinal))
+
+        existing = defaultdict(set)
+        for show_id, seat_id in ShowSeat.objects.filter(show_id__in=[row[0] for row in chunk]).values_list('show_id', 'seat_id'):
+            existing[show_id].add(seat_id)
+
+        rows = []
+        for show_id, screen_id, price, show_date, show_time in chunk:
+            key = rules.key(price, show_date, show_time)
+            taken = existing.get(show_id, ())
+            for seat_id, seat_type, ordinal in seats_by_screen[screen_id]:
+                if seat_id not in taken:
+                    rows.append(ShowSeat(show_id=show_id, seat_id=seat_id, ordinal=ordinal, price=rules.price(key, seat_type)))
+
+        if rows:
+            with transaction.atomic():
+                ShowSeat.objects.bulk_create(rows, batch_size=batch_size)
+                for show_id, *_ in chunk:
+                    availability.invalidate(show_id)
+            created += len(rows)
+    return created
@@ -0,0 +1,244 @@
+"""
+Screen layout templates.
+
+A screen's seats are described once, in Screen.layout:
+
+    {"rows": [
+        {"row": "A", "type": "SILVER", "seats": [[1, 10], [13, 22]]},
+        {"row": "B", "type": "SILVER", "seats": [[1, 10], [13, 22, "GOLD"]]},
+        ...
+    ]}
+
+Each row lists inclusive seat number ranges. The numbers are the seat's
+column, so missing numbers (11 and 12 above) are aisles. A range may
+override the row's seat type. Seats are numbered with a dense ordinal in
+template order: rows as listed, seat numbers ascending. ShowSeat rows carry
+the same ordinal, so a show's availability is a status vector that lines
+up with expand(layout), see seats.availability.
+
+apply() makes a screen's Seat rows match a template. refresh() works the
+other way round: it renumbers the screen's Seat rows and rebuilds the
+template from them, for code that creates or deletes single seats (the
+seats API). Either way Screen.capacity is the number of seats. Code that
+creates Seat rows in bulk must set their ordinals and call refresh().
+"""
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from shows.models import Show
+from theatres.models import Screen
+from . import availability, inventory
+from .models import Seat, ShowSeat
+
+SEAT_TYPES = {seat_type for seat_type, _ in Seat.SEAT_TYPES}
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def normalize(layout):
+    """
+    Validate ``layout`` and return it in canonical form: every row has a
+    type, and a range only names its type when that differs from the row's.
+    """
+    if not isinstance(layout, dict) or not isinstance(layout.get('rows'), list) or not layout['rows']:
+        raise LayoutError("A layout needs a non-empty list of rows")
+    rows, labels = [], set()
+    for row in layout['rows']:
+        if not isinstance(row, dict):
+            raise LayoutError("Each row must be an object")
+        label, ranges = row.get('row'), row.get('seats')
+        if not isinstance(label, str) or not label or len(label) > 5:
+            raise LayoutError(f"Invalid row label {label!r}")
+        if label in labels:
+            raise LayoutError(f"Row {label} appears twice")
+        labels.add(label)
+        if not isinstance(ranges, list) or not ranges:
+            raise LayoutError(f"Row {label} has no seats")
+        seats, previous = [], 0
+        for seat_range in ranges:
+            if not isinstance(seat_range, list) or len(seat_range) not in (2, 3):
+                raise LayoutError(f"Row {label}: ranges are [first, last] or [first, last, type]")
+            first, last = seat_range[:2]
+            if not all(isinstance(n, int) and not isinstance(n, bool) for n in (first, last)) or not previous < first <= last:
+                raise LayoutError(f"Row {label}: seat ranges must be ascending and not overlap")
+            if last > 99999:
+                raise LayoutError(f"Row {label}: seat numbers go up to 99999")
+            seats.append((first, last, seat_range[2] if len(seat_range) == 3 else row.get('type')))
+            previous = last
+        rows.append(_row(label, seats))
+    return {'rows': rows}
+
+
+def _row(label, seats):
+    """A canonical row from (first, last, type) ranges."""
+    for _, _, seat_type in seats:
+        if seat_type not in SEAT_TYPES:
+            raise LayoutError(f"Row {label}: unknown seat type {seat_type!r}")
+    row_type = seats[0][2]
+    return {
+        'row': label,
+        'type': row_type,
+        'seats': [[first, last] if seat_type == row_type else [first, last, seat_type] for first, last, seat_type in seats],
+    }
+
+
+def expand(layout):
+    """(row, seat number, seat type) per seat, in ordinal order."""
+    return [
+        (row['row'], number, seat_range[2] if len(seat_range) == 3 else row.get('type'))
+        for row in layout['rows']
+        for seat_range in row['seats']
+        for number in range(seat_range[0], seat_range[1] + 1)
+    ]
+
+
+def seat_count(layout):
+    return sum(seat_range[1] - seat_range[0] + 1 for row in layout['rows'] for seat_range in row['seats'])
+
+
+def zones(layout):
+    """Ordinal ranges [start, stop) per seat type."""
+    result, ordinal = {}, 0
+    for row in layout['rows']:
+        for seat_range in row['seats']:
+            first, last = seat_range[:2]
+            seat_type = seat_range[2] if len(seat_range) == 3 else row.get('type')
+            ranges = result.setdefault(seat_type, [])
+            stop = ordinal + last - first + 1
+            if ranges and ranges[-1][1] == ordinal:
+                ranges[-1][1] = stop
+            else:
+                ranges.append([ordinal, stop])
+            ordinal = stop
+    return result
+
+
+def from_seats(seats):
+    """
+    The template for ``seats``, (row, seat number, seat type) in ordinal
+    order, or None if they do not fit one (seat numbers that are not
+    integers, or an order other than row by row with ascending numbers).
+    """
+    rows = []
+    for label, number, seat_type in seats:
+        try:
+            number = int(number)
+        except ValueError:
+            return None
+        if not rows or rows[-1][0] != label:
+            if any(row[0] == label for row in rows):
+                return None
+            rows.append((label, []))
+        ranges = rows[-1][1]
+        if ranges and number <= ranges[-1][1]:
+            return None
+        if ranges and number == ranges[-1][1] + 1 and ranges[-1][2] == seat_type:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number, seat_type])
+    try:
+        return {'rows': [_row(label, ranges) for label, ranges in rows]} if rows else None
+    except LayoutError:
+        return None
+
+
+def template_order(seats):
+    """
+    ``seats`` (tuples starting id, row, seat number) sorted into
+    template order: rows in order of first appearance, then by number.
+    Seats whose numbers are not integers keep their order, at the end.
+    """
+    first_seen = {}
+    for seat in seats:
+        first_seen.setdefault(seat[1], len(first_seen))
+
+    def key(seat):
+        number = seat[2]
+        return (0, first_seen[seat[1]], int(number), 0) if number.isdigit() else (1, 0, 0, seat[0])
+    return sorted(seats, key=key)
+
+
+def _sync_show_seat_ordinals(screen_id):
+    ShowSeat.objects.filter(seat__screen_id=screen_id).update(
+        ordinal=Subquery(Seat.objects.filter(pk=OuterRef('seat_id')).values('ordinal')[:1])
+    )
+
+
+def _changed(screen_id):
+    # Seat types moved: the shows' prices no longer match their pricing key
+    shows = Show.objects.filter(screen_id=screen_id)
+    shows.update(pricing_key='')
+    for show_id in shows.values_list('id', flat=True):
+        availability.invalidate(show_id)
+
+
+@transaction.atomic
+def apply(screen, layout):
+    """
+    Make ``screen``'s Seat rows match ``layout``: seats are matched by row
+    and number, keep their ids and get their new ordinal and type. Missing
+    seats are created and get ShowSeats for the screen's shows. Seats no
+    longer in the layout are deleted, which is refused (LayoutError) while
+    any of their ShowSeats is held, booked or part of a booking.
+    """
+    layout = normalize(layout)
+    wanted = expand(layout)
+    positions = {(row, str(number)): ordinal for ordinal, (row, number, _) in enumerate(wanted)}
+    existing = list(Seat.objects.select_for_update().filter(screen=screen))
+
+    removed = [seat.id for seat in existing if (seat.row_number, seat.seat_number) not in positions]
+    if removed:
+        if ShowSeat.objects.filter(Q(booking__isnull=False) | ~Q(status='AVAILABLE'), seat_id__in=removed).exists():
+            raise LayoutError("Seats that are held or booked for a show cannot be removed")
+        ShowSeat.objects.filter(seat_id__in=removed).delete()
+        Seat.objects.filter(id__in=removed).delete()
+
+    changed, matched = [], set()
+    for seat in existing:
+        ordinal = positions.get((seat.row_number, seat.seat_number))
+        if ordinal is None:
+            continue
+        seat_type = wanted[ordinal][2]
+        matched.add(ordinal)
+        if (seat.ordinal, seat.seat_type) != (ordinal, seat_type):
+            seat.ordinal, seat.seat_type = ordinal, seat_type
+            changed.append(seat)
+    Seat.objects.bulk_update(changed, ['ordinal', 'seat_type'], batch_size=1000)
+    Seat.objects.bulk_create([
+        Seat(screen=screen, row_number=row, seat_number=str(number), seat_type=seat_type, ordinal=ordinal)
+        for ordinal, (row, number, seat_type) in enumerate(wanted) if ordinal not in matched
+    ], batch_size=1000)
+
+    screen.layout = layout
+    screen.capacity = len(wanted)
+    screen.save(update_fields=['layout', 'capacity'])
+    if changed:
+        _sync_show_seat_ordinals(screen.id)
+    # The screen's existing shows get ShowSeats for the new seats
+    inventory.materialize_show_seats(screen.shows.all())
+    _changed(screen.id)
+    return layout
+
+
+@transaction.atomic
+def refresh(screen_id):
+    """Renumber ``screen_id``'s seats densely and rebuild its template and capacity."""
+    seats = template_order(list(
+        Seat.objects.select_for_update().filter(screen_id=screen_id)
+        .order_by('ordinal', 'id').values_list('id', 'row_number', 'seat_number', 'seat_type', 'ordinal')
+    ))
+    moved = [
+        Seat(id=seat_id, ordinal=ordinal)
+        for ordinal, (seat_id, _, _, _, current) in enumerate(seats) if current != ordinal
+    ]
+    Seat.objects.bulk_update(moved, ['ordinal'], batch_size=1000)
+    if moved:
+        _sync_show_seat_ordinals(screen_id)
+    screen = Screen.objects.get(pk=screen_id)
+    screen.layout = from_seats((row, number, seat_type) for _, row, number, seat_type, _ in seats)
+    screen.capacity = len(seats)
+    screen.save(update_fields=['layout', 'capacity'])
+    _changed(screen_id)
+    return screen.layout
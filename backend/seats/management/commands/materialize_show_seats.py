@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shows.models import Show
+from seats.inventory import materialize_show_seats
+
+
+class Command(BaseCommand):
+    help = "Create the missing ShowSeat rows for shows, priced from Show.price and the seat type."
+
+    def add_arguments(self, parser):
+        parser.add_argument('show_ids', nargs='*', type=int, help="Shows to materialise")
+        parser.add_argument('--from-date', help="First show date (YYYY-MM-DD)")
+        parser.add_argument('--to-date', help="Last show date (YYYY-MM-DD)")
+        parser.add_argument('--theatre', type=int, help="Only shows in this theatre")
+        parser.add_argument('--all', action='store_true', help="Every show")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        shows = Show.objects.all()
+        if options['show_ids']:
+            shows = shows.filter(id__in=options['show_ids'])
+        if options['from_date']:
+            shows = shows.filter(date__gte=options['from_date'])
+        if options['to_date']:
+            shows = shows.filter(date__lte=options['to_date'])
+        if options['theatre']:
+            shows = shows.filter(screen__theatre_id=options['theatre'])
+        filtered = any(options[name] for name in ('show_ids', 'from_date', 'to_date', 'theatre'))
+        if not filtered and not options['all']:
+            raise CommandError("Pass show ids, a date range, --theatre or --all")
+
+        started = time.perf_counter()
+        created = materialize_show_seats(shows, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Created {created} show seats in {elapsed:.2f}s"))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shows.listings import normalize_city
+from shows.models import Show
+from seats.pricing import reprice
+
+
+class Command(BaseCommand):
+    help = "Reprice the available seats of shows from the pricing rules and how full each show is."
+
+    def add_arguments(self, parser):
+        parser.add_argument('show_ids', nargs='*', type=int, help="Shows to reprice")
+        parser.add_argument('--city', help="Only shows in this city")
+        parser.add_argument('--from-date', help="First show date (YYYY-MM-DD)")
+        parser.add_argument('--to-date', help="Last show date (YYYY-MM-DD)")
+        parser.add_argument('--after', help="Only shows starting at or after this time (HH:MM)")
+        parser.add_argument('--all', action='store_true', help="Every show")
+        parser.add_argument('--force', action='store_true', help="Rewrite prices even if nothing they depend on changed")
+
+    def handle(self, *args, **options):
+        shows = Show.objects.all()
+        if options['show_ids']:
+            shows = shows.filter(id__in=options['show_ids'])
+        if options['city']:
+            shows = shows.filter(screen__theatre__city__lower=normalize_city(options['city']))
+        if options['from_date']:
+            shows = shows.filter(date__gte=options['from_date'])
+        if options['to_date']:
+            shows = shows.filter(date__lte=options['to_date'])
+        if options['after']:
+            shows = shows.filter(time__gte=options['after'])
+        filtered = any(options[name] for name in ('show_ids', 'city', 'from_date', 'to_date', 'after'))
+        if not filtered and not options['all']:
+            raise CommandError("Pass show ids, --city, a date range, --after or --all")
+
+        started = time.perf_counter()
+        result = reprice(shows, force=options['force'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Repriced {result['repriced']} of {result['shows']} shows, {result['seats']} seats "
+            f"in {result['statements']} updates, in {elapsed:.2f}s"
+        ))
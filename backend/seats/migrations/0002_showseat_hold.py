@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showseat',
+            name='hold_token',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='showseat',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seats', '0002_showseat_hold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='showseat',
+            index=models.Index(fields=['show', 'status'], name='showseat_show_status_idx'),
+        ),
+    ]
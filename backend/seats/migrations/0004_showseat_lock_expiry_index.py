@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seats', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='showseat',
+            index=models.Index(fields=['status', 'locked_until'], name='showseat_status_locked_idx'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Copies of seats.layouts as of this migration, so later changes there
+# cannot change what it does
+SEAT_TYPES = {'SILVER', 'GOLD', 'PLATINUM'}
+
+
+def template_order(seats):
+    """(id, row, seat number, ...) tuples, rows in order of first appearance, then by number."""
+    first_seen = {}
+    for seat in seats:
+        first_seen.setdefault(seat[1], len(first_seen))
+
+    def key(seat):
+        number = seat[2]
+        return (0, first_seen[seat[1]], int(number), 0) if number.isdigit() else (1, 0, 0, seat[0])
+    return sorted(seats, key=key)
+
+
+def from_seats(seats):
+    """The layout of (row, seat number, seat type) seats, or None if they do not fit one."""
+    rows = []
+    for label, number, seat_type in seats:
+        try:
+            number = int(number)
+        except ValueError:
+            return None
+        if not rows or rows[-1][0] != label:
+            if any(row[0] == label for row in rows):
+                return None
+            rows.append((label, []))
+        ranges = rows[-1][1]
+        if ranges and number <= ranges[-1][1]:
+            return None
+        if ranges and number == ranges[-1][1] + 1 and ranges[-1][2] == seat_type:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number, seat_type])
+    if not rows or any(seat_type not in SEAT_TYPES for _, ranges in rows for _, _, seat_type in ranges):
+        return None
+    return {'rows': [
+        {
+            'row': label,
+            'type': ranges[0][2],
+            'seats': [[first, last] if seat_type == ranges[0][2] else [first, last, seat_type] for first, last, seat_type in ranges],
+        }
+        for label, ranges in rows
+    ]}
+
+
+def assign_ordinals(apps, schema_editor):
+    """Number every screen's seats in template order and derive its layout."""
+    Screen = apps.get_model('theatres', 'Screen')
+    Seat = apps.get_model('seats', 'Seat')
+    ShowSeat = apps.get_model('seats', 'ShowSeat')
+    for screen_id in list(Screen.objects.values_list('id', flat=True)):
+        seats = template_order(list(
+            Seat.objects.filter(screen_id=screen_id).order_by('id').values_list('id', 'row_number', 'seat_number', 'seat_type')
+        ))
+        if not seats:
+            continue
+        Seat.objects.bulk_update(
+            [Seat(id=seat_id, ordinal=ordinal) for ordinal, (seat_id, *_) in enumerate(seats)], ['ordinal'], batch_size=1000,
+        )
+        Screen.objects.filter(pk=screen_id).update(
+            layout=from_seats((row, number, seat_type) for _, row, number, seat_type in seats), capacity=len(seats),
+        )
+    ShowSeat.objects.update(ordinal=Subquery(Seat.objects.filter(pk=OuterRef('seat_id')).values('ordinal')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seats', '0004_showseat_lock_expiry_index'),
+        ('theatres', '0003_screen_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seat',
+            name='ordinal',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='showseat',
+            name='ordinal',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(assign_ordinals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='seat',
+            name='ordinal',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='showseat',
+            name='ordinal',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['screen', 'ordinal'], name='seat_screen_ordinal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='showseat',
+            index=models.Index(fields=['show', 'ordinal'], name='showseat_show_ordinal_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from theatres.models import Screen
 from shows.models import Show
@@ -12,6 +13,12 @@ class Seat(models.Model):
     row_number = models.CharField(max_length=5) # e.g., "A", "B", "11"
     seat_number = models.CharField(max_length=5) # e.g., "1", "2"
     seat_type = models.CharField(max_length=10, choices=SEAT_TYPES)
+    ordinal = models.PositiveIntegerField() # Dense position in the screen's layout, see seats.layouts
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['screen', 'ordinal'], name='seat_screen_ordinal_idx'),
+        ]
 
     def __str__(self):
         return f"{self.row_number}-{self.seat_number} ({self.screen.name})"
@@ -26,9 +33,18 @@ class ShowSeat(models.Model):
     seat = models.ForeignKey(Seat, on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='AVAILABLE')
     price = models.DecimalField(max_digits=6, decimal_places=2) # Could override base show price
+    hold_token = models.CharField(max_length=32, null=True, blank=True) # Set while LOCKED, see seats.holds
+    held_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    ordinal = models.PositiveIntegerField() # Copy of seat.ordinal, indexes the availability vector
 
     class Meta:
         unique_together = ('show', 'seat')
+        indexes = [
+            models.Index(fields=['show', 'status'], name='showseat_show_status_idx'),
+            models.Index(fields=['status', 'locked_until'], name='showseat_status_locked_idx'),
+            models.Index(fields=['show', 'ordinal'], name='showseat_show_ordinal_idx'),
+        ]
 
     def __str__(self):
         return f"{self.seat} for {self.show} - {self.status}"
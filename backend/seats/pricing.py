@@ -0,0 +1,187 @@
+"""
+Seat pricing rules, applied to ShowSeat.price in bulk.
+
+A seat costs Show.price times four multipliers:
+
+* seat type      SEAT_TYPE_PRICE_MULTIPLIERS
+* time of day    the last SEAT_PRICING_RULES['time_of_day'] band that starts
+                 at or before Show.time
+* weekday        SEAT_PRICING_RULES['weekdays'] for Show.date, Monday is 0
+* occupancy      the highest SEAT_PRICING_RULES['occupancy'] band that the
+                 show's share of BOOKED seats has reached
+
+rounded to SEAT_PRICING_RULES['round_to']. Every input except the seat type
+is the same for all seats of a show, so a show's prices come down to a
+small key, and the price table of each key is computed once.
+
+reprice() writes the prices of many shows at once. Shows are grouped by
+seat type, price and the ordinal ranges of that seat type (from the screen's
+layout, see seats.layouts), and each group is one UPDATE of the AVAILABLE
+seats in those ranges, with no join. The key last written for each show is
+kept in Show.pricing_key, in the same transaction as its prices, so a show
+whose key has not changed is skipped by every later run, whichever process
+makes it. seats.layouts clears the key of a screen's shows when the screen's
+seats are retyped. Held and booked seats keep the price they were held or
+sold at.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from shows.models import Show
+from . import layouts
+from .models import Seat, ShowSeat
+
+DEFAULT_MULTIPLIERS = {'SILVER': '1.00', 'GOLD': '1.25', 'PLATINUM': '1.50'}
+CENTS = Decimal('0.01')
+
+
+def seat_type_multipliers():
+    configured = getattr(settings, 'SEAT_TYPE_PRICE_MULTIPLIERS', DEFAULT_MULTIPLIERS)
+    return {seat_type: Decimal(str(value)) for seat_type, value in configured.items()}
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Rules:
+    def __init__(self, seat_types, time_of_day=(), weekdays=None, occupancy=(), round_to='0.01'):
+        self.seat_types = {seat_type: Decimal(str(value)) for seat_type, value in seat_types.items()}
+        self.time_of_day = sorted((time.fromisoformat(start), Decimal(str(value))) for start, value in time_of_day)
+        self.weekdays = {int(day): Decimal(str(value)) for day, value in (weekdays or {}).items()}
+        self.occupancy = sorted((float(share), Decimal(str(value))) for share, value in occupancy)
+        self.round_to = Decimal(str(round_to))
+        self.version = hashlib.md5(json.dumps(
+            [sorted(seat_types.items()), list(time_of_day), sorted((weekdays or {}).items()), list(occupancy), round_to],
+            default=str,
+        ).encode()).hexdigest()[:8]
+        self._tables = {}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(seat_type_multipliers(), **getattr(settings, 'SEAT_PRICING_RULES', {}))
+
+    @staticmethod
+    def _band(bands, value):
+        """Index of the last band starting at or before ``value``, or -1."""
+        index = -1
+        for position, (start, _) in enumerate(bands):
+            if start > value:
+                break
+            index = position
+        return index
+
+    def key(self, price, show_date, show_time, booked_share=0.0):
+        """Everything a show's prices depend on."""
+        return (
+            self.version, str(price), self._band(self.time_of_day, show_time), show_date.weekday(),
+            self._band(self.occupancy, booked_share),
+        )
+
+    def prices(self, key):
+        """Price per seat type for a key."""
+        table = self._tables.get(key)
+        if table is None:
+            _, price, time_band, weekday, occupancy_band = key
+            multiplier = (
+                (self.time_of_day[time_band][1] if time_band >= 0 else 1)
+                * self.weekdays.get(weekday, 1)
+                * (self.occupancy[occupancy_band][1] if occupancy_band >= 0 else 1)
+            )
+            base = Decimal(price) * multiplier
+            table = {
+                seat_type: (base * seat_multiplier).quantize(self.round_to)
+                for seat_type, seat_multiplier in self.seat_types.items()
+            }
+            table[None] = base.quantize(self.round_to)
+            self._tables[key] = table
+        return table
+
+    def price(self, key, seat_type):
+        table = self.prices(key)
+        return table.get(seat_type, table[None])
+
+
+def _marker(key):
+    return ':'.join(map(str, key))
+
+
+def booked_shares(show_ids):
+    counts = (
+        ShowSeat.objects.filter(show_id__in=show_ids).values('show_id')
+        .annotate(seats=Count('id'), booked=Count('id', filter=Q(status='BOOKED')))
+    )
+    return {row['show_id']: row['booked'] / row['seats'] for row in counts if row['seats']}
+
+
+def reprice(shows, force=False, rules=None, chunk_size=500):
+    """
+    Reprice the AVAILABLE seats of ``shows`` (a Show queryset or ids).
+
+    Shows whose key has not changed since the last reprice are skipped
+    unless ``force``. Returns counts of shows, shows repriced, seats
+    updated and UPDATE statements.
+    """
+    if not hasattr(shows, 'values_list'):
+        shows = Show.objects.filter(id__in=list(shows))
+    rules = rules or Rules.from_settings()
+    rows = list(shows.order_by('id').values_list(
+        'id', 'screen_id', 'price', 'date', 'time', 'screen__layout', 'pricing_key',
+    ))
+    result = {'shows': len(rows), 'repriced': 0, 'seats': 0, 'statements': 0}
+    seat_ids = {}
+
+    for chunk in chunks(rows, chunk_size):
+        shares = booked_shares([row[0] for row in chunk])
+        written = defaultdict(list)
+        by_zone = defaultdict(list)
+        by_screen = defaultdict(list)
+        for show_id, screen_id, price, show_date, show_time, layout, previous in chunk:
+            key = rules.key(price, show_date, show_time, shares.get(show_id, 0.0))
+            if not force and previous == _marker(key):
+                continue
+            written[_marker(key)].append(show_id)
+            if layout is not None:
+                for seat_type, ranges in layouts.zones(layout).items():
+                    by_zone[seat_type, rules.price(key, seat_type), tuple(map(tuple, ranges))].append(show_id)
+            else:
+                for seat_type in rules.prices(key):
+                    by_screen[seat_type, rules.price(key, seat_type), screen_id].append(show_id)
+
+        with transaction.atomic():
+            for (_, price, ranges), show_ids in by_zone.items():
+                in_ranges = Q()
+                for start, stop in ranges:
+                    in_ranges |= Q(ordinal__gte=start, ordinal__lt=stop)
+                result['seats'] += ShowSeat.objects.filter(
+                    in_ranges, show_id__in=show_ids, status='AVAILABLE'
+                ).update(price=price)
+                result['statements'] += 1
+            # Screens without a layout: name their seats of the type instead
+            for (seat_type, price, screen_id), show_ids in by_screen.items():
+                if screen_id not in seat_ids:
+                    seat_ids[screen_id] = defaultdict(list)
+                    for seat_id, type_ in Seat.objects.filter(screen_id=screen_id).values_list('id', 'seat_type'):
+                        seat_ids[screen_id][type_].append(seat_id)
+                ids = seat_ids[screen_id][seat_type] if seat_type is not None else [
+                    seat_id for type_, type_ids in seat_ids[screen_id].items()
+                    if type_ not in rules.seat_types for seat_id in type_ids
+                ]
+                if ids:
+                    result['seats'] += ShowSeat.objects.filter(
+                        show_id__in=show_ids, seat_id__in=ids, status='AVAILABLE'
+                    ).update(price=price)
+                    result['statements'] += 1
+            # Remembered with the prices, so a failed chunk is retried next run
+            for marker, show_ids in written.items():
+                Show.objects.filter(id__in=show_ids).update(pricing_key=marker)
+        result['repriced'] += sum(map(len, written.values()))
+    return result
@@ -0,0 +1,33 @@
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from shows.models import Show
+from . import availability, inventory
+from .models import Seat, ShowSeat
+
+
+@receiver(pre_save, sender=Seat)
+def seat_ordinal(sender, instance, raw=False, **kwargs):
+    # A seat created on its own goes last; seats.layouts.refresh() puts it in place
+    if instance.ordinal is None and not raw:
+        top = Seat.objects.filter(screen_id=instance.screen_id).aggregate(top=Max('ordinal'))['top']
+        instance.ordinal = 0 if top is None else top + 1
+
+
+@receiver(pre_save, sender=ShowSeat)
+def show_seat_ordinal(sender, instance, raw=False, **kwargs):
+    if instance.ordinal is None and not raw:
+        instance.ordinal = Seat.objects.values_list('ordinal', flat=True).get(pk=instance.seat_id)
+
+
+@receiver(post_save, sender=ShowSeat)
+@receiver(post_delete, sender=ShowSeat)
+def show_seat_changed(sender, instance, **kwargs):
+    availability.invalidate(instance.show_id)
+
+
+@receiver(post_save, sender=Show)
+def show_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        inventory.materialize_show_seats([instance.id])
@@ -16,6 +16,8 @@ django.setup()
 from movies.models import Movie
 from theatres.models import Theatre, Screen
 from shows.models import Show
+from seats import layouts
+from seats.inventory import materialize_show_seats
 from users.models import CustomUser
 
 def seed():
@@ -109,6 +111,12 @@ def seed():
     for theatre in created_theatres:
         # Create a screen if none
         screen, _ = Screen.objects.get_or_create(theatre=theatre, name="Screen 1", defaults={"capacity": 100})
+        if not screen.seats.exists():
+            # 10 rows x 10 seats; new shows get their ShowSeats from seats.signals
+            layouts.apply(screen, {'rows': [
+                {'row': row, 'type': seat_type, 'seats': [[1, 10]]}
+                for row, seat_type in zip("ABCDEFGHIJ", ["SILVER"] * 6 + ["GOLD"] * 2 + ["PLATINUM"] * 2)
+            ]})
         
         for movie in created_movies:
             # Create 2 shows per movie per theatre
@@ -126,6 +134,11 @@ def seed():
                 if created:
                     print(f"Created Show: {movie.title} at {theatre.name} ({show_time.time()})")
 
+    # Shows seeded before their screen had seats
+    created = materialize_show_seats(Show.objects.filter(screen__theatre__in=created_theatres))
+    if created:
+        print(f"Created {created} show seats")
+
     print("Seeding Complete!")
 
 if __name__ == '__main__':
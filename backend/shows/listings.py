@@ -0,0 +1,102 @@
+"""
+Showtime listings grouped movie -> theatre -> showtimes for a city and date.
+
+A listing is built from a single values() query and cached per (city, date)
+in Django's cache. Cities are matched case-insensitively, and the key holds a
+hash of the normalised city, so "New Delhi" and "new delhi " share one entry
+and any city makes a valid memcached key. Show changes drop the affected
+listings; Movie, Theatre and Screen changes bump a generation number that is
+part of every key, which retires all listings at once (see shows.signals).
+Both happen once the saving transaction commits, so a listing built from
+the old rows meanwhile is not cached past the change.
+
+With LocMemCache SHOWTIMES_CACHE_TIMEOUT defaults to 0 and listings are
+built on every request: other workers would never see the invalidations.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Show
+
+GENERATION_KEY = 'showtimes:generation'
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def normalize_city(city):
+    return ' '.join(city.split()).lower()
+
+
+def _key(city, day):
+    digest = hashlib.md5(normalize_city(city).encode()).hexdigest()
+    return f'showtimes:{_generation()}:{digest}:{day}'
+
+
+def build_showtimes(city, day):
+    rows = (
+        Show.objects.filter(screen__theatre__city__lower=normalize_city(city), date=day)
+        .order_by('movie__title', 'movie_id', 'screen__theatre__name', 'screen__theatre_id', 'time')
+        .values_list(
+            'id', 'time', 'price', 'screen__name',
+            'movie_id', 'movie__title', 'movie__language', 'movie__genre',
+            'movie__duration_minutes', 'movie__rating', 'movie__poster_image',
+            'screen__theatre_id', 'screen__theatre__name', 'screen__theatre__address',
+        )
+    )
+    movies = []
+    for (show_id, time, price, screen_name, movie_id, title, language, genre,
+         duration, rating, poster, theatre_id, theatre_name, address) in rows:
+        if not movies or movies[-1]['id'] != movie_id:
+            movies.append({
+                'id': movie_id,
+                'title': title,
+                'language': language,
+                'genre': genre,
+                'duration_minutes': duration,
+                'rating': str(rating),
+                'poster_image': poster,
+                'theatres': [],
+            })
+        theatres = movies[-1]['theatres']
+        if not theatres or theatres[-1]['id'] != theatre_id:
+            theatres.append({'id': theatre_id, 'name': theatre_name, 'address': address, 'showtimes': []})
+        theatres[-1]['showtimes'].append({
+            'show': show_id,
+            'time': time.strftime('%H:%M'),
+            'screen': screen_name,
+            'price': str(price),
+        })
+    return {'city': city, 'date': str(day), 'movies': movies}
+
+
+def get_showtimes(city, day):
+    timeout = getattr(settings, 'SHOWTIMES_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return build_showtimes(city, day)
+    key = _key(city, day)
+    listing = cache.get(key)
+    if listing is None:
+        listing = build_showtimes(city, day)
+        cache.set(key, listing, timeout)
+    # Cached for the first spelling asked for, answered in this one
+    return {**listing, 'city': city}
+
+
+def invalidate(city, day):
+    transaction.on_commit(lambda: cache.delete(_key(city, day)))
+
+
+def invalidate_all():
+    transaction.on_commit(_bump_generation)
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shows', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='pricing_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
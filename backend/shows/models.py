@@ -8,6 +8,14 @@ class Show(models.Model):
     date = models.DateField()
     time = models.TimeField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    # Pricing key the seats were last repriced with, see seats.pricing
+    pricing_key = models.CharField(max_length=64, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'movie'], name='show_date_movie_idx'),
+            models.Index(fields=['screen', 'date', 'time'], name='show_screen_date_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.movie.title} at {self.screen.name} ({self.date} {self.time})"
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from bookmyshowcase import caching
+from movies.models import Movie
+from theatres.models import Screen, Theatre
+from . import listings
+from .models import Show
+
+
+def _listing(screen_id, day):
+    city = Screen.objects.filter(pk=screen_id).values_list('theatre__city', flat=True).first()
+    return (city, day) if city is not None else None
+
+
+@receiver(pre_save, sender=Show)
+def remember_previous_listing(sender, instance, raw=False, **kwargs):
+    instance._previous_listing = None
+    if instance.pk and not raw:
+        previous = Show.objects.filter(pk=instance.pk).values_list('screen_id', 'date').first()
+        if previous:
+            instance._previous_listing = _listing(*previous)
+
+
+@receiver(post_save, sender=Show)
+@receiver(post_delete, sender=Show)
+def invalidate_show_listings(sender, instance, **kwargs):
+    stale = {getattr(instance, '_previous_listing', None), _listing(instance.screen_id, instance.date)}
+    for listing in stale - {None}:
+        listings.invalidate(*listing)
+    caching.changed('shows', instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Theatre)
+@receiver(post_delete, sender=Theatre)
+def invalidate_all_listings(sender, **kwargs):
+    listings.invalidate_all()
+
+
+@receiver(post_save, sender=Screen)
+@receiver(post_delete, sender=Screen)
+def invalidate_screen_listings(sender, update_fields=None, **kwargs):
+    # Listings show the screen's name only, not its layout or capacity
+    if update_fields is None or {'name', 'theatre'} & set(update_fields):
+        listings.invalidate_all()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theatres', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='theatre',
+            name='city',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('theatres', '0003_screen_layout'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='theatre',
+            index=models.Index(django.db.models.functions.text.Lower('city'), name='theatre_city_lower_idx'),
+        ),
+    ]
@@ -1,19 +1,27 @@
 from django.db import models
+from django.db.models.functions import Lower
 from users.models import CustomUser
 
+# city__lower lookups, for case-insensitive city filters that use an index
+models.CharField.register_lookup(Lower)
+
 class Theatre(models.Model):
     name = models.CharField(max_length=255)
     address = models.TextField()
-    city = models.CharField(max_length=100)
+    city = models.CharField(max_length=100, db_index=True)
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='theatres')
 
+    class Meta:
+        indexes = [models.Index(Lower('city'), name='theatre_city_lower_idx')]
+
     def __str__(self):
         return f"{self.name} - {self.city}"
 
 class Screen(models.Model):
     name = models.CharField(max_length=50) # e.g., "Screen 1"
     theatre = models.ForeignKey(Theatre, on_delete=models.CASCADE, related_name='screens')
-    capacity = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=0) # Number of seats, kept by seats.layouts
+    layout = models.JSONField(null=True, blank=True) # Seat layout template, see seats.layouts
 
     def __str__(self):
         return f"{self.name} at {self.theatre.name}"
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bookmyshowcase import caching
+from .models import Theatre, Screen
+
+
+@receiver(post_save, sender=Theatre)
+@receiver(post_delete, sender=Theatre)
+def theatre_changed(sender, instance, **kwargs):
+    caching.changed('theatres', instance.pk)
+
+
+@receiver(post_save, sender=Screen)
+@receiver(post_delete, sender=Screen)
+def screen_changed(sender, instance, **kwargs):
+    # Theatres embed their screens
+    caching.changed('screens', instance.pk)
+    caching.changed('theatres', instance.theatre_id)
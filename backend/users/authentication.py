@@ -0,0 +1,119 @@
+"""
+JWT authentication without a user query per request.
+
+Tokens carry the user's role flags as claims (ROLE_CLAIMS), so that
+permission checks (users.permissions) read the token instead of the user
+row. The user itself is resolved through Django's cache, keyed by id, for
+AUTH_USER_CACHE_TIMEOUT seconds. Saving or deleting a user drops the entry
+(users.signals).
+
+If a token's role claims no longer match the user, the token is rejected.
+Refreshing it (TokenRefreshView with RoleTokenRefreshSerializer) re-stamps
+the current roles. Tokens issued without role claims are accepted, and
+permissions then fall back to the user's fields.
+
+The whole row is cached except the password hash, which loads on first
+access (only password checks and changes read it). The invalidation only
+reaches the processes sharing the cache, so with the per-process
+LocMemCache AUTH_USER_CACHE_TIMEOUT defaults to 0 and the user is read on
+every request (one query by primary key).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+ROLE_CLAIMS = ('is_customer', 'is_theatre_owner', 'is_staff', 'is_superuser')
+# Never cached or loaded up front
+UNCACHED_FIELDS = ('password',)
+
+
+def _key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def cached_fields(User):
+    """The attnames of ``User``'s row kept in the cache, in field order."""
+    return [field.attname for field in User._meta.concrete_fields if field.attname not in UNCACHED_FIELDS]
+
+
+def get_cached_user(user_id):
+    """
+    The active-or-not user with ``user_id``, or None if there is none. Only
+    UNCACHED_FIELDS are deferred.
+    """
+    User = get_user_model()
+    names = cached_fields(User)
+    timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 0)
+    values = cache.get(_key(user_id)) if timeout else None
+    # A cached row from before a migration no longer fits the model
+    if values is None or len(values) != len(names):
+        values = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*names).first()
+        if values is None:
+            return None
+        if timeout:
+            cache.set(_key(user_id), values, timeout)
+    return User.from_db(router.db_for_read(User), names, values)
+
+
+def forget_user(user_id):
+    cache.delete(_key(user_id))
+
+
+def add_role_claims(token, user):
+    for claim in ROLE_CLAIMS:
+        token[claim] = bool(getattr(user, claim, False))
+
+
+def roles_match(token, user):
+    return all(
+        claim not in token.payload or token[claim] == bool(getattr(user, claim, False))
+        for claim in ROLE_CLAIMS
+    )
+
+
+class RoleRefreshToken(RefreshToken):
+    """A refresh token (and, through it, access tokens) carrying role claims."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        add_role_claims(token, user)
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        if not roles_match(validated_token, user):
+            raise AuthenticationFailed("User roles changed, refresh the token", code='roles_changed')
+        return user
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Issue the new access token with the user's current roles."""
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = get_cached_user(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        access = refresh.access_token
+        add_role_claims(access, user)
+        return {'access': str(access)}
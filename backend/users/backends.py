@@ -1,19 +1,25 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 
 class EmailBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            # Try to find user by either username or email
-            user = UserModel.objects.get(Q(username=username) | Q(email=username))
-        except UserModel.DoesNotExist:
+        if username is None or password is None:
             return None
-        except UserModel.MultipleObjectsReturned:
-            # Return the first user if multiple found (unlikely but safe)
-            user = UserModel.objects.filter(Q(username=username) | Q(email=username)).first()
+        # One indexed lookup: an address goes to the email index, anything
+        # else to the unique username index. Usernames may contain "@" too,
+        # so an address that matches no email is still tried as a username.
+        if '@' in username:
+            user = UserModel.objects.filter(email=username).order_by('id').first()
+            if user is None:
+                user = UserModel.objects.filter(username=username).first()
+        else:
+            user = UserModel.objects.filter(username=username).first()
 
-        if user.check_password(password):
+        if user is None:
+            # Run the hasher anyway, so response time does not reveal unknown users
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users import otp
+
+
+class Command(BaseCommand):
+    help = "Delete password reset OTPs older than OTP_TTL_SECONDS. Run it from cron."
+
+    def handle(self, *args, **options):
+        purged = otp.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired OTPs"))
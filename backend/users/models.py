@@ -6,6 +6,11 @@ class CustomUser(AbstractUser):
     is_customer = models.BooleanField(default=True)
     is_theatre_owner = models.BooleanField(default=False)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['email'], name='user_email_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -14,5 +19,24 @@ class OTP(models.Model):
     otp_code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'otp_code', 'created_at'], name='otp_lookup_idx'),
+            models.Index(fields=['created_at'], name='otp_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.otp_code}"
+
+
+class ThrottleBucket(models.Model):
+    """A token bucket of a security-relevant throttle scope, see bookmyshowcase.throttling"""
+    # sha256 of the scope and the bucket's key (an IP, login name or email)
+    key = models.CharField(max_length=64, unique=True)
+    tokens = models.FloatField()
+    stamp = models.FloatField() # time.time() of the last refill
+    # When the bucket is full again and the row can go
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Throttle bucket {self.key[:12]}: {self.tokens:.1f}"
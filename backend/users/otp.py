@@ -0,0 +1,49 @@
+"""
+One-time password reset codes.
+
+A user has at most one live OTP: issuing a new one deletes the old ones,
+and a successful verification consumes it. Codes expire OTP_TTL_SECONDS
+after they are created. Verification is a single lookup on the
+(user, otp_code, created_at) index. purge_expired() (manage.py
+purge_expired_otps) deletes codes that were never used.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OTP
+
+
+def cutoff(now=None):
+    """Codes created before this moment have expired."""
+    return (now or timezone.now()) - timedelta(seconds=getattr(settings, 'OTP_TTL_SECONDS', 600))
+
+
+@transaction.atomic
+def issue(user):
+    OTP.objects.filter(user=user).delete()
+    return OTP.objects.create(user=user, otp_code=f'{secrets.randbelow(1_000_000):06d}')
+
+
+def verify(user, code):
+    """Consume ``user``'s OTP if ``code`` matches an unexpired one."""
+    if not code:
+        return False
+    deleted, _ = OTP.objects.filter(user=user, otp_code=code, created_at__gte=cutoff()).delete()
+    if deleted:
+        OTP.objects.filter(user=user).delete()
+    return bool(deleted)
+
+
+def purge_expired(now=None, batch_size=5000):
+    """Delete expired codes in batches; returns how many were deleted."""
+    before = cutoff(now)
+    purged = 0
+    while True:
+        ids = list(OTP.objects.filter(created_at__lt=before).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        purged += OTP.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,38 @@
+from rest_framework.permissions import BasePermission
+
+
+def has_role(request, claim):
+    """Role flag from the request's token claims, else from the user."""
+    token = request.auth
+    payload = getattr(token, 'payload', None)
+    if payload is not None and claim in payload:
+        return bool(payload[claim])
+    return bool(getattr(request.user, claim, False))
+
+
+def is_admin(request):
+    return has_role(request, 'is_staff') or has_role(request, 'is_superuser')
+
+
+class IsTheatreOwner(BasePermission):
+    message = 'Only theatre owners can access this'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and has_role(request, 'is_theatre_owner'))
+
+
+class IsAdmin(BasePermission):
+    message = 'Only admins can access this'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and is_admin(request))
+
+
+class IsTheatreOwnerOrAdmin(BasePermission):
+    message = 'Only theatre owners and admins can do this'
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and (has_role(request, 'is_theatre_owner') or is_admin(request))
+        )
@@ -1,25 +1,29 @@
 from rest_framework import viewsets, status, views
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from .models import CustomUser, OTP
+from .models import CustomUser
 from .serializers import UserSerializer, RegisterSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import RoleRefreshToken
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-import random
+from bookmyshowcase.throttling import AuthRateThrottle, LoginRateThrottle, OTPRateThrottle, OTPVerifyRateThrottle
+from . import otp
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
+    ordering_fields = ['id', 'username', 'date_joined']
+    ordering = ['-id']
 
 class RegisterView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = RoleRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -29,6 +33,7 @@ class RegisterView(views.APIView):
 
 class GoogleLoginView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
     def post(self, request):
         # MOCK Google Login: Accepts any email and logs them in
@@ -48,7 +53,7 @@ class GoogleLoginView(views.APIView):
             user.set_unusable_password()
             user.save()
             
-        refresh = RefreshToken.for_user(user)
+        refresh = RoleRefreshToken.for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -57,13 +62,13 @@ class GoogleLoginView(views.APIView):
 
 class ForgotPasswordView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle, OTPRateThrottle]
 
     def post(self, request):
         email = request.data.get('email')
         try:
             user = CustomUser.objects.get(email=email)
-            otp_code = str(random.randint(100000, 999999))
-            OTP.objects.create(user=user, otp_code=otp_code)
+            otp_code = otp.issue(user).otp_code
             # In real app: send_mail('Subject', f'OTP: {otp_code}', ...)
             print(f"OTP for {email}: {otp_code}") 
             return Response({'message': 'OTP sent to email (check console)'})
@@ -72,14 +77,14 @@ class ForgotPasswordView(views.APIView):
 
 class VerifyOTPView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle, OTPVerifyRateThrottle]
 
     def post(self, request):
         email = request.data.get('email')
         otp_code = request.data.get('otp')
         try:
             user = CustomUser.objects.get(email=email)
-            otp_record = OTP.objects.filter(user=user, otp_code=otp_code).last()
-            if otp_record:
+            if otp.verify(user, otp_code):
                 # OTP Verified
                 return Response({'message': 'OTP Verified', 'reset_token': 'allow_reset'})
             return Response({'error': 'Invalid OTP'}, status=status.HTTP_400_BAD_REQUEST)
@@ -88,6 +93,7 @@ class VerifyOTPView(views.APIView):
 
 class ResetPasswordView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
     def post(self, request):
         email = request.data.get('email')
@@ -107,6 +113,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     Extend default JWT login response to include basic user payload
     (frontend expects: access, refresh, user).
     """
+    token_class = RoleRefreshToken
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -116,3 +123,4 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [AuthRateThrottle, LoginRateThrottle]